@@ -1,9 +1,13 @@
 import multiprocessing
+import os
+import sys
 
 bind = "0.0.0.0:80"
 workers = multiprocessing.cpu_count() * 2 + 1
 worker_class = "gevent"
 threads = 2 * multiprocessing.cpu_count()
+# Greenlets per gevent worker; also caps the worker's DB connection pool.
+worker_connections = 100
 timeout = 600
 accesslog = "logs/access.log"
 errorlog = "logs/error.log"
@@ -23,6 +27,18 @@ if worker_class == "gevent":
     import gevent.monkey
     gevent.monkey.patch_all()
 
+    #
+    # Give each worker its share of the DB server's connections (see
+    # searcch_backend.api.common.green); set SEARCCH_DB_POOL_SIZE to
+    # override.
+    #
+    from searcch_backend.api.common.green import (
+        POOL_SIZE_ENV, pool_size, jobs_connections_from_env)
+    os.environ.setdefault(POOL_SIZE_ENV, str(pool_size(
+        workers, worker_connections,
+        int(os.getenv("SEARCCH_DB_MAX_CONNECTIONS", "100")),
+        jobs=jobs_connections_from_env())))
+
 #
 # NB: early exceptions from the app may be lost when workers fail immediately.
 # Set preload_app = True if workers fail with no apparent cause; then you'll
@@ -31,24 +47,56 @@ if worker_class == "gevent":
 
 #preload_app = True
 
-global sbt
+#
+# Background jobs run in their own process (searcch-jobs); the arbiter only
+# migrates the DB.
+#
 def on_starting(server):
-    global sbt
-
-    from searcch_backend.api.app import (app, config, db, mail, migrate)
+    from searcch_backend.api.app import (app, db, migrate)
     from searcch_backend.api.common.alembic import maybe_auto_upgrade_db
-    from searcch_backend.api.common.scheduled_tasks import SearcchBackgroundTasks
 
     # Run DB migrations
     maybe_auto_upgrade_db(app, db, migrate)
+    # Do not hand the migration connections down to the workers.
+    db.engine.dispose()
+
+def post_fork(server, worker):
+    #
+    # Make DB I/O yield to the gevent hub, and drop any (blocking)
+    # connections inherited across the fork.
+    #
+    from searcch_backend.api.app import db
+    if worker_class == "gevent":
+        from searcch_backend.api.common.green import patch_psycopg
+        patch_psycopg()
+    db.engine.dispose()
 
-    # Run Scheduler
-    sbt = SearcchBackgroundTasks(config, app, db, mail)
+#
+# Refuse to serve if DB calls would still block the gevent hub: exiting with
+# WORKER_BOOT_ERROR makes the arbiter shut down rather than respawn.  Then
+# start the worker's long-lived threads.
+#
+def post_worker_init(worker):
+    if worker_class == "gevent":
+        from gunicorn.arbiter import Arbiter
+        from searcch_backend.api.app import app, db
+        from searcch_backend.api.common.green import check_cooperative_db
+        try:
+            with app.app_context():
+                check_cooperative_db(db)
+        except:
+            worker.log.critical("cooperative DB self-check failed: %s", sys.exc_info()[1])
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
+
+    # Start this worker's import scheduler, so that pending imports are
+    # picked up without waiting for a new submission.
+    from searcch_backend.api.common.importer import import_scheduler
+    import_scheduler.maybe_start()
 
 #
-# Brutal hack.  We only want to run the background tasks in the arbiter, but to
-# do that, the only hook we have is on_starting.  Therefore, we must stop the
-# scheduler in the workers after they fork.
+# Drain the per-worker analytics write-behind buffer before the worker goes
+# away.
 #
-def post_fork(server, worker):
-    sbt.stopScheduledTask()
+def worker_exit(server, worker):
+    from searcch_backend.api.common.stats import analytics_buffer
+    analytics_buffer.flush()
@@ -4,6 +4,8 @@ import os
 import logging
 
 from searcch_backend.config import app_config
+from searcch_backend.api.common.green import pool_options_from_env
+from searcch_backend.api.common.upload import SearcchRequest
 import flask
 from flask import Flask
 from flask_restful import Api
@@ -15,11 +17,20 @@ from flask_mail import Mail
 # set up configurations
 print("Setting up app in backend")
 app = Flask(__name__, instance_relative_config=True)
+app.request_class = SearcchRequest
 config_name = os.getenv("FLASK_ENV", "development")
 app.config.from_object(app_config[config_name])
 if os.getenv('FLASK_INSTANCE_CONFIG_FILE'):
     app.config.from_pyfile(os.getenv('FLASK_INSTANCE_CONFIG_FILE'))
 
+#
+# Under gunicorn's gevent worker, gunicorn_conf.py sizes the per-worker
+# connection pool (see searcch_backend.api.common.green).
+#
+pool_options = pool_options_from_env()
+if pool_options:
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", pool_options)
+
 print("Before migration")
 config = app.config
 db = SQLAlchemy(app)
@@ -59,7 +70,7 @@ from searcch_backend.api.resources.artifact import (
     ArtifactAPI, ArtifactIndexAPI,
     ArtifactRelationshipResourceRoot, ArtifactRelationshipResource, ArtifactOwnerRequestAPI, ArtifactOwnerRequestsAPI)
 from searcch_backend.api.resources.artifact_compare import ArtifactCompareAPI
-from searcch_backend.api.resources.artifact_search import ArtifactSearchIndexAPI, ArtifactRecommendationAPI
+from searcch_backend.api.resources.artifact_search import ArtifactSearchIndexAPI, ArtifactRecommendationAPI, ArtifactTrendingAPI
 from searcch_backend.api.resources.candidate_artifact import CandidateArtifactResource
 from searcch_backend.api.resources.organization import OrganizationAPI, OrganizationListAPI
 from searcch_backend.api.resources.login import LoginAPI
@@ -74,16 +85,18 @@ from searcch_backend.api.resources.user import (
 from searcch_backend.api.resources.dashboard import UserDashboardAPI, ArtifactStatsAPI
 from searcch_backend.api.resources.interests import InterestsListAPI
 from searcch_backend.api.resources.artifact_import import (
-    ArtifactImportResourceRoot, ArtifactImportResource)
+    ArtifactImportResourceRoot, ArtifactImportResource, ArtifactImportBulkResource,
+    ArtifactImportFilesResource, ArtifactImportFileResource)
+from searcch_backend.api.resources.file_content import FileContentResource
 from searcch_backend.api.resources.importer import (
-    ImporterResourceRoot, ImporterResource)
+    ImporterResourceRoot, ImporterResource, ImporterHealthResource)
 from searcch_backend.api.resources.schema import (
     SchemaArtifactAPI, SchemaAffiliationAPI)
 from searcch_backend.api.resources.recurring_venue import RecurringVenueResourceRoot, RecurringVenueResource
 from searcch_backend.api.resources.venue import VenueResourceRoot, VenueResource
 from searcch_backend.api.resources.badge import BadgeResourceRoot, BadgeResource
 from searcch_backend.api.resources.license import LicenseResourceRoot, LicenseResource
-from searcch_backend.api.resources.admin import AdminUpdatePrivileges
+from searcch_backend.api.resources.admin import AdminUpdatePrivileges, AdminJobsAPI
 
 approot = app.config['APPLICATION_ROOT']
 
@@ -96,6 +109,7 @@ api.add_resource(ArtifactIndexAPI, approot + '/artifacts', endpoint='api.artifac
 api.add_resource(ArtifactAPI, approot + '/artifact/<int:artifact_group_id>', approot + '/artifact/<int:artifact_group_id>/<int:artifact_id>', endpoint='api.artifact')
 api.add_resource(ArtifactCompareAPI, approot + '/artifact/compare/<int:artifact_group_id>/<int:artifact_id>', endpoint='api.artifact_compare')
 api.add_resource(ArtifactSearchIndexAPI, approot + '/artifact/search', endpoint='api.artifact_search')
+api.add_resource(ArtifactTrendingAPI, approot + '/artifact/trending', endpoint='api.artifact_trending')
 api.add_resource(ArtifactRelationshipResourceRoot, approot + '/artifact/relationships', endpoint='api.artifact_relationships')
 api.add_resource(ArtifactRelationshipResource, approot + '/artifact/relationship/<int:artifact_relationship_id>', endpoint='api.artifact_relationship')
 api.add_resource(ArtifactRecommendationAPI, approot + '/artifact/recommendation/<int:artifact_group_id>/<int:artifact_id>', endpoint='api.artifact_recommender')
@@ -132,10 +146,15 @@ api.add_resource(UserDashboardAPI, approot + '/dashboard', endpoint='api.dashboa
 api.add_resource(ArtifactStatsAPI, approot + '/dashboard/artifact/stats', endpoint='api.dashboard_artifact_stats')
 
 api.add_resource(ArtifactImportResourceRoot, approot + '/artifact/imports', endpoint='api.artifact_imports')
+api.add_resource(ArtifactImportBulkResource, approot + '/artifact/imports/bulk', endpoint='api.artifact_imports_bulk')
 api.add_resource(ArtifactImportResource, approot + '/artifact/import/<int:artifact_import_id>', endpoint='api.artifact_import')
+api.add_resource(ArtifactImportFilesResource, approot + '/artifact/import/<int:artifact_import_id>/files', endpoint='api.artifact_import_files')
+api.add_resource(ArtifactImportFileResource, approot + '/artifact/import/<int:artifact_import_id>/file/<string:file_hash>', endpoint='api.artifact_import_file')
+api.add_resource(FileContentResource, approot + '/file/<string:file_hash>', endpoint='api.file_content')
 
 api.add_resource(ImporterResourceRoot, approot + '/importers', endpoint='api.importers')
 api.add_resource(ImporterResource, approot + '/importer/<int:importer_instance_id>', endpoint='api.importer')
+api.add_resource(ImporterHealthResource, approot + '/importer/<int:importer_instance_id>/health', endpoint='api.importer_health')
 
 api.add_resource(SchemaArtifactAPI, approot + "/schema/artifact", endpoint='api.schema_artifact')
 api.add_resource(SchemaAffiliationAPI, approot + "/schema/affiliation", endpoint='api.schema_affiliation')
@@ -153,3 +172,4 @@ api.add_resource(LicenseResourceRoot, approot + '/licenses', endpoint='api.licen
 api.add_resource(LicenseResource, approot + '/license/<int:org_id>', endpoint='api.license')
 
 api.add_resource(AdminUpdatePrivileges, approot + '/admin/user/<int:user_id>', endpoint='api.admin')
+api.add_resource(AdminJobsAPI, approot + '/admin/jobs', endpoint='api.admin_jobs')
@@ -1,8 +1,55 @@
 from searcch_backend.api.app import app
 from searcch_backend.api.app import db
-from searcch_backend.models.model import Sessions
+from searcch_backend.api.common.cache import TTLCache
+from searcch_backend.models.model import Sessions, User
 from datetime import datetime
 from flask import abort
+import hashlib
+
+
+class CachedSession(object):
+    """
+    A read-only snapshot of a validated Sessions row (and its user's
+    can_admin bit), as returned by verify_token.  It is not bound to any
+    SQLAlchemy session; @user loads the User in the current one.
+    """
+
+    def __init__(self, login_session):
+        self.id = login_session.id
+        self.user_id = login_session.user_id
+        self.sso_token = login_session.sso_token
+        self.expires_on = login_session.expires_on
+        self.is_admin = login_session.is_admin
+        self.can_admin = login_session.user.can_admin
+
+    @property
+    def user(self):
+        return db.session.query(User).get(self.user_id)
+
+    def __repr__(self):
+        return "<CachedSession(id=%r, user_id=%r, user_can_admin=%r, sso_token=%r, is_admin=%r)>" \
+            % (self.id, self.user_id, self.can_admin, self.sso_token, self.is_admin)
+
+
+#
+# Per-worker cache of validated sessions, keyed by token hash, so that
+# verify_token does not hit the sessions table on every request.  Entries
+# live for at most SESSION_CACHE_TTL seconds, and never past the session's
+# expiry.  Changes made through this worker invalidate its entries; other
+# workers may see them up to SESSION_CACHE_TTL seconds late.
+#
+session_cache = TTLCache(
+    max_entries=app.config.get("SESSION_CACHE_MAX_ENTRIES", 4096),
+    ttl=app.config.get("SESSION_CACHE_TTL", 30))
+
+def _token_key(sso_token):
+    return hashlib.sha256(sso_token.encode("utf-8")).hexdigest()
+
+def invalidate_token(sso_token):
+    session_cache.delete(_token_key(sso_token))
+
+def invalidate_user_sessions(user_id):
+    session_cache.delete_if(lambda s: s.user_id == user_id)
 
 
 def has_api_key(request):
@@ -47,7 +94,16 @@ def verify_token(request):
     sso_token = request.headers.get('Authorization', None)
     if not sso_token:
         abort(403, description="missing SSO token from auth provider")
+    key = _token_key(sso_token)
+    cached = session_cache.get(key)
+    if cached and cached.expires_on >= datetime.now():
+        return cached
     login_session = lookup_token(sso_token)
     if not login_session:
         abort(401, description="invalid session token")
-    return login_session
+    cached = CachedSession(login_session)
+    ttl = min(session_cache.ttl,
+              (cached.expires_on - datetime.now()).total_seconds())
+    if ttl > 0:
+        session_cache.set(key, cached, ttl=ttl)
+    return cached
@@ -0,0 +1,242 @@
+# logic for in-process and shared result caches
+
+from searcch_backend.api.app import config
+from searcch_backend.models.model import (
+    ArtifactPublication, ArtifactRatings, ArtifactReviews)
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+import collections
+import hashlib
+import json
+import logging
+import sys
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+
+class TTLCache(object):
+    """
+    A thread-safe, size-bounded LRU cache whose entries expire after a TTL.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            (expires, value) = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_if(self, predicate):
+        """Deletes all entries whose value satisfies @predicate."""
+        with self._lock:
+            for key in [k for (k, (_, v)) in self._entries.items() if predicate(v)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class LocalCacheBackend(object):
+    """
+    A per-process cache backend.  Invalidation only reaches the current
+    process; other workers serve their entries until the TTL expires.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.cache = TTLCache(max_entries=max_entries, ttl=ttl)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, ttl):
+        self.cache.set(key, value, ttl=ttl)
+
+    def generation(self):
+        return 0
+
+    def invalidate(self):
+        self.cache.clear()
+
+
+class RedisCacheBackend(object):
+    """
+    A cache backend shared by all workers, stored in Redis.  Eviction is
+    left to the server's maxmemory policy; invalidation bumps a generation
+    counter that is part of every key, so stale entries are never read
+    again and simply age out.
+    """
+
+    def __init__(self, url, prefix="searcch:cache:"):
+        # Optional dependency; only needed if this backend is configured.
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        return value.decode("utf-8")
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def generation(self):
+        return int(self.client.get(self.prefix + "generation") or 0)
+
+    def invalidate(self):
+        self.client.incr(self.prefix + "generation")
+
+
+class SearchResultCache(object):
+    """
+    Caches search_artifacts() results, keyed on the normalized search
+    parameters.  Values are stored as JSON so that callers never share
+    (and cannot mutate) a cached result.  Backend errors are logged and
+    treated as misses.
+    """
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def _norm_str(s):
+        if not s:
+            return None
+        s = " ".join(s.lower().split())
+        return s or None
+
+    @staticmethod
+    def _norm_list(l):
+        if not l:
+            return None
+        if isinstance(l, str):
+            l = [l]
+        vals = set()
+        for v in l:
+            if isinstance(v, str):
+                v = SearchResultCache._norm_str(v)
+            if v is not None:
+                vals.add(v)
+        if not vals:
+            return None
+        return sorted(vals)
+
+    def make_key(self, keywords, artifact_types, author_keywords, organization,
+                 owner_keywords, badge_id_list, venue_id_list, venue_keywords,
+                 page_num, items_per_page, sort_by, sort_order, cursor, total):
+        """
+        Returns the cache key for a search, or None if the backend is
+        unavailable, in which case the search should bypass the cache.
+        """
+        params = [
+            self._norm_str(keywords), self._norm_list(artifact_types),
+            self._norm_list(author_keywords), self._norm_list(organization),
+            self._norm_list(owner_keywords), self._norm_list(badge_id_list),
+            self._norm_list(venue_id_list), self._norm_str(venue_keywords),
+            sort_by, sort_order, page_num, items_per_page, cursor, total ]
+        digest = hashlib.sha256(
+            json.dumps(params, separators=(",", ":")).encode("utf-8")).hexdigest()
+        try:
+            generation = self.backend.generation()
+        except:
+            LOG.exception(sys.exc_info()[1])
+            return None
+        return "search:%d:%s" % (generation, digest)
+
+    def get(self, key):
+        try:
+            value = self.backend.get(key)
+        except:
+            LOG.exception(sys.exc_info()[1])
+            return None
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def set(self, key, result):
+        try:
+            self.backend.set(key, json.dumps(result), self.ttl)
+        except:
+            LOG.exception(sys.exc_info()[1])
+
+    def invalidate(self):
+        try:
+            self.backend.invalidate()
+        except:
+            LOG.exception(sys.exc_info()[1])
+
+
+def make_search_cache(config):
+    backend_name = config.get("SEARCH_CACHE_BACKEND")
+    ttl = config.get("SEARCH_CACHE_TTL", 120)
+    if not backend_name:
+        return None
+    elif backend_name == "local":
+        backend = LocalCacheBackend(
+            config.get("SEARCH_CACHE_MAX_ENTRIES", 1024), ttl)
+    elif backend_name == "redis":
+        backend = RedisCacheBackend(config["SEARCH_CACHE_REDIS_URL"])
+    else:
+        raise Exception("unknown SEARCH_CACHE_BACKEND '%s'" % (backend_name,))
+    return SearchResultCache(backend, ttl)
+
+search_cache = make_search_cache(config)
+
+
+#
+# Invalidate cached search results once a transaction that published or
+# unpublished an artifact, or changed a rating or review, has committed.
+# Flushes only mark the session; a rollback discards the mark.
+#
+SEARCH_CACHE_DIRTY_KEY = "search_cache_dirty"
+
+@event.listens_for(Session, "after_flush")
+def search_cache_after_flush(session, flush_context):
+    if search_cache is None or session.info.get(SEARCH_CACHE_DIRTY_KEY):
+        return
+    for obj in session.new.union(session.deleted):
+        if isinstance(obj, (ArtifactPublication, ArtifactRatings, ArtifactReviews)):
+            session.info[SEARCH_CACHE_DIRTY_KEY] = True
+            return
+    for obj in session.dirty:
+        if isinstance(obj, (ArtifactRatings, ArtifactReviews)):
+            session.info[SEARCH_CACHE_DIRTY_KEY] = True
+            return
+
+@event.listens_for(Session, "after_commit")
+def search_cache_after_commit(session):
+    if session.info.pop(SEARCH_CACHE_DIRTY_KEY, False):
+        search_cache.invalidate()
+
+@event.listens_for(Session, "after_rollback")
+def search_cache_after_rollback(session):
+    session.info.pop(SEARCH_CACHE_DIRTY_KEY, None)
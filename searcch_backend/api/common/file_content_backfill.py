@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+#
+# Opt-in backfill of file content stored before the content column was set
+# to STORAGE EXTERNAL (migration 239726789a94), which applies only to new
+# writes.  Rewrites each compressed value, so that streaming ranges of it
+# reads only the chunks it needs.  Run by hand, e.g. in a quiet period,
+# with the app's configured database:
+#
+#   FLASK_INSTANCE_CONFIG_FILE=config.py \
+#     python3 -m searcch_backend.api.common.file_content_backfill --batch 100
+#
+# Walks file_content by id, --batch rows per transaction (so that locks
+# are short, and an interrupted run loses at most one batch), sleeping
+# --pause seconds between batches; re-running it skips what was done.
+#
+
+import argparse
+import time
+
+
+def backfill(db, batch, pause, start_id=0):
+    """
+    Rewrites compressed content in batches of @batch rows (by id, from
+    @start_id); returns (rows scanned, rows rewritten).
+    """
+    from sqlalchemy.sql import text
+
+    (scanned, rewritten) = (0, 0)
+    last_id = start_id
+    while True:
+        with db.engine.begin() as connection:
+            ids = [ row[0] for row in connection.execute(text(
+                "SELECT id FROM file_content WHERE id > :last_id"
+                " ORDER BY id LIMIT :batch"),
+                last_id=last_id, batch=batch) ]
+            if not ids:
+                break
+            res = connection.execute(text(
+                "UPDATE file_content SET content = substr(content, 1)"
+                " WHERE id = ANY(:ids)"
+                "   AND pg_column_size(content) < octet_length(content)"),
+                ids=ids)
+        scanned += len(ids)
+        rewritten += res.rowcount
+        last_id = ids[-1]
+        print("through id %d: scanned %d, rewrote %d" % (
+            last_id, scanned, rewritten), flush=True)
+        if pause:
+            time.sleep(pause)
+    return (scanned, rewritten)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rewrite compressed file content to external storage.")
+    parser.add_argument("--batch", type=int, default=100,
+                        help="rows per transaction")
+    parser.add_argument("--pause", type=float, default=0.5,
+                        help="seconds to sleep between batches")
+    parser.add_argument("--start-id", type=int, default=0,
+                        help="resume after this file_content id")
+    args = parser.parse_args()
+
+    # Import the app before anything from models, to avoid the circular
+    # import through searcch_backend.models.model.
+    from searcch_backend.api.app import app, db
+
+    with app.app_context():
+        (scanned, rewritten) = backfill(
+            db, args.batch, args.pause, start_id=args.start_id)
+    print("done: scanned %d, rewrote %d" % (scanned, rewritten))
+
+
+if __name__ == "__main__":
+    main()
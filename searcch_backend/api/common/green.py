@@ -0,0 +1,113 @@
+# logic for cooperative (gevent) database I/O under gunicorn
+
+import logging
+import os
+import time
+
+LOG = logging.getLogger(__name__)
+
+#
+# gunicorn_conf.py exports the pool size it derived from its worker and
+# greenlet counts in these variables; app.py turns them into
+# SQLALCHEMY_ENGINE_OPTIONS.  An explicit SQLALCHEMY_ENGINE_OPTIONS in the
+# instance config wins.
+#
+POOL_SIZE_ENV = "SEARCCH_DB_POOL_SIZE"
+POOL_TIMEOUT_ENV = "SEARCCH_DB_POOL_TIMEOUT"
+
+#
+# Connections used outside the web workers' pools: by all searcch-jobs
+# processes together (by default, one process with SQLAlchemy's default
+# pool of 5 plus 10 overflow), overridden by SEARCCH_DB_JOBS_CONNECTIONS.
+#
+JOBS_CONNECTIONS_ENV = "SEARCCH_DB_JOBS_CONNECTIONS"
+DEFAULT_JOBS_CONNECTIONS = 15
+
+#
+# Pooled connections each web worker holds permanently: its
+# ImportScheduler's LISTEN connection.
+#
+WORKER_LISTENERS = 1
+
+
+def pool_size(workers, worker_connections, max_connections, reserved=10,
+              jobs=DEFAULT_JOBS_CONNECTIONS, listeners=WORKER_LISTENERS):
+    """
+    Returns the per-worker connection pool size: each worker's share of
+    the server's @max_connections, less @reserved for the arbiter,
+    migrations, and psql, and less @jobs for the searcch-jobs processes.
+    It is never more than the worker's greenlets plus its @listeners
+    (connections held by LISTEN threads), nor fewer than @listeners + 1,
+    so that requests always have a connection.
+    """
+    share = (max_connections - reserved - jobs) // max(workers, 1)
+    return max(listeners + 1, min(worker_connections + listeners, share))
+
+
+def jobs_connections_from_env():
+    return int(os.getenv(JOBS_CONNECTIONS_ENV, str(DEFAULT_JOBS_CONNECTIONS)))
+
+
+def pool_options_from_env():
+    """
+    Returns the engine options exported by gunicorn_conf.py, if any.
+    Greenlets beyond the pool size wait (cooperatively) for a connection,
+    rather than overflowing past the server's connection limit.
+    """
+    if not os.getenv(POOL_SIZE_ENV):
+        return {}
+    return dict(
+        pool_size=int(os.getenv(POOL_SIZE_ENV)),
+        max_overflow=0,
+        pool_timeout=int(os.getenv(POOL_TIMEOUT_ENV, "30")),
+        pool_pre_ping=True)
+
+
+def patch_psycopg():
+    """
+    Installs psycogreen's gevent wait callback, so that libpq waits for the
+    server by yielding to the gevent hub instead of blocking the worker.
+    Our engine uses psycopg2cffi; psycogreen imports psycopg2, so register
+    psycopg2cffi under that name first.  Connections opened before this
+    call remain blocking; dispose of any pooled ones afterwards.
+    """
+    from psycopg2cffi import compat
+    compat.register()
+    import psycogreen.gevent
+    psycogreen.gevent.patch_psycopg()
+
+
+def check_cooperative_db(db, duration=0.2):
+    """
+    Runs a pg_sleep of @duration seconds while another greenlet ticks, and
+    raises RuntimeError if the ticker was starved, i.e. if DB calls block
+    the hub.  Must be called in a gevent worker with an app context.
+    """
+    import gevent
+    import psycopg2.extensions
+
+    if psycopg2.extensions.get_wait_callback() is None:
+        raise RuntimeError("no psycopg wait callback installed")
+
+    ticks = []
+    def ticker():
+        while True:
+            ticks.append(time.monotonic())
+            gevent.sleep(duration / 10)
+
+    g = gevent.spawn(ticker)
+    try:
+        gevent.sleep(0)
+        start = time.monotonic()
+        with db.engine.connect() as connection:
+            connection.execute("SELECT pg_sleep(%f)" % (duration,))
+        end = time.monotonic()
+    finally:
+        g.kill()
+    during = [t for t in ticks if start < t < end]
+    if len(during) < 2:
+        raise RuntimeError(
+            "database calls block the gevent hub (%d ticks in %.3fs query)"
+            % (len(during), end - start))
+    LOG.info("cooperative DB check passed (%d ticks in %.3fs query)",
+             len(during), end - start)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+#
+# Benchmark of concurrent DB-bound throughput in one gevent process, before
+# and after installing the cooperative wait callback (see green.py).  Needs
+# gevent, psycogreen, and the app's configured database:
+#
+#   FLASK_INSTANCE_CONFIG_FILE=config.py \
+#     python3 -m searcch_backend.api.common.green_bench --greenlets 50
+#
+# Each of --greenlets greenlets runs --queries queries of pg_sleep(--sleep)
+# on its own pooled connection, first with blocking libpq calls (as before
+# the change: one query at a time per worker), then with the wait callback
+# (queries overlap).  Exits nonzero if the cooperative run is not at least
+# --min-speedup times as fast.
+#
+
+import gevent.monkey
+gevent.monkey.patch_all()
+
+import argparse
+import sys
+import time
+
+
+def run(db, greenlets, queries, sleep):
+    """
+    Returns (elapsed seconds, queries per second) for @greenlets greenlets
+    each running @queries pg_sleep(@sleep) queries.
+    """
+    import gevent
+
+    def worker():
+        for i in range(queries):
+            with db.engine.connect() as connection:
+                connection.execute("SELECT pg_sleep(%f)" % (sleep,))
+
+    db.engine.dispose()
+    start = time.perf_counter()
+    gevent.joinall([gevent.spawn(worker) for i in range(greenlets)],
+                   raise_error=True)
+    elapsed = time.perf_counter() - start
+    return (elapsed, greenlets * queries / elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark blocking vs cooperative DB I/O under gevent.")
+    parser.add_argument("--greenlets", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=4)
+    parser.add_argument("--sleep", type=float, default=0.05,
+                        help="seconds each query sleeps in the server")
+    parser.add_argument("--min-speedup", type=float, default=2.0,
+                        help="fail if cooperative throughput is not at least"
+                             " this many times blocking throughput")
+    args = parser.parse_args()
+
+    # Import the app before anything from models, to avoid the circular
+    # import through searcch_backend.models.model.
+    from searcch_backend.api.app import app, db
+    from searcch_backend.api.common.green import patch_psycopg
+
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = dict(
+        pool_size=args.greenlets, max_overflow=0)
+    with app.app_context():
+        (blocking, blocking_qps) = run(
+            db, args.greenlets, args.queries, args.sleep)
+        patch_psycopg()
+        (cooperative, cooperative_qps) = run(
+            db, args.greenlets, args.queries, args.sleep)
+
+    speedup = cooperative_qps / blocking_qps
+    print("greenlets=%d queries=%d sleep=%.3fs: blocking %.2fs (%.1f q/s);"
+          " cooperative %.2fs (%.1f q/s); speedup %.1fx" % (
+              args.greenlets, args.greenlets * args.queries, args.sleep,
+              blocking, blocking_qps, cooperative, cooperative_qps, speedup))
+    if speedup < args.min_speedup:
+        print("not cooperative: speedup %.1f < %.1f" % (
+            speedup, args.min_speedup), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
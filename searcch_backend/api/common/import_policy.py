@@ -0,0 +1,108 @@
+# importer selection policies for the import scheduler
+#
+# These are pure functions of an ImporterState snapshot, so that the
+# scheduler (api/common/importer.py) and the trace-replay simulator
+# (api/common/import_sim.py) run exactly the same code.
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+# Phases whose durations make up an import's expected service time.
+SERVICE_PHASES = ("start", "validate", "import", "retrieve", "extract")
+
+
+class ImporterState(object):
+    """
+    A scheduler's view of one importer instance: its capacity, how many
+    imports it is running, its expected service time (seconds) per import
+    type, and optionally the import types it prefers.
+    """
+
+    def __init__(self, id, max_tasks, running=0, estimates=None,
+                 default_estimate=60.0, affinity=None):
+        self.id = id
+        self.max_tasks = max_tasks
+        self.running = running
+        self.estimates = estimates or dict()
+        self.default_estimate = default_estimate
+        self.affinity = affinity
+
+    @property
+    def free(self):
+        return self.max_tasks - self.running
+
+    def estimate(self, import_type):
+        """
+        Returns the expected service time of an @import_type import: this
+        instance's own estimate for the type, else its mean over the types
+        it has estimates for, else default_estimate.
+        """
+        if import_type in self.estimates:
+            return self.estimates[import_type]
+        if self.estimates:
+            return sum(self.estimates.values()) / len(self.estimates)
+        return self.default_estimate
+
+    def __repr__(self):
+        return "<ImporterState(id=%r,max_tasks=%r,running=%r,estimates=%r,affinity=%r)>" % (
+            self.id, self.max_tasks, self.running, self.estimates, self.affinity)
+
+
+def least_loaded(importers, import_type, **kwargs):
+    """
+    Returns the importer with a free slot and the lowest running/max_tasks
+    ratio, or None.  Ties go to the earliest in @importers.
+    """
+    best = None
+    for ii in importers:
+        if ii.free <= 0:
+            continue
+        if best is None \
+          or ii.running / float(ii.max_tasks) < best.running / float(best.max_tasks):
+            best = ii
+    return best
+
+
+def expected_completion(importers, import_type, contention=0.5,
+                        affinity_penalty=2.0, **kwargs):
+    """
+    Returns the importer with a free slot on which an @import_type import is
+    expected to finish soonest, or None.  The expected time is the
+    importer's service-time estimate, inflated by @contention times its
+    load (running imports share its CPU and bandwidth), and multiplied by
+    @affinity_penalty if the importer prefers other import types.
+    """
+    (best, best_time) = (None, None)
+    for ii in importers:
+        if ii.free <= 0:
+            continue
+        t = ii.estimate(import_type) \
+            * (1.0 + contention * ii.running / float(ii.max_tasks))
+        if ii.affinity and import_type not in ii.affinity:
+            t *= affinity_penalty
+        if best is None or t < best_time:
+            (best, best_time) = (ii, t)
+    return best
+
+
+POLICIES = {
+    "least_loaded": least_loaded,
+    "expected_completion": expected_completion,
+}
+
+
+def choose_importer(importers, import_type, policy="expected_completion",
+                    **kwargs):
+    """
+    Chooses an importer for an @import_type import by the named @policy;
+    returns None if no importer has a free slot.
+    """
+    return POLICIES[policy](importers, import_type, **kwargs)
+
+
+def ewma(old, sample, alpha):
+    """Returns the exponentially-weighted moving average update."""
+    if old is None:
+        return sample
+    return old + alpha * (sample - old)
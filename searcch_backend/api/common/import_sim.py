@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+#
+# Replays an import trace against the import scheduler's policies (see
+# import_policy.py), and reports per-policy completion times.  Replaying a
+# trace file does not need the app or a database:
+#
+#   python3 -m searcch_backend.api.common.import_sim trace.json
+#
+# or the trace can be built from recorded import history (see load_trace),
+# which needs the app's configured database; --save writes it out:
+#
+#   python3 -m searcch_backend.api.common.import_sim --from-db --days 30
+#
+# trace.json is an object with two lists:
+#
+#   "importers": [{"id": 1, "max_tasks": 4, "speed": 1.0,
+#                  "affinity": ["dataset"]}, ...]
+#   "imports": [{"arrival": 0.0, "type": "software", "duration": 42.0}, ...]
+#
+# An import's actual service time on an importer is its duration divided
+# by the importer's speed, inflated by the same contention model the
+# policy assumes.  Estimates start empty and are learned online with the
+# same EWMA as the scheduler, from completed imports.
+#
+
+import argparse
+import datetime
+import heapq
+import json
+import sys
+
+from searcch_backend.api.common.import_policy import (
+    ImporterState, POLICIES, choose_importer, ewma)
+
+
+def simulate(importers, imports, policy, alpha=0.3, contention=0.5,
+             affinity_penalty=2.0, default_estimate=60.0):
+    """
+    Runs a discrete-event simulation of @imports (sorted by arrival) on
+    @importers under @policy.  Pending imports are assigned, oldest first,
+    whenever an import arrives or finishes, as the scheduler does.
+    Returns a dict of statistics.
+    """
+    states = [ImporterState(
+        i["id"], i["max_tasks"], default_estimate=default_estimate,
+        affinity=i.get("affinity")) for i in importers]
+    speed = dict([(i["id"], i.get("speed", 1.0)) for i in importers])
+    pending = []
+    events = []
+    seq = 0
+    for (n, imp) in enumerate(sorted(imports, key=lambda x: x["arrival"])):
+        heapq.heappush(events, (imp["arrival"], seq, "arrive", n, imp))
+        seq += 1
+    waits = []
+    latencies = []
+    now = 0.0
+    while events:
+        (now, _, kind, n, imp) = heapq.heappop(events)
+        if kind == "arrive":
+            pending.append((n, imp))
+        else:
+            (ii, actual) = imp["_on"]
+            ii.running -= 1
+            ii.estimates[imp["type"]] = ewma(
+                ii.estimates.get(imp["type"]), actual, alpha)
+            latencies.append(now - imp["arrival"])
+        while pending:
+            (pn, pimp) = pending[0]
+            ii = choose_importer(
+                states, pimp["type"], policy=policy, contention=contention,
+                affinity_penalty=affinity_penalty)
+            if ii is None:
+                break
+            pending.pop(0)
+            actual = pimp["duration"] / speed[ii.id] \
+                * (1.0 + contention * ii.running / float(ii.max_tasks))
+            if ii.affinity and pimp["type"] not in ii.affinity:
+                actual *= affinity_penalty
+            ii.running += 1
+            waits.append(now - pimp["arrival"])
+            done = dict(pimp)
+            done["_on"] = (ii, actual)
+            heapq.heappush(events, (now + actual, seq, "finish", pn, done))
+            seq += 1
+
+    latencies.sort()
+    def pct(p):
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+    return dict(
+        policy=policy, imports=len(latencies), makespan=now,
+        mean_wait=sum(waits) / len(waits) if waits else None,
+        mean_latency=sum(latencies) / len(latencies) if latencies else None,
+        p50_latency=pct(0.50), p95_latency=pct(0.95))
+
+
+def load_trace(session, since, affinity=None):
+    """
+    Builds a trace from the importer instances and the completed imports
+    submitted since the datetime @since.  An import arrives at its ctime
+    and its duration runs until it finished (its final phase_time), so
+    durations include any time the import waited for an importer; all
+    importers have speed 1.0, and affinities from @affinity (as in
+    IMPORTER_TYPE_AFFINITY).  Imports served by reuse are left out.
+    """
+    from searcch_backend.models.model import ArtifactImport, ImporterInstance
+
+    affinity = affinity or dict()
+    importers = [
+        dict(id=ii.id, max_tasks=ii.max_tasks, speed=1.0,
+             affinity=affinity.get(ii.url))
+        for ii in session.query(ImporterInstance)\
+          .filter(ImporterInstance.admin_status == "enabled").all() ]
+    rows = session.query(
+        ArtifactImport.type, ArtifactImport.ctime, ArtifactImport.phase_time)\
+      .filter(ArtifactImport.status == "completed")\
+      .filter(ArtifactImport.reused_import_id == None)\
+      .filter(ArtifactImport.ctime >= since)\
+      .filter(ArtifactImport.phase_time != None)\
+      .order_by(ArtifactImport.ctime).all()
+    imports = []
+    for (import_type, ctime, end) in rows:
+        if end < ctime:
+            continue
+        imports.append(dict(
+            arrival=(ctime - since).total_seconds(), type=import_type,
+            duration=max((end - ctime).total_seconds(), 1.0)))
+    return dict(importers=importers, imports=imports)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay an import trace against importer scheduling policies.")
+    parser.add_argument("trace", nargs="?",
+                        help="JSON trace file (see module comment)")
+    parser.add_argument("--from-db", action="store_true",
+                        help="build the trace from recorded import history")
+    parser.add_argument("--days", type=float, default=30,
+                        help="with --from-db, history to replay, in days")
+    parser.add_argument("--save", help="write the trace to this file")
+    parser.add_argument("--alpha", type=float, default=0.3)
+    parser.add_argument("--contention", type=float, default=0.5)
+    parser.add_argument("--affinity-penalty", type=float, default=2.0)
+    args = parser.parse_args()
+
+    if args.from_db:
+        # Import the app before models, to avoid their circular import.
+        from searcch_backend.api.app import app, db, config
+        with app.app_context():
+            trace = load_trace(
+                db.session,
+                datetime.datetime.now() - datetime.timedelta(days=args.days),
+                affinity=config.get("IMPORTER_TYPE_AFFINITY"))
+    elif args.trace:
+        with open(args.trace) as f:
+            trace = json.load(f)
+    else:
+        parser.error("a trace file or --from-db is required")
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(trace, f)
+    for policy in sorted(POLICIES):
+        res = simulate(
+            trace["importers"], trace["imports"], policy, alpha=args.alpha,
+            contention=args.contention,
+            affinity_penalty=args.affinity_penalty)
+        json.dump(res, sys.stdout)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,168 +1,727 @@
+import concurrent.futures
 import datetime
 import logging
+import os
+import random
+import re
+import select
 import sys
 import threading
+import time
+import urllib.parse
 import requests
-import logging
+import requests.adapters
 
-from sqlalchemy import ( asc, desc, func )
+from sqlalchemy import ( asc, desc, func, event )
+from sqlalchemy.sql import text
 from flask import abort, jsonify, request, Response, Blueprint
 from flask_restful import reqparse, Resource, fields, marshal
 
 from searcch_backend.models.model import (
     ARTIFACT_IMPORT_TYPES, ArtifactImport, ImporterSchedule,
-    ImporterInstance )
+    ImporterInstance, ImporterHealthCheck, ImporterPhaseStats,
+    Artifact, ArtifactCuration )
 from searcch_backend.models.schema import (
     ArtifactImportSchema )
-from searcch_backend.api.app import db
+from searcch_backend.api.app import db, config
 from searcch_backend.api.common.auth import verify_api_key
+from searcch_backend.api.common.sql import object_to_json
+from searcch_backend.api.common.import_policy import (
+    SERVICE_PHASES, ImporterState, choose_importer )
 
 
 LOG = logging.getLogger(__name__)
 
-def notify_importer(artifact_import,importer_instance,importer_schedule,
-                    session):
+class ImporterClient(object):
     """
-    Posts an artifact_import to the given importer_instance.  If this
-    fails for any reason, we immediately deschedule the import (unlink
-    the artifact_import from the importer_schedule), and allow a
-    future state mutation to reschedule it.
+    A keep-alive HTTP client for one importer instance, with a circuit
+    breaker: after @failure_threshold consecutive failed deliveries, it
+    refuses requests for @reset_timeout seconds, then lets exactly one
+    through to probe whether the importer has recovered (half-open).  The
+    probe's outcome closes or reopens the circuit; if it never reports
+    one, another probe is allowed after @reset_timeout.
     """
-    # XXX: do a better job tracking failure cause, e.g. connection error vs
-    # http error status.  If the importer fails to accept our artifact_import,
-    # something may be wrong with our POST request or the artifact_import
-    # object.
-    try:
+
+    def __init__(self, url, key, timeout=(3.05, 10), pool_size=4,
+                 failure_threshold=3, reset_timeout=60):
+        self.url = url
+        self.key = key
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.open_until = 0
+        self.probe_until = 0
+        self.session = requests.Session()
+        self.session.headers.update({"X-Api-Key":key})
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount(url, adapter)
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns True if a request may be sent.  In the half-open state,
+        only the caller that gets True is the probe; it must report
+        success() or failure().
+        """
+        with self._lock:
+            if self.failures < self.failure_threshold:
+                return True
+            now = time.monotonic()
+            if now < self.open_until or now < self.probe_until:
+                return False
+            self.probe_until = now + self.reset_timeout
+            return True
+
+    def is_open(self):
+        """Returns True if the circuit is open or half-open."""
+        with self._lock:
+            return self.failures >= self.failure_threshold
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.open_until = 0
+            self.probe_until = 0
+
+    def failure(self):
+        """Records a failed delivery; returns True if the circuit opened."""
+        with self._lock:
+            self.failures += 1
+            self.probe_until = 0
+            if self.failures < self.failure_threshold:
+                return False
+            self.open_until = time.monotonic() + self.reset_timeout
+            return True
+
+    def post(self, path, data):
+        return self.session.post(
+            self.url + path, data=data, timeout=self.timeout,
+            headers={"Content-type":"application/json"})
+
+
+class ImporterNotifier(object):
+    """
+    Delivers scheduled imports to importer instances from a small thread
+    pool, so the scheduler never waits on an importer.  Each delivery is
+    retried with exponential backoff while the instance's circuit is
+    closed.  If it still fails, the import is descheduled (back to
+    pending); if the instance's circuit opened, the instance is also
+    marked down, so that no scheduler routes to it until a status check
+    brings it back up, and its imports are rescheduled elsewhere.  An
+    import the importer rejects outright (a 4xx other than those in
+    RETRYABLE_STATUSES) is failed with the importer's message instead, so
+    that it is not rescheduled forever.
+    """
+
+    RETRYABLE_STATUSES = (408, 429)
+
+    def __init__(self, max_workers=8, retries=3, backoff=1.0, **client_kwargs):
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.client_kwargs = client_kwargs
+        self._clients = dict()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def client(self, importer_instance_id, url, key):
+        k = (importer_instance_id, url, key)
+        with self._lock:
+            if k not in self._clients:
+                self._clients[k] = ImporterClient(url, key, **self.client_kwargs)
+            return self._clients[k]
+
+    def _get_executor(self):
+        # Created lazily so that each forked worker gets its own pool.
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="importer_notify")
+            return self._executor
+
+    def notify(self, artifact_import, importer_instance, importer_schedule):
+        """
+        Queues delivery of a just-scheduled artifact_import.  The objects
+        are serialized here; delivery does not touch the caller's session.
+        """
         ais = ArtifactImportSchema(
             only=("id","type","url","importer_module_name","ctime",
                   "nofetch","noextract","noremove"))
-        aid = ais.dumps(artifact_import)
-        LOG.debug("notifying importer %r of scheduled import %r (data=%r)" % (
-            importer_instance, artifact_import,aid))
-        r = requests.post(
-            importer_instance.url + "/artifact/imports",
-            headers={"Content-type":"application/json",
-                     "X-Api-Key":importer_instance.key},
-            data=aid)
-        if r.status_code == requests.codes.ok:
-            LOG.debug("notified importer %r of scheduled import %r" % (
-                importer_instance, artifact_import))
-            return
-        else:
-            LOG.error("failed to notify importer %r of scheduled import %r (status=%d); descheduling" % (
-                importer_instance, artifact_import, r.status_code))
-    except:
-        LOG.error("failed to notify %r of scheduled import %r; descheduling" % (
-            importer_instance,artifact_import))
-        LOG.exception(sys.exc_info()[1])
-
-    # If we arrive here, there was an error, so deschedule.
-    importer_schedule.importer_instance_id = None
-    importer_schedule.schedule_time = None
-    artifact_import.status = "pending"
-    artifact_import.mtime = datetime.datetime.now()
-    session.flush()
-    session.commit()
+        data = ais.dumps(artifact_import)
+        client = self.client(
+            importer_instance.id, importer_instance.url, importer_instance.key)
+        LOG.debug("queueing notification of importer %r of scheduled import %r (data=%r)" % (
+            importer_instance, artifact_import, data))
+        self._get_executor().submit(
+            self._deliver, client, importer_instance.id, importer_schedule.id,
+            artifact_import.id, data)
+
+    def _deliver(self, client, importer_instance_id, importer_schedule_id,
+                 artifact_import_id, data):
+        try:
+            for attempt in range(self.retries):
+                if attempt:
+                    time.sleep(self.backoff * 2 ** (attempt - 1)
+                               * (0.5 + random.random()))
+                if not client.allow():
+                    LOG.warning("importer %s circuit open; not notifying of import %d" % (
+                        client.url, artifact_import_id))
+                    break
+                try:
+                    r = client.post("/artifact/imports", data)
+                except requests.exceptions.RequestException:
+                    LOG.warning("failed to notify importer %s of scheduled import %d (attempt %d): %s" % (
+                        client.url, artifact_import_id, attempt + 1, sys.exc_info()[1]))
+                    if client.failure():
+                        break
+                    continue
+                if r.status_code == requests.codes.ok:
+                    client.success()
+                    LOG.debug("notified importer %s of scheduled import %d" % (
+                        client.url, artifact_import_id))
+                    return
+                LOG.error("failed to notify importer %s of scheduled import %d (status=%d)" % (
+                    client.url, artifact_import_id, r.status_code))
+                # The importer is alive but rejected this import; do not
+                # retry, or count it against the importer.
+                if r.status_code < 500 \
+                  and r.status_code not in self.RETRYABLE_STATUSES:
+                    client.success()
+                    self._fail_import(
+                        importer_instance_id, importer_schedule_id,
+                        artifact_import_id, rejection_message(r))
+                    return
+                if client.failure():
+                    break
+            self._deschedule(importer_instance_id, importer_schedule_id,
+                             artifact_import_id, client.is_open())
+        except:
+            LOG.exception(sys.exc_info()[1])
+
+    def _deschedule(self, importer_instance_id, importer_schedule_id,
+                    artifact_import_id, instance_down):
+        LOG.error("descheduling import %d from importer %d%s" % (
+            artifact_import_id, importer_instance_id,
+            "; marking importer down" if instance_down else ""))
+        dt = datetime.datetime.now()
+        with db.engine.begin() as connection:
+            res = connection.execute(text(
+                "UPDATE importer_schedules"
+                " SET importer_instance_id = NULL, schedule_time = NULL"
+                " WHERE id = :sid AND importer_instance_id = :iid"),
+                sid=importer_schedule_id, iid=importer_instance_id)
+            if res.rowcount:
+                connection.execute(text(
+                    "UPDATE artifact_imports SET status = 'pending', mtime = :dt"
+                    " WHERE id = :aid AND status = 'scheduled'"),
+                    aid=artifact_import_id, dt=dt)
+            if instance_down:
+                connection.execute(text(
+                    "UPDATE importer_instances SET status = 'down', status_time = :dt"
+                    " WHERE id = :iid AND status = 'up'"),
+                    iid=importer_instance_id, dt=dt)
+        # Only retry elsewhere right away if this importer is now out of
+        # rotation; otherwise a rejected import would bounce straight back.
+        if instance_down:
+            wake_import_scheduler()
+
+    def _fail_import(self, importer_instance_id, importer_schedule_id,
+                     artifact_import_id, message):
+        LOG.error("importer %d rejected import %d; failing it: %s" % (
+            importer_instance_id, artifact_import_id, message))
+        dt = datetime.datetime.now()
+        with db.engine.begin() as connection:
+            res = connection.execute(text(
+                "DELETE FROM importer_schedules"
+                " WHERE id = :sid AND importer_instance_id = :iid"),
+                sid=importer_schedule_id, iid=importer_instance_id)
+            if res.rowcount:
+                connection.execute(text(
+                    "UPDATE artifact_imports"
+                    " SET status = 'failed', message = :msg, mtime = :dt"
+                    " WHERE id = :aid AND status = 'scheduled'"),
+                    aid=artifact_import_id, msg=message, dt=dt)
+        # The importer has a free slot again.
+        wake_import_scheduler()
+
+
+def rejection_message(response):
+    """
+    Returns a message for an import an importer rejected with @response:
+    its JSON message or description, else its (truncated) body.
+    """
+    detail = None
+    try:
+        j = response.json()
+        if isinstance(j, dict):
+            detail = j.get("message") or j.get("description")
+    except ValueError:
+        pass
+    if not detail:
+        detail = (response.text or "").strip()[:1024]
+    msg = "importer rejected import (status %d)" % (response.status_code,)
+    if detail:
+        msg += ": %s" % (detail,)
+    return msg
+
+importer_notifier = ImporterNotifier(
+    max_workers=config.get("IMPORTER_NOTIFY_WORKERS", 8),
+    retries=config.get("IMPORTER_NOTIFY_RETRIES", 3),
+    backoff=config.get("IMPORTER_NOTIFY_BACKOFF", 1.0),
+    timeout=config.get("IMPORTER_NOTIFY_TIMEOUT", (3.05, 10)),
+    failure_threshold=config.get("IMPORTER_CIRCUIT_FAILURES", 3),
+    reset_timeout=config.get("IMPORTER_CIRCUIT_RESET", 60))
+
+def record_phase_duration(session, importer_instance_id, import_type, phase,
+                          duration):
+    """
+    Folds one observed @phase duration (seconds) into the importer's
+    rolling phase model, in the caller's transaction.
+    """
+    session.execute(text(
+        "INSERT INTO importer_phase_stats"
+        "   (importer_instance_id, import_type, phase, ewma_duration, samples, mtime)"
+        " VALUES (:iid, :type, :phase, :duration, 1, now())"
+        " ON CONFLICT (importer_instance_id, import_type, phase) DO UPDATE SET"
+        "   ewma_duration = importer_phase_stats.ewma_duration"
+        "     + :alpha * (excluded.ewma_duration - importer_phase_stats.ewma_duration),"
+        "   samples = importer_phase_stats.samples + 1,"
+        "   mtime = excluded.mtime"),
+        dict(iid=importer_instance_id, type=import_type, phase=phase,
+             duration=duration, alpha=config.get("IMPORTER_PHASE_EWMA_ALPHA", 0.3)))
+
+def record_phase_transition(session, artifact_import, phase, status):
+    """
+    Called with an importer's pushed @phase and @status, before they are
+    applied to @artifact_import: if the import's current phase has ended,
+    records its duration (by our clock, from phase_time, or from the
+    schedule time for the first phase) against the scheduled importer, and
+    starts timing the next phase.  Failed phases are not recorded.
+    """
+    now = datetime.datetime.now()
+    phase_changed = phase is not None and phase != artifact_import.phase
+    finished = status in ("completed","failed") \
+      and artifact_import.status not in ("completed","failed")
+    if not phase_changed and not finished:
+        return
+    importer_schedule = session.query(ImporterSchedule)\
+      .filter(ImporterSchedule.artifact_import_id == artifact_import.id).first()
+    if importer_schedule and importer_schedule.importer_instance_id \
+      and status != "failed":
+        started = artifact_import.phase_time or importer_schedule.schedule_time
+        if started and now >= started:
+            record_phase_duration(
+                session, importer_schedule.importer_instance_id,
+                artifact_import.type, artifact_import.phase,
+                (now - started).total_seconds())
+    artifact_import.phase_time = now
+
+def importer_states(session, instances, current):
+    """
+    Builds the policy's ImporterState for each of @instances, given
+    @current running counts by instance id.  An instance's expected service
+    time for a type is the sum of its rolling phase durations.
+    """
+    estimates = dict([(ii.id, dict()) for ii in instances])
+    stats = session.query(ImporterPhaseStats)\
+      .filter(ImporterPhaseStats.importer_instance_id.in_(list(estimates.keys())))\
+      .filter(ImporterPhaseStats.phase.in_(SERVICE_PHASES)).all()
+    for ps in stats:
+        e = estimates[ps.importer_instance_id]
+        e[ps.import_type] = e.get(ps.import_type, 0.0) + ps.ewma_duration
+    affinity = config.get("IMPORTER_TYPE_AFFINITY") or dict()
+    return [ ImporterState(
+                 ii.id, ii.max_tasks, running=current.get(ii.id, 0),
+                 estimates=estimates[ii.id],
+                 default_estimate=config.get("IMPORTER_DEFAULT_ESTIMATE", 60.0),
+                 affinity=affinity.get(ii.url))
+             for ii in instances ]
 
 #
-# We do not keep a scheduler thread running in the background.  Instead, this
-# function is invoked every time an ArtifactImport or ImporterInstance changes
-# state.
+# Query parameters that may carry credentials (access tokens, signed-URL
+# signatures, and the like).
+#
+CREDENTIAL_PARAM_RE = re.compile(
+    r"token|secret|passw|pwd|auth|key|sig|credential|session", re.IGNORECASE)
+
+def import_url_has_credentials(url):
+    """
+    Returns True if @url carries userinfo or credential-like query
+    parameters: imports of such URLs may see private content, so they are
+    never reused across users.  Unparseable URLs count as credentialed.
+    """
+    try:
+        u = urllib.parse.urlsplit(url.strip())
+    except ValueError:
+        return True
+    if "@" in u.netloc:
+        return True
+    for (k, v) in urllib.parse.parse_qsl(u.query, keep_blank_values=True):
+        if CREDENTIAL_PARAM_RE.search(k):
+            return True
+    return False
+
+def normalize_import_url(url):
+    """
+    Returns @url in the form used to match imports of the same source
+    across users: http upgraded to https; host lowercased, without "www."
+    or a default port; trailing slashes, a trailing ".git", and the
+    fragment dropped; and query parameters sorted.  Owner and repository
+    names on github.com and gitlab.com are case-insensitive, so paths there
+    are lowercased too.  Returns None for URLs with credentials (see
+    import_url_has_credentials), which are not matched at all.
+    """
+    if not url or import_url_has_credentials(url):
+        return None
+    url = url.strip()
+    try:
+        u = urllib.parse.urlsplit(url)
+        port = u.port
+    except ValueError:
+        return None
+    scheme = u.scheme.lower()
+    if scheme == "http":
+        scheme = "https"
+    host = (u.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    netloc = host
+    if port and port not in (80, 443):
+        netloc += ":%d" % (port,)
+    path = u.path.rstrip("/")
+    if path.endswith(".git"):
+        path = path[:-4].rstrip("/")
+    if host in ("github.com", "gitlab.com"):
+        path = path.lower()
+    query = urllib.parse.urlencode(
+        sorted(urllib.parse.parse_qsl(u.query, keep_blank_values=True)))
+    return urllib.parse.urlunsplit((scheme, netloc, path, query, ""))[:1024]
+
+@event.listens_for(ArtifactImport, "before_insert")
+def artifact_import_before_insert(mapper, connection, target):
+    if target.normalized_url is None:
+        target.normalized_url = normalize_import_url(target.url)
+
+def import_reuse_key(normalized_url, importer_module_name, nofetch, noextract):
+    """
+    Imports are reusable for each other if they have the same key: the
+    same source, importer, and options that change the importer's output.
+    """
+    return (normalized_url, importer_module_name or None,
+            bool(nofetch), bool(noextract))
+
+def find_reusable_imports(session, keys, ttl):
+    """
+    Returns a dict mapping each of @keys (from import_reuse_key) to the
+    most recent import with that key that an importer completed within the
+    last @ttl seconds (by phase_time, which records the importer's final
+    transition), if any.  Imports whose artifact was itself cloned,
+    or has since been curated by its owner, are not reused, nor are imports
+    of credentialed URLs (whose normalized_url may predate that rule).
+    """
+    keys = set(keys)
+    urls = set([ k[0] for k in keys if k[0] ])
+    if not ttl or not urls:
+        return dict()
+    cutoff = datetime.datetime.now() - datetime.timedelta(seconds=ttl)
+    curated = session.query(ArtifactCuration.id)\
+      .filter(ArtifactCuration.artifact_id == ArtifactImport.artifact_id)\
+      .exists()
+    candidates = session.query(ArtifactImport)\
+      .filter(ArtifactImport.normalized_url.in_(list(urls)))\
+      .filter(ArtifactImport.status == "completed")\
+      .filter(ArtifactImport.artifact_id != None)\
+      .filter(ArtifactImport.phase_time >= cutoff)\
+      .filter(ArtifactImport.reused_import_id == None)\
+      .filter(~curated)\
+      .order_by(desc(ArtifactImport.phase_time)).all()
+    ret = dict()
+    for ai in candidates:
+        if import_url_has_credentials(ai.url):
+            continue
+        k = import_reuse_key(ai.normalized_url, ai.importer_module_name,
+                             ai.nofetch, ai.noextract)
+        if k in keys and k not in ret:
+            ret[k] = ai
+    return ret
+
+#
+# Relationships of a completed artifact that are not importer output, or
+# that belong to its owner, and so are not cloned into a reused import's
+# artifact.  Candidate relationships are dropped rather than re-owned: the
+# candidates are the other user's (and may already be imported).
+#
+REUSE_SKIP_RELATIONSHIPS = (
+    "artifact_group", "badges", "venues", "candidate_relationships",
+)
+
+def reusable_artifact_json(artifact):
+    """
+    Returns @artifact's JSON, in the form an importer pushes, for
+    materializing a copy for another user.  File contents are referenced
+    by hash and size rather than loaded.
+    """
+    j = object_to_json(artifact,skip_deferred=True)
+    for k in Artifact.__clone_skip_relationships__ \
+      + Artifact.__clone_skip_fields__ + REUSE_SKIP_RELATIONSHIPS:
+        j.pop(k, None)
+    j["ctime"] = datetime.datetime.now().isoformat()
+    return j
+
+#
+# Each process runs one long-lived ImportScheduler thread, started on first
+# use.  State changes that may allow an import to be scheduled (a new
+# import, a finished import, an importer coming up) call
+# wake_import_scheduler(), which NOTIFYs every process's scheduler through
+# Postgres; the schedulers also poll, in case a notification is lost.  All
+# schedulers may run a pass at once: they lock importer instances and
+# pending schedules with SKIP LOCKED, so each slot and each import is
+# claimed by exactly one of them.
 #
 # NB: we also assume that all importer instances *do* keep a simple background
 # thread that pushes state updates to us at regular, reasonable intervals (e.g.
 # one minute).  We'll flip this around later so that the backend polls for
 # status.
 #
-def schedule_import(*args,**kwargs):
-    """
-    Schedule an artifact_import to an importer_instance, if any
-    importer_instance slots are available.  If the argument is None,
-    look for the oldest unscheduled artifact_import.  This must be run
-    in a separate thread.  Note that it creates its own scoped session
-    and closes it before returning so that it doesn't leak sqlalchemy
-    connections.
-    """
-    LOG.debug("schedule_import (thread=%r, threads=%r)" % (
-        threading.current_thread().getName(),threading.active_count()))
-
-    session = db.create_scoped_session()
-    #session = db.session
-    LOG.debug("session: %r" % (session,))
-    #session.begin_nested()
-    #session.begin()
-
-    # Ensure there is at least one artifact_import to schedule:
-    res = session.query(ImporterSchedule)\
-      .filter(ImporterSchedule.importer_instance_id == None).all()
-    if not res:
-        LOG.debug("nothing to schedule")
-        session.close()
-        return
+IMPORT_SCHEDULER_CHANNEL = "searcch_import_scheduler"
 
-    # Unfortunately, we must lock to avoid races.
-    #session.begin(subtransactions=True)
-    #session.execute("BEGIN")
-    #session.execute("LOCK TABLE ONLY importer_instances, importer_schedules")
-    #session.execute("LOCK TABLE ONLY importer_schedules IN ACCESS EXCLUSIVE MODE")
-    (artifact_import,importer_schedule,importer_instance) = (None,None,None)
-    try:
-        res = session.query(
-            ImporterInstance.id.label("id"),
-            ImporterInstance.max_tasks.label("max_tasks"),
-            func.count(ImporterSchedule.id).label("current_tasks"))\
-          .join(ImporterSchedule,
-                ImporterInstance.id == ImporterSchedule.importer_instance_id,
-                isouter=True)\
-          .filter(ImporterInstance.status == "up")\
-          .filter(ImporterInstance.admin_status == "enabled")\
-          .group_by(ImporterInstance.id)\
-          .order_by(desc(ImporterInstance.status_time)).all()
-        if not res:
-            LOG.warn("no up/enabled importers; cannot schedule")
-            session.rollback()
-            session.close()
+class ImportScheduler(object):
+    """
+    Assigns pending imports to free importer instance slots.  A pass
+    (schedule_pending) fills every free slot it can claim in one
+    transaction, then queues notifications to the importers.  The loop runs a pass on each
+    wakeup, coalescing any notifications that arrived meanwhile, and at
+    least every @poll_interval seconds.
+    """
+
+    def __init__(self, poll_interval=30):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def maybe_start(self):
+        # Started lazily so that each forked worker gets its own thread.
+        if self._pid == os.getpid():
             return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="import_scheduler", daemon=True)
+            self._thread.start()
 
-        (least_id,least_percent) = (None,100.0)
-        for (id,max_tasks,current_tasks) in res:
-            if current_tasks == max_tasks:
-                continue
-            pct = current_tasks/float(max_tasks)
-            if pct < least_percent:
-                least_percent = pct
-                least_id = id
-        if not least_id:
-            LOG.warn("all importers are busy")
-            session.rollback()
+    def wake(self):
+        """Wakes the schedulers in all processes."""
+        self.maybe_start()
+        try:
+            with db.engine.connect() as connection:
+                connection.execution_options(autocommit=True).execute(
+                    "NOTIFY %s" % (IMPORT_SCHEDULER_CHANNEL,))
+        except:
+            LOG.exception(sys.exc_info()[1])
+
+    def _run(self):
+        while True:
+            try:
+                self._listen()
+            except:
+                LOG.exception(sys.exc_info()[1])
+                time.sleep(self.poll_interval)
+
+    def _listen(self):
+        raw = db.engine.raw_connection()
+        try:
+            conn = raw.connection
+            conn.set_isolation_level(0)
+            cursor = conn.cursor()
+            cursor.execute("LISTEN %s" % (IMPORT_SCHEDULER_CHANNEL,))
+            while True:
+                try:
+                    self.schedule_pending()
+                except:
+                    LOG.error("error in schedule_pending:")
+                    LOG.exception(sys.exc_info()[1])
+                select.select([conn], [], [], self.poll_interval)
+                conn.poll()
+                del conn.notifies[:]
+        finally:
+            raw.invalidate()
+
+    def schedule_pending(self):
+        """
+        Claims every free slot on up/enabled importer instances and fills
+        them with the oldest pending imports, each placed on an importer by
+        the IMPORTER_SCHEDULING_POLICY (see import_policy).
+        Instances and schedules being assigned by another scheduler are
+        skipped, not waited for.  Returns the number of imports scheduled.
+        """
+        session = db.create_scoped_session()
+        try:
+            assigned = self._assign(session)
+            for (artifact_import,importer_instance,importer_schedule) in assigned:
+                importer_notifier.notify(
+                    artifact_import,importer_instance,importer_schedule)
+            return len(assigned)
+        finally:
             session.close()
-            return
 
-        importer_instance = session.query(ImporterInstance)\
-          .filter(ImporterInstance.id == least_id).one()
-        LOG.debug("using importer %r" % (importer_instance,))
+    def _assign(self, session):
+        try:
+            instances = session.query(ImporterInstance)\
+              .filter(ImporterInstance.status == "up")\
+              .filter(ImporterInstance.admin_status == "enabled")\
+              .order_by(desc(ImporterInstance.status_time))\
+              .with_for_update(skip_locked=True).all()
+            if not instances:
+                LOG.debug("no up/enabled importers available; cannot schedule")
+                session.rollback()
+                return []
 
-        (importer_schedule,artifact_import) = session.query(
-            ImporterSchedule,ArtifactImport)\
-          .join(ArtifactImport,ImporterSchedule.artifact_import_id == ArtifactImport.id)\
-          .filter(ImporterSchedule.importer_instance_id == None)\
-          .order_by(asc(ArtifactImport.ctime)).first()
-        LOG.debug("scheduling %r" % (artifact_import,))
+            current = dict(session.query(
+                ImporterSchedule.importer_instance_id,
+                func.count(ImporterSchedule.id))\
+              .filter(ImporterSchedule.importer_instance_id.in_(
+                  [ii.id for ii in instances]))\
+              .group_by(ImporterSchedule.importer_instance_id).all())
+            states = importer_states(session, instances, current)
+            free = sum([max(0, st.free) for st in states])
+            if not free:
+                LOG.debug("all importers are busy")
+                session.rollback()
+                return []
 
-        dt = datetime.datetime.now()
-        importer_schedule.importer_instance_id = importer_instance.id
-        importer_schedule.schedule_time = dt
-        artifact_import.status = "scheduled"
-        artifact_import.mtime = dt
-        session.commit()
-    except:
-        session.rollback()
-        session.close()
-        LOG.error("error in schedule_import:")
-        LOG.exception(sys.exc_info()[1])
-        return
+            pending = session.query(ImporterSchedule,ArtifactImport)\
+              .join(ArtifactImport,ImporterSchedule.artifact_import_id == ArtifactImport.id)\
+              .filter(ImporterSchedule.importer_instance_id == None)\
+              .order_by(asc(ArtifactImport.ctime))\
+              .limit(free)\
+              .with_for_update(of=ImporterSchedule,skip_locked=True).all()
+            if not pending:
+                LOG.debug("nothing to schedule")
+                session.rollback()
+                return []
+
+            instances_by_id = dict([(ii.id, ii) for ii in instances])
+            assigned = []
+            dt = datetime.datetime.now()
+            for (importer_schedule,artifact_import) in pending:
+                st = choose_importer(
+                    states, artifact_import.type,
+                    policy=config.get("IMPORTER_SCHEDULING_POLICY", "expected_completion"),
+                    contention=config.get("IMPORTER_CONTENTION", 0.5),
+                    affinity_penalty=config.get("IMPORTER_AFFINITY_PENALTY", 2.0))
+                if st is None:
+                    break
+                st.running += 1
+                importer_instance = instances_by_id[st.id]
+                LOG.debug("scheduling %r on %r" % (artifact_import,importer_instance))
+                importer_schedule.importer_instance_id = importer_instance.id
+                importer_schedule.schedule_time = dt
+                artifact_import.status = "scheduled"
+                artifact_import.mtime = dt
+                artifact_import.phase_time = None
+                assigned.append((artifact_import,importer_instance,importer_schedule))
+            session.commit()
+            return assigned
+        except:
+            session.rollback()
+            raise
+
+import_scheduler = ImportScheduler(
+    poll_interval=config.get("IMPORT_SCHEDULER_POLL_INTERVAL", 30))
+
+def wake_import_scheduler():
+    """
+    Asks the import schedulers to run a pass; call after committing a
+    change that may allow an import to be scheduled.
+    """
+    import_scheduler.wake()
+
+def _poll_importer_status(importer_instance_id, url, key, timeout):
+    """
+    GETs an importer's /status; returns a dict of ImporterHealthCheck
+    columns.
+    """
+    ret = dict(importer_instance_id=importer_instance_id,
+               check_time=datetime.datetime.now(), ok=False,
+               status_code=None, latency=None, num_tasks=None, message=None)
+    start = time.monotonic()
+    try:
+        r = requests.get(url + "/status", headers={"X-Api-Key":key},
+                         timeout=timeout)
+        ret["latency"] = time.monotonic() - start
+        ret["status_code"] = r.status_code
+        ret["ok"] = r.status_code == requests.codes.ok
+        if not ret["ok"]:
+            ret["message"] = r.text[:1024]
+        else:
+            # Importers that report their load do so as num_tasks, or as a
+            # list of tasks.
+            try:
+                j = r.json()
+            except ValueError:
+                j = None
+            if isinstance(j, dict):
+                if isinstance(j.get("num_tasks"), int):
+                    ret["num_tasks"] = j["num_tasks"]
+                elif isinstance(j.get("tasks"), list):
+                    ret["num_tasks"] = len(j["tasks"])
+    except requests.exceptions.RequestException:
+        ret["message"] = str(sys.exc_info()[1])[:1024]
+    return ret
+
+def check_importer_health(max_workers=8, timeout=(3.05, 5), history_days=7):
+    """
+    Polls every registered importer instance's /status concurrently,
+    records each result in importer_health_checks, and updates all
+    instances' status and status_time in one batched UPDATE.  If any
+    instance came up, wakes the import schedulers (the NOTIFY commits with
+    the update).  Health history older than @history_days is pruned.
+    Returns the list of check results.
+    """
+    instances = db.session.query(
+        ImporterInstance.id, ImporterInstance.url, ImporterInstance.key,
+        ImporterInstance.status).all()
+    db.session.rollback()
+    if not instances:
+        return []
 
-    # Notify the importer instance now that we've scheduled and released locks:
-    notify_importer(artifact_import,importer_instance,importer_schedule,session)
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, len(instances))),
+            thread_name_prefix="importer_health") as executor:
+        results = list(executor.map(
+            lambda ii: _poll_importer_status(ii.id, ii.url, ii.key, timeout),
+            instances))
 
-    session.close()
+    old_status = dict([(ii.id, ii.status) for ii in instances])
+    came_up = [r["importer_instance_id"] for r in results
+               if r["ok"] and old_status[r["importer_instance_id"]] != "up"]
+    values = []
+    params = {}
+    for (i, r) in enumerate(results):
+        values.append("(CAST(:i%d AS integer), CAST(:s%d AS importer_instances_status_enum), CAST(:t%d AS timestamp))" % (i, i, i))
+        params["i%d" % (i,)] = r["importer_instance_id"]
+        params["s%d" % (i,)] = "up" if r["ok"] else "down"
+        params["t%d" % (i,)] = r["check_time"]
+    with db.engine.begin() as connection:
+        connection.execute(ImporterHealthCheck.__table__.insert().values(results))
+        connection.execute(text(
+            "UPDATE importer_instances AS I"
+            " SET status = V.status, status_time = V.check_time"
+            " FROM (VALUES %s) AS V(id, status, check_time)"
+            " WHERE I.id = V.id" % (", ".join(values),)), params)
+        connection.execute(text(
+            "DELETE FROM importer_health_checks"
+            " WHERE check_time < now() - make_interval(days => :days)"),
+            days=history_days)
+        if came_up:
+            LOG.info("importers %r came up; waking schedulers" % (came_up,))
+            connection.execute("NOTIFY %s" % (IMPORT_SCHEDULER_CHANNEL,))
+    return results
@@ -0,0 +1,451 @@
+# logic for ingesting completed imports' artifacts
+
+from searcch_backend.models.model import (
+    ArtifactImport, ImporterSchedule, ArtifactGroup, Artifact,
+    ArtifactRelationship, FileContent, ArtifactImportFileContent )
+from searcch_backend.api.app import db, config
+from searcch_backend.api.common.importer import wake_import_scheduler
+from searcch_backend.api.common.sql import object_from_json
+from sqlalchemy.sql import text
+import collections
+import datetime
+import json
+import logging
+import os
+import select
+import sqlalchemy
+import sys
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+
+class ImportMaterializeError(Exception):
+
+    def __init__(self, code, msg):
+        super(ImportMaterializeError, self).__init__(msg)
+        self.code = code
+        self.msg = msg
+
+
+class ImportClaimLost(Exception):
+    """
+    Raised when an ingester's claim on an import was taken over before it
+    committed the import's artifact; nothing was committed.
+    """
+    pass
+
+
+def artifact_file_content_holders(artifact):
+    """
+    Returns @artifact's files and their members, whose content
+    FileContent.dedupe stores.
+    """
+    return list(artifact.files) \
+      + [ m for f in artifact.files for m in f.members ]
+
+
+def fail_import(artifact_import, msg, claimed=None):
+    """
+    Rolls back, then marks @artifact_import failed with @msg and commits.
+    If @claimed is given (an ingester's claim time; see ImportIngester),
+    only while that claim still holds.  Returns True if the import was
+    marked.
+    """
+    db.session.rollback()
+    q = db.session.query(ArtifactImport)\
+      .filter(ArtifactImport.id == artifact_import.id)
+    if claimed is not None:
+        q = q.filter(ArtifactImport.ingest_start_time == claimed)
+    n = q.update({
+        ArtifactImport.status: "failed",
+        ArtifactImport.message: msg,
+        ArtifactImport.mtime: datetime.datetime.now() },
+        synchronize_session=False)
+    db.session.commit()
+    return n > 0
+
+
+def lock_claim(artifact_import_id, claimed):
+    """
+    Locks the import's row until the caller commits, and raises
+    ImportClaimLost (after rolling back) if the ingester's claim made at
+    @claimed was taken over.
+    """
+    current = db.session.query(ArtifactImport.ingest_start_time)\
+      .filter(ArtifactImport.id == artifact_import_id)\
+      .with_for_update().scalar()
+    if current != claimed:
+        db.session.rollback()
+        raise ImportClaimLost()
+
+
+def materialize_import_artifact(artifact_import, artifact_json, timings=None,
+                                claimed=None):
+    """
+    Creates the artifact of a completed @artifact_import from
+    @artifact_json (an importer's output, or a reused import's artifact),
+    owned by the import's owner, and marks the import completed in the
+    same transaction; promotes the relationships of the candidate artifact
+    it was imported for, if any; and kicks off imports of the artifact's
+    candidates if autofollow is set.  Returns the new artifact.  On
+    failure, marks the import failed and raises ImportMaterializeError.  If
+    @timings is a dict, the build, files, commit, and relationships
+    stages' durations (seconds) are stored in it.  If @claimed is given
+    (an ingester's claim time; see ImportIngester), the import is changed
+    only while that claim holds; if it was taken over, nothing is
+    committed and ImportClaimLost is raised.  The artifact may reference
+    stored content by hash alone only if the import may use it (see
+    ArtifactImportFileContent).
+    """
+    if timings is None:
+        timings = dict()
+    start = time.monotonic()
+
+    def fail(code, msg):
+        if not fail_import(artifact_import, msg, claimed=claimed) \
+          and claimed is not None:
+            raise ImportClaimLost()
+        raise ImportMaterializeError(code, msg)
+
+    if "owner" in artifact_json:
+        del artifact_json["owner"]
+    if "owner_id" in artifact_json:
+        del artifact_json["owner_id"]
+    for x in artifact_json.get("candidate_relationships", []):
+        if "owner" in x.get("related_candidate", {}):
+            del x["related_candidate"]["owner"]
+        if "owner_id" in x.get("related_candidate", {}):
+            del x["related_candidate"]["owner_id"]
+    artifact = None
+    try:
+        allowed_hashes = ArtifactImportFileContent.hashes(
+            db.session, artifact_import.id)
+        artifact = object_from_json(db.session,Artifact,artifact_json,skip_primary_keys=True)
+        timings["build"] = time.monotonic() - start
+        start = time.monotonic()
+        FileContent.dedupe(db.session, artifact_file_content_holders(artifact),
+                           allowed_hashes=allowed_hashes)
+        timings["files"] = time.monotonic() - start
+    except (TypeError, ValueError):
+        ex = sys.exc_info()[1]
+        LOG.exception(ex)
+        if ex.args:
+            msg = "Internal error: %r" % (ex.args,)
+        else:
+            msg = "Internal error: %r" % (ex,)
+        fail(500, msg)
+    except:
+        LOG.exception(sys.exc_info()[1])
+        fail(500, "Unexpected internal error")
+
+    start = time.monotonic()
+    if artifact_import.artifact_group_id is None:
+        artifact_group = ArtifactGroup(owner_id=artifact_import.owner_id,
+                                       next_version=0)
+        artifact.artifact_group = artifact_group
+        db.session.add(artifact_group)
+    else:
+        artifact.artifact_group_id = artifact_import.artifact_group_id
+
+    artifact.owner_id = artifact_import.owner_id
+    for x in getattr(artifact, "candidate_relationships"):
+        x.related_candidate.owner_id = artifact_import.owner_id
+    if artifact_import.parent_artifact_id:
+        artifact.parent_id = artifact_import.parent_artifact_id
+    db.session.add(artifact)
+    try:
+        db.session.flush()
+        if claimed is not None:
+            lock_claim(artifact_import.id, claimed)
+        artifact_import.artifact_id = artifact.id
+        artifact_import.artifact_group_id = artifact.artifact_group_id
+        artifact_import.status = "completed"
+        artifact_import.phase = "done"
+        artifact_import.mtime = datetime.datetime.now()
+        db.session.commit()
+        db.session.refresh(artifact)
+    except ImportClaimLost:
+        raise
+    except sqlalchemy.exc.IntegrityError:
+        #psycopg2.errors.UniqueViolation:
+        LOG.exception(sys.exc_info()[1])
+        fail(400, "failed to upload artifact from importer (possible duplicate or malformed data)")
+    except:
+        LOG.exception(sys.exc_info()[1])
+        fail(500, "failed to upload artifact from importer (unknown cause)")
+    timings["commit"] = time.monotonic() - start
+
+    # Artifact inserted ok; see if this import was for a
+    # CandidateArtifact, maybe with CandidateArtifactRelationships.
+    # If so, add create real relationships from the original Artifact
+    # to the one just imported.
+    start = time.monotonic()
+    if artifact_import.candidate_artifact \
+      and artifact_import.candidate_artifact.candidate_artifact_relationships:
+        for car in artifact_import.candidate_artifact.candidate_artifact_relationships:
+            nr = ArtifactRelationship(
+                artifact_group_id=car.artifact.artifact_group_id, relation=car.relation,
+                related_artifact_group_id=artifact.artifact_group_id)
+            LOG.debug("promoted %r to %r", car, nr)
+            db.session.add(nr)
+        db.session.commit()
+
+    # Artifact inserted ok; kick off imports for the
+    # CandidateArtifacts pointed to by the CandidateArtifactRelationships.
+    if artifact_import.autofollow and artifact.candidate_relationships:
+        need_sched = False
+        for cr in artifact.candidate_relationships:
+            c = cr.related_candidate
+            now = datetime.datetime.now()
+            nai = ArtifactImport(
+                url=c.url, type=c.type or "unknown", ctime=now,
+                status="pending", phase="start", owner_id=artifact.owner_id)
+            ni = ImporterSchedule(artifact_import=nai)
+            c.artifact_import = nai
+            db.session.add(nai)
+            db.session.add(ni)
+            need_sched = True
+        if need_sched:
+            db.session.commit()
+            db.session.refresh(artifact)
+            LOG.debug("scheduling candidate imports")
+            wake_import_scheduler()
+    timings["relationships"] = time.monotonic() - start
+
+    return artifact
+
+
+def ingest_import_artifact(artifact_import, artifact_json, timings=None,
+                           claimed=None):
+    """
+    Materializes @artifact_import's artifact from @artifact_json (see
+    materialize_import_artifact, which @claimed fences) and records the
+    ingestion's start and end times and per-stage @timings on the import.
+    Returns the artifact; raises ImportMaterializeError (with the import
+    marked failed) on failure, or ImportClaimLost (with nothing recorded).
+    """
+    if timings is None:
+        timings = collections.OrderedDict()
+    if artifact_import.ingest_start_time is None:
+        artifact_import.ingest_start_time = datetime.datetime.now()
+    try:
+        artifact = materialize_import_artifact(
+            artifact_import, artifact_json, timings=timings, claimed=claimed)
+    except ImportClaimLost:
+        raise
+    except:
+        record_ingest_end(artifact_import, timings, claimed=claimed)
+        raise
+    record_ingest_end(artifact_import, timings, claimed=claimed, done=True)
+    return artifact
+
+
+def record_ingest_end(artifact_import, timings, claimed=None, done=False):
+    """
+    Records the end of @artifact_import's ingestion and its @timings, and
+    if @done, clears its payload; if @claimed is given, only while the
+    ingester's claim made then still holds.  Commits.
+    """
+    values = {
+        ArtifactImport.ingest_end_time: datetime.datetime.now(),
+        ArtifactImport.ingest_timings: json.dumps(timings) }
+    if done:
+        values[ArtifactImport.payload] = None
+    q = db.session.query(ArtifactImport)\
+      .filter(ArtifactImport.id == artifact_import.id)
+    if claimed is not None:
+        q = q.filter(ArtifactImport.ingest_start_time == claimed)
+    q.update(values, synchronize_session=False)
+    db.session.commit()
+    LOG.info("ingested %r in %s", artifact_import, json.dumps(timings))
+
+
+#
+# Importers PUT a completed import's artifact JSON; unless
+# IMPORT_INGEST_ASYNC is disabled, the PUT only stores it as the import's
+# payload (leaving it running, in phase done) and wakes the ingesters, so
+# that large artifacts do not time out the importer.  The ingesters run in
+# searcch-jobs; like the import schedulers, they LISTEN for wakeups and also
+# poll.
+#
+IMPORT_INGESTER_CHANNEL = "searcch_import_ingester"
+
+class ImportIngester(object):
+    """
+    Materializes the artifacts of imports with queued payloads.  Each of
+    @workers threads claims up to @batch_size of the oldest queued imports
+    at a time, with SKIP LOCKED so that no two threads or processes claim
+    the same import, and ingests them one by one; when the queue is empty,
+    it waits for a wakeup or @poll_interval seconds.  A claim older than
+    @claim_timeout seconds (e.g. of a process that died) is taken over.
+    Claims are fenced by their ingest_start_time: each import's claim is
+    renewed as its ingestion starts, and its artifact is committed only if,
+    under a row lock, the claim is still the one this thread made (see
+    lock_claim), and its status is failed only by an update conditioned on
+    the claim (see fail_import); so a slow ingestion that was taken over
+    is abandoned, neither committed twice nor failing the new owner's.
+    """
+
+    def __init__(self, workers=2, batch_size=8, poll_interval=30, claim_timeout=600):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+
+    def start(self, app):
+        """Starts this process's ingester threads, if not yet started."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._threads = [
+                threading.Thread(target=self._run, args=(app,),
+                                 name="import_ingester_%d" % (i,), daemon=True)
+                for i in range(self.workers) ]
+            for t in self._threads:
+                t.start()
+
+    def wake(self):
+        """Wakes the ingesters in all processes."""
+        try:
+            with db.engine.connect() as connection:
+                connection.execution_options(autocommit=True).execute(
+                    "NOTIFY %s" % (IMPORT_INGESTER_CHANNEL,))
+        except:
+            LOG.exception(sys.exc_info()[1])
+
+    def _run(self, app):
+        while True:
+            try:
+                with app.app_context():
+                    self._listen()
+            except:
+                LOG.exception(sys.exc_info()[1])
+                time.sleep(self.poll_interval)
+
+    def _listen(self):
+        raw = db.engine.raw_connection()
+        try:
+            conn = raw.connection
+            conn.set_isolation_level(0)
+            cursor = conn.cursor()
+            cursor.execute("LISTEN %s" % (IMPORT_INGESTER_CHANNEL,))
+            while True:
+                try:
+                    n = self.ingest_batch()
+                except:
+                    n = 0
+                    LOG.error("error in ingest_batch:")
+                    LOG.exception(sys.exc_info()[1])
+                if n >= self.batch_size:
+                    continue
+                select.select([conn], [], [], self.poll_interval)
+                conn.poll()
+                del conn.notifies[:]
+        finally:
+            raw.invalidate()
+
+    def claim(self):
+        """
+        Claims up to batch_size queued imports, oldest payload first, by
+        setting their ingest_start_time; returns (id, claim time) tuples.
+        """
+        now = datetime.datetime.now()
+        ids = [ (row[0], now) for row in db.session.execute(text(
+            "UPDATE artifact_imports SET ingest_start_time = :now"
+            " WHERE id IN ("
+            "   SELECT id FROM artifact_imports"
+            "   WHERE status = 'running' AND payload IS NOT NULL"
+            "     AND (ingest_start_time IS NULL OR ingest_start_time < :stale)"
+            "   ORDER BY payload_time"
+            "   LIMIT :limit"
+            "   FOR UPDATE SKIP LOCKED)"
+            " RETURNING id"),
+            dict(now=now, limit=self.batch_size,
+                 stale=now - datetime.timedelta(seconds=self.claim_timeout))).fetchall() ]
+        db.session.commit()
+        return ids
+
+    def renew(self, artifact_import_id, claimed):
+        """
+        Renews our claim (made at @claimed) on an import, returning the new
+        claim time, or None if the claim was taken over.
+        """
+        now = datetime.datetime.now()
+        row = db.session.execute(text(
+            "UPDATE artifact_imports SET ingest_start_time = :now"
+            " WHERE id = :id AND ingest_start_time = :claimed"
+            "   AND status = 'running'"
+            " RETURNING id"),
+            dict(now=now, id=artifact_import_id, claimed=claimed)).first()
+        db.session.commit()
+        return now if row else None
+
+    def ingest_batch(self):
+        """Claims and ingests one batch; returns the number claimed."""
+        try:
+            claims = self.claim()
+            for (artifact_import_id, claimed) in claims:
+                try:
+                    self.ingest(artifact_import_id, claimed)
+                except:
+                    LOG.exception(sys.exc_info()[1])
+                    db.session.rollback()
+            return len(claims)
+        finally:
+            db.session.remove()
+
+    def ingest(self, artifact_import_id, claimed):
+        # Earlier imports in the batch may have taken a while.
+        claimed = self.renew(artifact_import_id, claimed)
+        if claimed is None:
+            LOG.warning("claim on import %d taken over before ingestion",
+                        artifact_import_id)
+            return
+        artifact_import = db.session.query(ArtifactImport).get(artifact_import_id)
+        if not artifact_import or artifact_import.status != "running" \
+          or not artifact_import.payload:
+            db.session.rollback()
+            return
+        timings = collections.OrderedDict()
+        if artifact_import.payload_time:
+            timings["queue"] = (artifact_import.ingest_start_time
+                                - artifact_import.payload_time).total_seconds()
+        start = time.monotonic()
+        try:
+            artifact_json = json.loads(artifact_import.payload)
+        except ValueError:
+            LOG.exception(sys.exc_info()[1])
+            if not fail_import(artifact_import, "malformed artifact payload",
+                               claimed=claimed):
+                LOG.warning("claim on import %d taken over during ingestion",
+                            artifact_import_id)
+            return
+        timings["decode"] = time.monotonic() - start
+        try:
+            ingest_import_artifact(
+                artifact_import, artifact_json, timings=timings,
+                claimed=claimed)
+        except ImportMaterializeError as ex:
+            LOG.warning("failed to ingest %r: %s", artifact_import, ex.msg)
+        except ImportClaimLost:
+            LOG.warning("claim on import %d taken over during ingestion;"
+                        " abandoned it", artifact_import_id)
+
+import_ingester = ImportIngester(
+    workers=config.get("IMPORT_INGEST_WORKERS", 2),
+    batch_size=config.get("IMPORT_INGEST_BATCH_SIZE", 8),
+    poll_interval=config.get("IMPORT_INGEST_POLL_INTERVAL", 30),
+    claim_timeout=config.get("IMPORT_INGEST_CLAIM_TIMEOUT", 600))
+
+def wake_import_ingester():
+    """
+    Asks the import ingesters to claim queued payloads; call after
+    committing one.
+    """
+    import_ingester.wake()
@@ -0,0 +1,181 @@
+# logic for offset and keyset (cursor) pagination
+
+from sqlalchemy import and_, or_
+import base64
+import binascii
+import datetime
+import json
+import logging
+import math
+import sys
+
+LOG = logging.getLogger(__name__)
+
+
+#
+# How paginate() reports the total number of results: an exact COUNT over
+# the filtered query, the planner's row estimate for it, or no total at all
+# (only has_next, found by fetching one extra row).
+#
+TOTAL_MODES = ("exact", "estimate", "none")
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class Page(object):
+    """
+    A page of query results, as returned by paginate().  @total is None
+    when the total was not requested.
+    """
+
+    def __init__(self, items, page, per_page, has_next, total=None, total_mode="exact"):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.has_next = has_next
+        self.total = total
+        self.total_mode = total_mode
+
+    @property
+    def pages(self):
+        if self.total is None:
+            return None
+        return int(math.ceil(self.total / self.per_page))
+
+    def as_dict(self):
+        """Returns the pagination fields for a response dict."""
+        ret = dict(page=self.page, has_next=self.has_next)
+        if self.total is not None:
+            ret["total"] = self.total
+            ret["pages"] = self.pages
+            if self.total_mode == "estimate":
+                ret["total_is_estimate"] = True
+        return ret
+
+
+def estimate_count(query):
+    """
+    Returns the planner's row estimate for @query, without running it.
+    """
+    connection = query.session.connection()
+    statement = query.order_by(None).statement
+    compiled = statement.compile(dialect=connection.dialect)
+    row = connection.execute(
+        "EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params).first()
+    plan = row[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def paginate(query, page, per_page, total="exact"):
+    """
+    Returns the @page'th (1-based) page of @query, with @per_page items
+    per page.  @total is one of TOTAL_MODES; only "exact" runs a COUNT.
+    """
+    if total == "exact":
+        pagination = query.paginate(page=page, error_out=False, per_page=per_page)
+        return Page(pagination.items, pagination.page, per_page,
+                    pagination.has_next, total=pagination.total)
+
+    if page is None or page < 1:
+        page = 1
+    if per_page < sys.maxsize:
+        items = query.offset((page - 1) * per_page).limit(per_page + 1).all()
+    else:
+        items = query.all()
+    has_next = len(items) > per_page
+    items = items[:per_page]
+    count = None
+    if total == "estimate":
+        # An estimate can trail the rows we have actually seen.
+        count = max(estimate_count(query),
+                    (page - 1) * per_page + len(items) + int(has_next))
+    return Page(items, page, per_page, has_next, total=count, total_mode=total)
+
+
+def _encode_value(v):
+    if isinstance(v, datetime.datetime):
+        return {"dt": v.isoformat()}
+    return v
+
+
+def _decode_value(v):
+    if isinstance(v, dict) and "dt" in v:
+        return datetime.datetime.fromisoformat(v["dt"])
+    return v
+
+
+def encode_cursor(shape, values):
+    """
+    Encodes the sort-key values of the last row of a page as an opaque
+    cursor.  @shape identifies the ordering the values belong to, so that a
+    cursor cannot be replayed against a differently-sorted query.
+    """
+    j = dict(s=shape, k=[_encode_value(v) for v in values])
+    return base64.urlsafe_b64encode(
+        json.dumps(j, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+
+def _check_value(v, t):
+    """
+    Returns the cursor value @v as the Python type @t of its sort key, or
+    raises InvalidCursor if it is not of that type.
+    """
+    if t is float and isinstance(v, (int, float)) and not isinstance(v, bool):
+        return float(v)
+    if t is int and isinstance(v, bool):
+        raise InvalidCursor("cursor value of wrong type")
+    if not isinstance(v, t):
+        raise InvalidCursor("cursor value of wrong type")
+    return v
+
+
+def key_types(keys):
+    """
+    Returns the Python type of each of @keys, a list of (expression,
+    descending) tuples, for decode_cursor.  Each key expression must have
+    a typed SQL type (e.g. give functions a type_).
+    """
+    return [expr.type.python_type for (expr, descending) in keys]
+
+
+def decode_cursor(cursor, shape, types):
+    """
+    Decodes a cursor produced by encode_cursor, returning its list of
+    sort-key values.  @types are the Python types of the sort keys (see
+    key_types).  Raises InvalidCursor if it is malformed, holds values of
+    the wrong types, or was built for a different ordering.
+    """
+    try:
+        j = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        values = [_decode_value(v) for v in j["k"]]
+        if j["s"] != shape or len(values) != len(types):
+            raise InvalidCursor("cursor does not match query ordering")
+        return [_check_value(v, t) for (v, t) in zip(values, types)]
+    except InvalidCursor:
+        raise
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise InvalidCursor("malformed cursor")
+
+
+def keyset_filter(keys, values):
+    """
+    Builds the predicate selecting rows strictly after @values in the
+    ordering given by @keys, a list of (expression, descending) tuples.
+    The key expressions must be non-null and the last key must be unique.
+    """
+    clauses = []
+    for i in range(len(keys)):
+        (expr, descending) = keys[i]
+        terms = [keys[j][0] == values[j] for j in range(i)]
+        terms.append(expr < values[i] if descending else expr > values[i])
+        clauses.append(and_(*terms))
+    return or_(*clauses)
+
+
+def keyset_order(keys):
+    return [expr.desc() if descending else expr.asc()
+            for (expr, descending) in keys]
@@ -1,9 +1,11 @@
-import atexit, secrets, logging
+import atexit, secrets, logging, time, sys
 
 from flask_sqlalchemy import SQLAlchemy
-from searcch_backend.models.model import OwnershipEmail, OwnershipInvitation, Sessions, StatsRecentViews, StatsArtifactViews, ArtifactGroup, User, Person
+from searcch_backend.models.model import OwnershipEmail, OwnershipInvitation, Sessions, ArtifactGroup, User, Person
+from searcch_backend.api.common.importer import check_importer_health
 from apscheduler.schedulers.background import BackgroundScheduler
-from sqlalchemy import func, or_
+from sqlalchemy import or_
+from sqlalchemy.sql import text
 from datetime import datetime, timedelta
 from flask_mail import Message, Mail
 import jinja2
@@ -12,55 +14,215 @@ LOG = logging.getLogger(__name__)
 
 # Subject line for email invitations
 SUBJECT = 'The SEARCCH Invitation: Help Us Help Others Find and Reuse Your Research Artifacts'
+
+# Advisory lock namespace for background jobs; see runJob.
+JOB_LOCK_PREFIX = 'searcch_job:'
+# A job is skipped if any replica started it less than this fraction of its
+# interval ago.
+JOB_MIN_GAP_FRACTION = 0.9
+
 class SearcchBackgroundTasks():
 
-    def __init__(self, config, app, db: SQLAlchemy, mail: Mail):
+    def __init__(self, config, app, db: SQLAlchemy, mail: Mail, scheduler=None):
         self.config = config
         self.app = app
         self.db = db
         self.mail = mail
-        self.scheduler = None
+        self.scheduler = scheduler
         self.setupScheduledTask()
 
     def setupScheduledTask(self):
-        self.scheduler = BackgroundScheduler()
-        self.scheduler.add_job(func=self.collectRecentViews, trigger="interval", seconds=self.config['STATS_GARBAGE_COLLECTOR_INTERVAL'])
-        self.scheduler.add_job(func=self.email_invitations_task, trigger="interval", seconds=self.config['EMAIL_INVITATIONS_INTERVAL'])
-        self.scheduler.start()
-        
+        if self.scheduler is None:
+            self.scheduler = BackgroundScheduler()
+        self.addJob(self.collectRecentViews, self.config['STATS_GARBAGE_COLLECTOR_INTERVAL'])
+        self.addJob(self.email_invitations_task, self.config['EMAIL_INVITATIONS_INTERVAL'])
+        self.addJob(self.refreshTrending, self.config['TRENDING_REFRESH_INTERVAL'])
+        self.addJob(self.checkImporterHealth, self.config['IMPORTER_HEALTH_INTERVAL'])
+        self.addJob(self.deleteOrphanFileContent, self.config['FILE_CONTENT_CLEANUP_INTERVAL'])
+
+    def addJob(self, func, interval):
+        name = func.__name__
+        self.scheduler.add_job(
+            func=self.runJob, args=(name, func, interval), id=name,
+            trigger="interval", seconds=interval,
+            max_instances=1, coalesce=True)
+
+    def start(self):
+        """
+        Starts the scheduler.  With a BlockingScheduler (searcch-jobs), this
+        does not return until the scheduler is shut down.
+        """
         # Shut down the scheduler when exiting the app
-        atexit.register(lambda: self.scheduler.shutdown())
+        atexit.register(self.stopScheduledTask)
+        self.scheduler.start()
 
     def stopScheduledTask(self):
-        self.scheduler.shutdown()
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+
+    def runJob(self, name, func, interval):
+        """
+        Runs @func at most once per @interval across all jobs processes.  A
+        session-level advisory lock, held for the duration of the run,
+        excludes concurrent runs; under the lock, the run is skipped if
+        background_job_runs shows another process started it recently.  The
+        run's start, duration, and outcome are recorded there.
+        """
+        with self.db.engine.connect() as connection:
+            connection = connection.execution_options(autocommit=True)
+            locked = connection.execute(
+                text("SELECT pg_try_advisory_lock(hashtext(:key))"),
+                key=JOB_LOCK_PREFIX + name).scalar()
+            if not locked:
+                LOG.debug("job %s is running elsewhere; skipping", name)
+                return
+            try:
+                recent = connection.execute(text(
+                    "SELECT last_start > now() - make_interval(secs => :gap)"
+                    " FROM background_job_runs WHERE name = :name"),
+                    name=name, gap=interval * JOB_MIN_GAP_FRACTION).scalar()
+                if recent:
+                    LOG.debug("job %s ran recently elsewhere; skipping", name)
+                    return
+                connection.execute(text(
+                    "INSERT INTO background_job_runs (name, last_start, runs, failures)"
+                    " VALUES (:name, now(), 0, 0)"
+                    " ON CONFLICT (name) DO UPDATE SET last_start = excluded.last_start"),
+                    name=name)
+
+                start = time.time()
+                error = None
+                try:
+                    with self.app.app_context():
+                        func()
+                except:
+                    error = repr(sys.exc_info()[1])
+                    LOG.exception("job %s failed", name)
+                duration = time.time() - start
+
+                if error is None:
+                    connection.execute(text(
+                        "UPDATE background_job_runs SET last_success = now(),"
+                        "   last_duration = :duration, last_error = NULL,"
+                        "   runs = runs + 1"
+                        " WHERE name = :name"),
+                        name=name, duration=duration)
+                else:
+                    connection.execute(text(
+                        "UPDATE background_job_runs SET last_duration = :duration,"
+                        "   last_error = :error, runs = runs + 1,"
+                        "   failures = failures + 1"
+                        " WHERE name = :name"),
+                        name=name, duration=duration, error=error)
+                LOG.info("job %s %s in %.3fs", name,
+                         "succeeded" if error is None else "failed", duration)
+            finally:
+                connection.execute(
+                    text("SELECT pg_advisory_unlock(hashtext(:key))"),
+                    key=JOB_LOCK_PREFIX + name)
 
     def collectRecentViews(self):
-        # Garbage Collector used to empty recent_views database table and update the stats_views table periodically
+        """
+        Garbage Collector used to empty recent_views database table and
+        update the stats_views table periodically.  This is a single
+        set-based statement: it deletes the recent_views rows visible when
+        it starts (so views recorded meanwhile are kept for the next run)
+        and adds their per-(group, user) sums to stats_views, and their
+        per-(group, day) sums to stats_views_daily.  Returns the number of
+        recent views consumed and stats_views rows updated.
+        """
         LOG.debug('starting collect recent views task')
-        db = self.db
-        query = db.session.query(StatsRecentViews.artifact_group_id.label('artifact_group_id'), StatsRecentViews.user_id.label('user_id'), StatsRecentViews.view_count.label('view_count')).all()
+        start = time.time()
+        with self.db.engine.begin() as connection:
+            (consumed, updated) = connection.execute(text(
+                "WITH consumed AS ("
+                "   DELETE FROM recent_views"
+                "   RETURNING artifact_group_id, user_id, view_count, ctime"
+                " ), daily AS ("
+                "   INSERT INTO stats_views_daily (artifact_group_id, day, view_count)"
+                "   SELECT artifact_group_id, ctime::date, sum(view_count)"
+                "   FROM consumed GROUP BY artifact_group_id, ctime::date"
+                "   ON CONFLICT (artifact_group_id, day) DO UPDATE"
+                "     SET view_count = stats_views_daily.view_count + excluded.view_count"
+                " ), upserted AS ("
+                "   INSERT INTO stats_views (artifact_group_id, user_id, view_count)"
+                "   SELECT artifact_group_id, user_id, sum(view_count)"
+                "   FROM consumed GROUP BY artifact_group_id, user_id"
+                "   ON CONFLICT (artifact_group_id, (coalesce(user_id, 0))) DO UPDATE"
+                "     SET view_count = stats_views.view_count + excluded.view_count"
+                "   RETURNING 1"
+                " )"
+                " SELECT (SELECT count(*) FROM consumed), (SELECT count(*) FROM upserted)")).first()
+        LOG.info("collected %d recent views into %d stats_views rows in %.3fs",
+                 consumed, updated, time.time() - start)
+        return (consumed, updated)
 
-        self.addToStatsViews(query)
+    def refreshTrending(self):
+        """
+        Rebuilds artifact_trending from stats_views_daily: each group's
+        score is its daily views over the last TRENDING_WINDOW_DAYS days,
+        each weighted by exp(-ln 2 * age / TRENDING_HALF_LIFE_DAYS).  The
+        table is replaced in one transaction, so readers always see a
+        complete ranking.
+        """
+        LOG.debug('starting refresh trending task')
+        start = time.time()
+        with self.db.engine.begin() as connection:
+            connection.execute(text("DELETE FROM artifact_trending"))
+            res = connection.execute(text(
+                "INSERT INTO artifact_trending (artifact_group_id, score, computed_at)"
+                " SELECT artifact_group_id,"
+                "   sum(view_count * exp(-ln(2) * (current_date - day)::float8 / :half_life)),"
+                "   now()"
+                " FROM stats_views_daily"
+                " WHERE day > current_date - CAST(:window AS integer)"
+                " GROUP BY artifact_group_id"),
+                half_life=float(self.config['TRENDING_HALF_LIFE_DAYS']),
+                window=self.config['TRENDING_WINDOW_DAYS'])
+        LOG.info("refreshed %d trending artifact groups in %.3fs",
+                 res.rowcount, time.time() - start)
 
-        StatsRecentViews.query.delete()
-        db.session.commit()
-        
-        query = db.session.query(StatsArtifactViews.artifact_group_id, StatsArtifactViews.user_id, func.sum(StatsArtifactViews.view_count).label('view_count')).group_by(StatsArtifactViews.user_id).group_by(StatsArtifactViews.artifact_group_id).all()
-
-        StatsArtifactViews.query.delete()
-        db.session.commit()
-
-        self.addToStatsViews(query)
-
-    def addToStatsViews(self, query):
-        db = self.db
-        for row in query:
-            artifact_group_id, user_id, view_count = row
-            stats_views_entry = StatsArtifactViews(
-                        artifact_group_id=artifact_group_id, user_id=user_id, view_count=view_count
-                )
-            db.session.add(stats_views_entry)
-            db.session.commit()
+    def checkImporterHealth(self):
+        """
+        Polls all importer instances' /status and updates their status; see
+        check_importer_health.
+        """
+        results = check_importer_health(
+            max_workers=self.config['IMPORTER_HEALTH_WORKERS'],
+            timeout=self.config['IMPORTER_HEALTH_TIMEOUT'],
+            history_days=self.config['IMPORTER_HEALTH_HISTORY_DAYS'])
+        LOG.info("checked %d importers (%d up)",
+                 len(results), len([r for r in results if r["ok"]]))
+
+    def deleteOrphanFileContent(self, batch_size=1000):
+        """
+        Deletes file content that no artifact file or member references,
+        and that no import has stored or claimed for FILE_CONTENT_ORPHAN_TTL
+        seconds (see FileContent.touch), in batches of @batch_size.
+        Returns the number deleted.
+        """
+        LOG.debug('starting orphan file content cleanup task')
+        start = time.time()
+        deleted = 0
+        while True:
+            with self.db.engine.begin() as connection:
+                res = connection.execute(text(
+                    "DELETE FROM file_content WHERE id IN ("
+                    "   SELECT fc.id FROM file_content fc"
+                    "   WHERE fc.mtime < now() - make_interval(secs => :ttl)"
+                    "     AND NOT EXISTS (SELECT 1 FROM artifact_files af"
+                    "                     WHERE af.file_content_id = fc.id)"
+                    "     AND NOT EXISTS (SELECT 1 FROM artifact_file_members afm"
+                    "                     WHERE afm.file_content_id = fc.id)"
+                    "   LIMIT :limit"
+                    "   FOR UPDATE SKIP LOCKED)"),
+                    ttl=self.config['FILE_CONTENT_ORPHAN_TTL'], limit=batch_size)
+            deleted += res.rowcount
+            if res.rowcount < batch_size:
+                break
+        LOG.info("deleted %d orphan file contents in %.3fs",
+                 deleted, time.time() - start)
+        return deleted
 
     def create_key(self):
         key = secrets.token_urlsafe(64)[:64]
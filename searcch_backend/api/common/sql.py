@@ -5,6 +5,7 @@ import logging
 import json
 import sys
 import base64
+import collections
 import functools
 
 LOG = logging.getLogger(__name__)
@@ -494,7 +495,7 @@ def artifact_apply_curation(session, artifact, curation, update=True, skip_ids=T
                 value = object_from_json(
                     session,obj_class,value,skip_primary_keys=True,skip_tsv=True,
                     error_on_primary_key=False,allow_fk=False,enable_cache=True,
-                    should_query=False,never_query=True,obj_cache=None,obj_cache_dicts=None)
+                    should_query=False,never_query=True,obj_cache=None)
                 current = getattr(obj_with_field,field)
                 res = artifact_diff(
                     session, None, artifact, current, value, update=False, path=path,
@@ -519,7 +520,7 @@ def artifact_apply_curation(session, artifact, curation, update=True, skip_ids=T
             value = object_from_json(
                 session,obj_class,value,skip_primary_keys=True,skip_tsv=True,
                 error_on_primary_key=False,allow_fk=False,enable_cache=True,
-                should_query=False,never_query=False,obj_cache=None,obj_cache_dicts=None)
+                should_query=False,never_query=False,obj_cache=None)
 
             #deletes = []
             if op == "add":
@@ -766,19 +767,191 @@ def object_match(cls, session, skip_primary_keys=True,
     LOG.debug("object_match: returning %r", res)
     return res
 
+def object_cache_key(obj_class,j):
+    """
+    Returns object_from_json's cache key for the sub-document @j of
+    @obj_class: the class name and @j's canonical (sorted-key) JSON; or
+    None if @j cannot be serialized.
+    """
+    try:
+        return (obj_class.__name__,
+                json.dumps(j,sort_keys=True,separators=(",",":"),cls=CustomJSONEncoder))
+    except (TypeError,ValueError):
+        return None
+
+#
+# Sentinels for prefetch_object_matches: _NO_MATCH is cached for a
+# sub-document known to have no match in the DB (so object_from_json builds
+# it without querying); _WAIT marks one whose related sub-documents are not
+# yet resolved.
+#
+_NO_MATCH = object()
+_WAIT = object()
+
+def _collect_match_documents(obj_class,j,found):
+    """
+    Adds each sub-document of @j that object_from_json would try to match
+    (those reached through a many-to-one relationship) to @found, as
+    (class, sub-document), keyed by object_cache_key.
+    """
+    if not isinstance(j,dict):
+        return
+    for k in obj_class.__mapper__.relationships.keys():
+        relprop = getattr(obj_class,k).property
+        if relprop.backref or not k in j:
+            continue
+        foreign_class = relprop.argument()
+        if relprop.uselist:
+            if isinstance(j[k],list):
+                for x in j[k]:
+                    _collect_match_documents(foreign_class,x,found)
+            continue
+        if len(relprop.local_columns) == 1 \
+          and list(relprop.local_columns)[0].foreign_keys \
+          and isinstance(j[k],dict) \
+          and not getattr(foreign_class,"__json_never_query__",False):
+            key = object_cache_key(foreign_class,j[k])
+            if key is not None and key not in found:
+                found[key] = (foreign_class,j[k])
+        _collect_match_documents(foreign_class,j[k],found)
+
+def _match_columns(obj_class,j,obj_cache,pending):
+    """
+    Returns the (column, value) pairs that object_from_json would match the
+    sub-document @j of @obj_class on (for related objects, their foreign
+    key values); _WAIT if a related sub-document is still @pending; or None
+    if object_from_json would not query for it, or if we are unsure.
+    """
+    has_match = getattr(obj_class,"object_match",None) is not None
+    columns = []
+    for k in obj_class.__mapper__.column_attrs.keys():
+        colprop = getattr(obj_class,k).property.columns[0]
+        if not k in j or colprop.primary_key or k.endswith("_tsv"):
+            continue
+        if colprop.foreign_keys:
+            return None
+        v = j[k]
+        try:
+            python_type = colprop.type.python_type
+        except NotImplementedError:
+            return None
+        if not isinstance(v,python_type):
+            if python_type in conv_type_map \
+              and isinstance(v,conv_type_map[python_type]["valid"]):
+                try:
+                    v = conv_type_map[python_type]["parse"](v)
+                except:
+                    return None
+            elif colprop.nullable and v == None:
+                continue
+            else:
+                return None
+        if hasattr(colprop.type,"length") and colprop.type.length \
+          and len(v) > colprop.type.length:
+            return None
+        if isinstance(colprop.type,sqlalchemy.sql.sqltypes.Enum) \
+          and not v in colprop.type._enums_argument:
+            return None
+        if has_match and (k == "verified" or v in [None, [], {}]):
+            continue
+        columns.append((colprop,v))
+    for k in obj_class.__mapper__.relationships.keys():
+        relprop = getattr(obj_class,k).property
+        if relprop.backref:
+            if k in j:
+                return None
+            continue
+        if relprop.uselist:
+            # object_from_json only queries classes with an object_match
+            # method if they have list relations, and only if they are empty.
+            if not has_match or j.get(k):
+                return None
+            continue
+        if not k in j:
+            continue
+        (lcc,) = relprop.local_columns
+        if not lcc.foreign_keys or not isinstance(j[k],dict):
+            return None
+        key = object_cache_key(relprop.argument(),j[k])
+        if key in pending:
+            return _WAIT
+        related = obj_cache.get(key)
+        if related is None or related is _NO_MATCH:
+            return None
+        if has_match:
+            # object_match skips foreign keys, but still requires that
+            # related objects exist.
+            continue
+        ((local,remote),) = relprop.local_remote_pairs
+        columns.append((local,getattr(
+            related,sqlalchemy.inspect(related).mapper.get_property_by_column(remote).key)))
+    if not columns:
+        return None
+    return columns
+
+def prefetch_object_matches(session,obj_class,j,obj_cache,chunk_size=500):
+    """
+    Resolves all of @j's sub-documents that object_from_json would match
+    against existing objects, one query per class (and set of fields given)
+    rather than one per sub-document, and seeds @obj_cache with the matches
+    (or _NO_MATCH).  Sub-documents are resolved level by level, since a
+    match on e.g. an Affiliation needs its Person and Organization matched
+    first.  Anything this cannot resolve exactly as object_from_json would
+    is left uncached, for object_from_json to query as usual.
+    """
+    pending = collections.OrderedDict()
+    _collect_match_documents(obj_class,j,pending)
+    while pending:
+        groups = collections.OrderedDict()
+        for (key,(cls,d)) in list(pending.items()):
+            columns = _match_columns(cls,d,obj_cache,pending)
+            if columns is _WAIT:
+                continue
+            del pending[key]
+            if columns is None:
+                continue
+            sig = (cls,tuple([c for (c,v) in columns]))
+            groups.setdefault(sig,[]).append((key,tuple([v for (c,v) in columns])))
+        if not groups:
+            # Nothing became resolvable; leave the rest to object_from_json.
+            break
+        for ((cls,cols),docs) in groups.items():
+            mapper = sqlalchemy.inspect(cls)
+            attrs = [ mapper.get_property_by_column(c).key for c in cols ]
+            matches = dict()
+            values = list(set([ v for (key,v) in docs ]))
+            for i in range(0,len(values),chunk_size):
+                chunk = values[i:i+chunk_size]
+                if len(cols) == 1:
+                    cond = cols[0].in_([ v[0] for v in chunk ])
+                else:
+                    cond = sqlalchemy.tuple_(*cols).in_(chunk)
+                q = session.query(cls).filter(cond)
+                if getattr(cls,"object_match",None) is not None:
+                    q = q.filter(cls.verified == True)
+                for row in q.order_by(*mapper.primary_key).all():
+                    matches.setdefault(tuple([ getattr(row,a) for a in attrs ]),row)
+            for (key,v) in docs:
+                obj_cache[key] = matches.get(v,_NO_MATCH)
+            LOG.debug("prefetch_object_matches: %s: %d documents, %d matches",
+                      cls.__name__,len(docs),len(matches))
+
 def object_from_json(session,obj_class,j,skip_primary_keys=True,skip_tsv=True,
                      error_on_primary_key=False,allow_fk=False,enable_cache=True,
-                     should_query=True,never_query=False,obj_cache=None,obj_cache_dicts=None):
+                     should_query=True,never_query=False,obj_cache=None,prefetch=True):
     """
     This function provides hierarchical construction of sqlalchemy objects from JSON.  It handles regular fields and handles recursion ("hierarchy") through relationships.  We use the term hierarchy in the sense that an Artifact may have one or more curations associated with it; so perhaps, less a hierarchy than a tree; but we represent the relationships as children in JSON.  If such "children" have an existing match in the DB, we link those objects directly in (NB: this needs to change to handle permissions or places where we don't want to create a link to existing objects, because the owner needs to ack, or whatever).
     """
     obj_kwargs = dict()
 
-    if enable_cache:
-        if obj_cache is None:
-            obj_cache = []
-        if obj_cache_dicts is None:
-            obj_cache_dicts = []
+    # Objects already built for (or matched to) identical sub-documents of
+    # this document, keyed by object_cache_key.  At the top level, first
+    # match all sub-documents in a few batched queries.
+    if enable_cache and obj_cache is None:
+        obj_cache = dict()
+        if prefetch and not never_query and skip_primary_keys and not allow_fk \
+          and isinstance(j,dict):
+            prefetch_object_matches(session,obj_class,j,obj_cache)
 
     if j == None:
         LOG.debug("object_from_json: null: %r <- %r" % (obj_class,j))
@@ -884,25 +1057,29 @@ def object_from_json(session,obj_class,j,skip_primary_keys=True,skip_tsv=True,
             if k in j:
                 # Then we need to look for existing objects that match this
                 # one, and reference them if they exist.  We look in our cache
-                # and in the session.
-                if obj_cache and obj_cache_dicts:
-                    try:
-                        cached = obj_cache_dicts.index(j[k])
-                        obj_kwargs[k] = obj_cache[cached]
-                        LOG.debug("object_from_json(cache-hit,%r)",j[k])
-                        continue
-                    except:
-                        pass
+                # and in the session.  The cache key must be computed before
+                # recursing, since that parses values in j[k] in place.
                 foreign_class = relprop.argument()
+                cache_key = None
+                next_should_query = True
+                if obj_cache is not None:
+                    cache_key = object_cache_key(foreign_class,j[k])
+                    if cache_key is not None and cache_key in obj_cache:
+                        if obj_cache[cache_key] is _NO_MATCH:
+                            # Prefetched, and known not to exist.
+                            next_should_query = False
+                        else:
+                            obj_kwargs[k] = obj_cache[cache_key]
+                            LOG.debug("object_from_json(cache-hit,%r)",j[k])
+                            continue
                 next_obj = object_from_json(
                     session,foreign_class,j[k],skip_primary_keys=skip_primary_keys,
-                    error_on_primary_key=error_on_primary_key,should_query=True,
+                    error_on_primary_key=error_on_primary_key,should_query=next_should_query,
                     never_query=never_query,allow_fk=allow_fk,enable_cache=enable_cache,
-                    obj_cache=obj_cache,obj_cache_dicts=obj_cache_dicts)
+                    obj_cache=obj_cache)
                 obj_kwargs[k] = next_obj
-                if obj_cache:
-                    obj_cache.append(next_obj)
-                    obj_cache_dicts.append(j[k])
+                if cache_key is not None:
+                    obj_cache[cache_key] = next_obj
                 continue
         else:
             # This is a relationship into another table via a key in our
@@ -917,21 +1094,22 @@ def object_from_json(session,obj_class,j,skip_primary_keys=True,skip_tsv=True,
                     session,relprop.argument(),x,skip_primary_keys=skip_primary_keys,
                     error_on_primary_key=error_on_primary_key,should_query=False,
                     never_query=never_query,allow_fk=allow_fk,enable_cache=enable_cache,
-                    obj_cache=obj_cache,obj_cache_dicts=obj_cache_dicts)
+                    obj_cache=obj_cache)
                 obj_kwargs[k].append(next_obj)
         else:
             next_obj = object_from_json(
                 session,relprop.argument(),j[k],skip_primary_keys=skip_primary_keys,
                 error_on_primary_key=error_on_primary_key,should_query=False,
                 never_query=never_query,allow_fk=allow_fk,enable_cache=enable_cache,
-                obj_cache=obj_cache,obj_cache_dicts=obj_cache_dicts)
+                obj_cache=obj_cache)
             obj_kwargs[k] = next_obj
 
     # Query the DB iff all top-level obj_kwargs are basic types or persistent
     # objects, and if our parent told us we should query.
     LOG.debug("object_from_json: %s.query(never_query=%r,should_query=%r)",
               obj_class.__name__, never_query, should_query)
-    if not never_query and should_query:
+    if not never_query and should_query \
+      and not getattr(obj_class,"__json_never_query__",False):
         can_query = True
         for kwa in list(obj_kwargs):
             if isinstance(obj_kwargs[kwa],list) and \
@@ -968,9 +1146,6 @@ def object_from_json(session,obj_class,j,skip_primary_keys=True,skip_tsv=True,
             LOG.debug("object_from_json: %s.query qres=%r",
                       obj_class.__name__, qres)
         if qres:
-            if obj_cache:
-                obj_cache.append(qres)
-                obj_cache_dicts.append(j)
             if qres in session:
                 LOG.debug("object_from_json(in=True,query): %r",qres)
             else:
@@ -987,11 +1162,17 @@ def object_from_json(session,obj_class,j,skip_primary_keys=True,skip_tsv=True,
 
 jsontypes = (dict,list,tuple,str,int,float,bool,type(None))
 
-def object_to_json(o,recurse=True,skip_ids=True,skip_tsv=True):
+def object_to_json(o,recurse=True,skip_ids=True,skip_tsv=True,
+                   skip_deferred=False):
+    """
+    Returns @o's JSON.  If @skip_deferred, deferred columns that are not
+    loaded (e.g. FileContent.content) are left out rather than loaded.
+    """
     if not isinstance(o,db.Model):
         raise ValueError("object %r not an instance of our model.Base" % (o))
 
     j = {}
+    unloaded = sqlalchemy.inspect(o).unloaded if skip_deferred else ()
 
     for k in o.__class__.__mapper__.column_attrs.keys():
         colprop = getattr(o.__class__,k).property.columns[0]
@@ -999,6 +1180,8 @@ def object_to_json(o,recurse=True,skip_ids=True,skip_tsv=True):
             continue
         if skip_tsv and k.endswith("_tsv"):
             continue
+        if k in unloaded and getattr(o.__class__,k).property.deferred:
+            continue
         v = getattr(o,k,"")
         if v is None:
             continue
@@ -1022,12 +1205,15 @@ def object_to_json(o,recurse=True,skip_ids=True,skip_tsv=True):
             nl = []
             for x in v:
                 if isinstance(x,db.Model):
-                    nl.append(object_to_json(x,recurse=recurse,skip_ids=skip_ids))
+                    nl.append(object_to_json(
+                        x,recurse=recurse,skip_ids=skip_ids,
+                        skip_deferred=skip_deferred))
                 else:
                     nl.append(x)
             v = nl
         elif isinstance(v,db.Model):
-            v = object_to_json(v,recurse=recurse,skip_ids=skip_ids)
+            v = object_to_json(
+                v,recurse=recurse,skip_ids=skip_ids,skip_deferred=skip_deferred)
         elif isinstance(v,bytes):
             v = v.decode('utf-8')
         elif not isinstance(v,jsontypes):
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+#
+# Micro-benchmark for object_from_json over a synthetic artifact document
+# with many children whose nested persons and organizations repeat, as in
+# large importer payloads.  Builds objects without querying the database
+# (never_query), so only needs the app's configuration:
+#
+#   python3 -m searcch_backend.api.common.sql_bench --children 5000
+#
+# Each run builds the document at full and at quarter size; the time
+# should scale linearly with the number of children.  Exits nonzero if the
+# full-size run takes more than --max-ratio times the quarter-size run.
+#
+
+import argparse
+import datetime
+import sys
+import time
+
+
+def make_document(children, distinct=250):
+    """
+    Returns an artifact document with @children children: half
+    affiliations (of @distinct persons and organizations, each repeated),
+    a quarter tags, and a quarter metadata.
+    """
+    naffiliations = children // 2
+    ntags = children // 4
+    nmeta = children - naffiliations - ntags
+    affiliations = []
+    for i in range(naffiliations):
+        p = i % distinct
+        affiliations.append(dict(
+            roles=("Author", "ContactPerson", "Other")[i % 3],
+            affiliation=dict(
+                person=dict(name="Person %d" % (p,),
+                            email="person%d@example.org" % (p,)),
+                org=dict(name="Organization %d" % (p % 50,), type="Institution"))))
+    return dict(
+        type="software", url="https://github.com/example/bench",
+        title="object_from_json benchmark",
+        ctime=datetime.datetime.now().isoformat(),
+        tags=[ dict(tag="tag%d" % (i,), source="bench") for i in range(ntags) ],
+        meta=[ dict(name="meta%d" % (i,), value="value %d" % (i,), source="bench")
+               for i in range(nmeta) ],
+        affiliations=affiliations)
+
+
+def run(children):
+    # Import the app before anything from models, to avoid the circular
+    # import through searcch_backend.models.model.
+    import searcch_backend.api.app
+    from sqlalchemy.orm import Session
+    from searcch_backend.models.model import Artifact
+    from searcch_backend.api.common.sql import object_from_json
+
+    j = make_document(children)
+    obj_cache = dict()
+    start = time.perf_counter()
+    artifact = object_from_json(
+        Session(), Artifact, j, skip_primary_keys=True, never_query=True,
+        obj_cache=obj_cache)
+    elapsed = time.perf_counter() - start
+    assert len(artifact.affiliations) == children // 2
+    return (elapsed, len(obj_cache))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark object_from_json on a synthetic artifact document.")
+    parser.add_argument("--children", type=int, default=5000)
+    parser.add_argument("--max-ratio", type=float, default=6.0,
+                        help="fail if the full-size run takes more than this"
+                             " many times the quarter-size run (linear is 4)")
+    args = parser.parse_args()
+
+    (small, _) = run(args.children // 4)
+    (full, cached) = run(args.children)
+    ratio = full / small
+    print("children=%d: %.3fs (%.1fus/child), %d cached sub-objects;"
+          " quarter size: %.3fs; ratio %.2f" % (
+              args.children, full, full * 1e6 / args.children, cached,
+              small, ratio))
+    if ratio > args.max_ratio:
+        print("superlinear: ratio %.2f > %.2f" % (ratio, args.max_ratio),
+              file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,140 @@
 # logic for stat collection
 
-from searcch_backend.api.app import db, config_name
+from searcch_backend.api.app import db, config_name, config
 from searcch_backend.api.common.auth import verify_api_key
-from searcch_backend.models.model import Sessions, StatsRecentViews
-from sqlalchemy import func, asc, desc, sql, and_, or_
+from searcch_backend.models.model import StatsSearches
+from sqlalchemy import func, asc, desc, sql, or_
+from sqlalchemy.sql import text
+import atexit
+import collections
 import logging
+import os
+import sys
+import threading
 
 LOG = logging.getLogger(__name__)
 
+class AnalyticsBuffer(object):
+    """
+    A per-process write-behind buffer for non-critical analytics events
+    (search terms and artifact views), so that request handlers never write
+    them inline.  Events are flushed by a background thread in multi-row
+    INSERTs, once @batch_size events are pending or every @flush_interval
+    seconds, and on process exit.  At most @max_events are held; beyond
+    that, and on write errors, events are dropped and counted in
+    self.dropped.
+    """
+
+    def __init__(self, max_events=10000, batch_size=500, flush_interval=5):
+        self.max_events = max_events
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.flushed = 0
+        self._searches = collections.deque()
+        self._views = collections.deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def record_search(self, search_term):
+        if not search_term:
+            return
+        self._append(self._searches, search_term[:512])
+
+    def record_view(self, session_id, artifact_group_id):
+        self._append(self._views, (session_id, artifact_group_id))
+
+    def _append(self, queue, event):
+        with self._lock:
+            if len(self._searches) + len(self._views) >= self.max_events:
+                self.dropped += 1
+                if self.dropped % 1000 == 1:
+                    LOG.warning("analytics buffer full; dropped %d events so far",
+                                self.dropped)
+                return
+            queue.append(event)
+            pending = len(self._searches) + len(self._views)
+        self._maybe_start()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def _maybe_start(self):
+        # Started lazily so that each forked worker gets its own thread.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="analytics_flush", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except:
+                LOG.exception(sys.exc_info()[1])
+
+    def flush(self):
+        """Writes out all buffered events, one batch at a time."""
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    searches = [self._searches.popleft()
+                                for i in range(min(self.batch_size, len(self._searches)))]
+                    views = [self._views.popleft()
+                             for i in range(min(self.batch_size, len(self._views)))]
+                if not searches and not views:
+                    return
+                try:
+                    self._write(searches, views)
+                    self.flushed += len(searches) + len(views)
+                except:
+                    self.dropped += len(searches) + len(views)
+                    LOG.exception(sys.exc_info()[1])
+
+    def _write(self, searches, views):
+        with db.engine.begin() as connection:
+            if searches:
+                connection.execute(
+                    StatsSearches.__table__.insert().values(
+                        [dict(search_term=s) for s in searches]))
+            if views:
+                # Record at most one recent view per (session, artifact
+                # group), as recordView always has.
+                views = list(collections.OrderedDict.fromkeys(views))
+                values = []
+                params = {}
+                for (i, (session_id, artifact_group_id)) in enumerate(views):
+                    values.append("(:s%d, CAST(:g%d AS integer))" % (i, i))
+                    params["s%d" % (i,)] = session_id
+                    params["g%d" % (i,)] = artifact_group_id
+                connection.execute(text(
+                    "INSERT INTO recent_views"
+                    "   (session_id, artifact_group_id, user_id, view_count)"
+                    " SELECT V.session_id, V.artifact_group_id, S.user_id, 1"
+                    " FROM (VALUES %s) AS V(session_id, artifact_group_id)"
+                    " JOIN artifact_groups AG ON AG.id = V.artifact_group_id"
+                    " LEFT JOIN sessions S ON S.sso_token = V.session_id"
+                    " WHERE NOT EXISTS ("
+                    "     SELECT 1 FROM recent_views R"
+                    "     WHERE R.session_id = V.session_id"
+                    "       AND R.artifact_group_id = V.artifact_group_id)" % (
+                        ", ".join(values),)), params)
+
+analytics_buffer = AnalyticsBuffer(
+    max_events=config.get("ANALYTICS_BUFFER_MAX_EVENTS", 10000),
+    batch_size=config.get("ANALYTICS_FLUSH_BATCH_SIZE", 500),
+    flush_interval=config.get("ANALYTICS_FLUSH_INTERVAL", 5))
+atexit.register(analytics_buffer.flush)
+
 class StatsResource():
 
     def __init__(self, artifact_group_id, session_id):
@@ -15,15 +142,4 @@ class StatsResource():
         self.session_id = session_id
 
     def recordView(self):
-        query = db.session.query(StatsRecentViews).filter(and_(StatsRecentViews.session_id == self.session_id, StatsRecentViews.artifact_group_id == self.artifact_group_id)).first()
-        if query is None:
-            query = db.session.query(Sessions).filter(Sessions.sso_token == self.session_id).first()
-            if query is not None:
-                user_id = query.user_id
-            else:
-                user_id = None
-            stats_recent_view = StatsRecentViews(
-                        session_id=self.session_id, artifact_group_id=self.artifact_group_id, user_id=user_id, view_count=1
-                )
-            db.session.add(stats_recent_view)
-            db.session.commit()
+        analytics_buffer.record_view(self.session_id, self.artifact_group_id)
@@ -0,0 +1,117 @@
+# logic for streaming multipart uploads
+
+import flask
+import hashlib
+import tempfile
+
+#
+# File parts of multipart requests are spooled: held in memory up to this
+# many bytes (or the app's UPLOAD_SPOOL_MAX_MEMORY), then in a temporary
+# file.
+#
+DEFAULT_SPOOL_MAX_MEMORY = 1024 * 1024
+
+
+class HashingSpooledFile(object):
+    """
+    A SpooledTemporaryFile that computes the SHA-256 digest and size of
+    what is written to it, so that uploaded parts are hashed as they stream
+    in, rather than read back afterwards.  Aborts (413) a write that would
+    make it larger than @max_size bytes, if given.
+    """
+
+    def __init__(self, max_memory=DEFAULT_SPOOL_MAX_MEMORY, max_size=None):
+        self.file = tempfile.SpooledTemporaryFile(max_size=max_memory, mode="w+b")
+        self.hash = hashlib.sha256()
+        self.size = 0
+        self.max_size = max_size
+
+    def write(self, b):
+        if self.max_size and self.size + len(b) > self.max_size:
+            flask.abort(413, description="file content larger than %d bytes" % (
+                self.max_size,))
+        self.hash.update(b)
+        self.size += len(b)
+        return self.file.write(b)
+
+    def digest(self):
+        return self.hash.digest()
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+class SearcchRequest(flask.Request):
+    """
+    Our request class: streams multipart file parts into HashingSpooledFiles,
+    each capped at FILE_CONTENT_MAX_SIZE bytes: a part whose declared length
+    exceeds that is refused (413) before it is read, and any other once it
+    does.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type,
+                         filename=None, content_length=None):
+        config = flask.current_app.config
+        max_size = config.get("FILE_CONTENT_MAX_SIZE")
+        if max_size and content_length and content_length > max_size:
+            flask.abort(413, description="file content larger than %d bytes" % (
+                max_size,))
+        return HashingSpooledFile(
+            config.get("UPLOAD_SPOOL_MAX_MEMORY", DEFAULT_SPOOL_MAX_MEMORY),
+            max_size=max_size)
+
+
+def spool_request_body(max_size=None, chunk_size=65536):
+    """
+    Returns the current request's body, streamed into a HashingSpooledFile
+    (rewound) a chunk at a time; aborts (413) before reading if its
+    Content-Length exceeds @max_size, and while reading once more than
+    @max_size bytes have arrived (e.g. of a chunked body).
+    """
+    request = flask.request
+    if max_size and request.content_length and request.content_length > max_size:
+        flask.abort(413, description="file content larger than %d bytes" % (
+            max_size,))
+    spool = HashingSpooledFile(
+        flask.current_app.config.get(
+            "UPLOAD_SPOOL_MAX_MEMORY", DEFAULT_SPOOL_MAX_MEMORY),
+        max_size=max_size)
+    while True:
+        chunk = request.stream.read(chunk_size)
+        if not chunk:
+            break
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+def part_digest(part):
+    """
+    Returns the (SHA-256 digest, size) of the uploaded @part (a
+    werkzeug FileStorage), hashing it now if it was not streamed into a
+    HashingSpooledFile.
+    """
+    if isinstance(part.stream, HashingSpooledFile):
+        return (part.stream.digest(), part.stream.size)
+    m = hashlib.sha256()
+    size = 0
+    part.stream.seek(0)
+    while True:
+        chunk = part.stream.read(65536)
+        if not chunk:
+            break
+        m.update(chunk)
+        size += len(chunk)
+    return (m.digest(), size)
+
+
+def part_content_id(part, name):
+    """
+    Returns the id an artifact document uses to reference the uploaded
+    @part: its Content-ID header (without angle brackets), else its form
+    field @name.
+    """
+    cid = (part.headers.get("Content-ID") or "").strip()
+    if cid.startswith("<") and cid.endswith(">"):
+        cid = cid[1:-1]
+    return cid or name
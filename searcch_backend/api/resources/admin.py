@@ -5,7 +5,8 @@ from searcch_backend.models.model import *
 from searcch_backend.models.schema import *
 from flask import abort, jsonify, request
 from flask_restful import reqparse, Resource
-from searcch_backend.api.common.auth import (verify_api_key, verify_token)
+from searcch_backend.api.common.auth import (
+    verify_api_key, verify_token, invalidate_user_sessions)
 import logging
 
 LOG = logging.getLogger(__name__)
@@ -52,6 +53,7 @@ class AdminUpdatePrivileges(Resource):
                     abort(400, description='invalid user_id')
                 user.can_admin = True if can_admin == 't' else False
                 db.session.commit()
+                invalidate_user_sessions(user.id)
                 response = jsonify({'message': 'admin privileges updated'})
         else:
             abort(400, description='invalid request')
@@ -59,3 +61,25 @@ class AdminUpdatePrivileges(Resource):
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.status_code = 200
         return response
+
+
+class AdminJobsAPI(Resource):
+    """
+    Exports the last run of each background job (searcch-jobs): start and
+    success times, duration, and error, if any.
+    """
+
+    def get(self):
+        verify_api_key(request)
+        login_session = verify_token(request)
+        if not login_session.is_admin:
+            abort(401, description="unauthorized")
+
+        runs = db.session.query(BackgroundJobRun)\
+            .order_by(BackgroundJobRun.name)\
+            .all()
+
+        response = jsonify({"jobs": BackgroundJobRunSchema(many=True).dump(runs)})
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.status_code = 200
+        return response
@@ -5,20 +5,21 @@ from searcch_backend.api.common.sql import (
     object_from_json, artifact_diff, artifact_clone,
     artifact_apply_curation)
 from searcch_backend.api.common.auth import (verify_api_key, has_api_key, has_token, verify_token)
-from searcch_backend.api.common.importer import schedule_import
+from searcch_backend.api.common.importer import wake_import_scheduler
+from searcch_backend.api.common.ingest import artifact_file_content_holders
 from searcch_backend.api.common.stats import StatsResource
+from searcch_backend.api.common.pagination import (TOTAL_MODES, paginate)
 from searcch_backend.models.model import *
 from searcch_backend.models.schema import *
 from flask import abort, jsonify, request, make_response, Blueprint, url_for, Response, render_template
 from flask_restful import reqparse, Resource, fields, marshal
 import sqlalchemy
-from sqlalchemy import func, desc, asc, sql, and_, or_, not_, distinct
+from sqlalchemy import desc, asc, sql, and_, or_, not_, distinct
 import datetime
 import json
 import sys
 import logging
 import math
-import threading
 from flask_mail import Message
 
 LOG = logging.getLogger(__name__)
@@ -178,6 +179,17 @@ class ArtifactIndexAPI(Resource):
             data = data["artifact"]
         artifact = object_from_json(db.session, Artifact, data, skip_primary_keys=True,
                                     error_on_primary_key=False, allow_fk=True)
+        # File content must be given in full: only imports may reference
+        # stored content by hash (or id) alone.
+        holders = artifact_file_content_holders(artifact)
+        for holder in holders:
+            if holder.file_content is None and holder.file_content_id is not None:
+                abort(400, description="file content must include its content")
+        try:
+            FileContent.dedupe(db.session, holders)
+        except ValueError as ex:
+            db.session.rollback()
+            abort(400, description=str(ex))
         if not artifact.ctime:
             artifact.ctime = datetime.datetime.now()
         if login_session:
@@ -314,9 +326,9 @@ class ArtifactAPI(Resource):
                              or login_session.is_admin)):
                     abort(400, description="insufficient permission to access artifact")
 
-        # get average rating for the artifact, number of ratings
-        rating_aggregates = db.session.query(ArtifactRatings.artifact_group_id, func.count(ArtifactRatings.id).label('num_ratings'), func.avg(
-            ArtifactRatings.rating).label('avg_rating')).filter(ArtifactRatings.artifact_group_id == artifact_group.id).group_by("artifact_group_id").all()
+        # get average rating for the artifact, number of ratings and reviews
+        group_stats = db.session.query(ArtifactGroupStats).filter(
+            ArtifactGroupStats.artifact_group_id == artifact_group.id).first()
 
         ratings = db.session.query(ArtifactRatings, ArtifactReviews).join(ArtifactReviews, and_(
             ArtifactRatings.user_id == ArtifactReviews.user_id,
@@ -332,9 +344,9 @@ class ArtifactAPI(Resource):
 
         response = jsonify({
             "artifact": ArtifactSchema().dump(artifact),
-            "avg_rating": float(rating_aggregates[0][2]) if rating_aggregates else None,
-            "num_ratings": rating_aggregates[0][1] if rating_aggregates else 0,
-            "num_reviews": len(ratings) if ratings else 0,
+            "avg_rating": float(group_stats.avg_rating) if group_stats and group_stats.num_ratings else None,
+            "num_ratings": group_stats.num_ratings if group_stats else 0,
+            "num_reviews": group_stats.num_reviews if group_stats else 0,
             "rating_review": [{
                 "rating": ArtifactRatingsSchema(only=("rating",)).dump(rating), 
                 "review": ArtifactReviewsSchema(exclude=("artifact_group_id", "user_id")).dump(review)
@@ -434,6 +446,12 @@ class ArtifactAPI(Resource):
                         repr(sys.exc_info()[1])))
                 if not mod_artifact:
                     abort(400, description="cannot parse updated artifact")
+                # New file content must be given in full, as in post.
+                try:
+                    FileContent.check_new(artifact_file_content_holders(mod_artifact))
+                except ValueError as ex:
+                    db.session.rollback()
+                    abort(400, description=str(ex))
 
                 curations = None
                 try:
@@ -702,7 +720,7 @@ class ArtifactAPI(Resource):
             db.session.refresh(ai)
 
             LOG.debug("scheduling %r" % (ai,))
-            threading.Thread(target=schedule_import,name="schedule_import").start()
+            wake_import_scheduler()
 
             response = jsonify({"artifact_import": ArtifactImportSchema().dump(ai)})
         else:
@@ -1041,6 +1059,10 @@ class ArtifactOwnerRequestsAPI(Resource):
         self.getparse.add_argument(
             name="items_per_page", type=int, required=False, default=20,
             help="results per page if paginated")
+        self.getparse.add_argument(
+            name="total", type=str, required=False, default="exact",
+            choices=TOTAL_MODES,
+            help="bad total mode: {error_msg}")
         self.getparse.add_argument(
             name="user", type=str, required=False, default="",
             help="user id/name")
@@ -1131,8 +1153,8 @@ class ArtifactOwnerRequestsAPI(Resource):
         if "page" in args and args["page"]:
             if args["items_per_page"] <= 0:
                 args["items_per_page"] = sys.maxsize
-            pagination = artifact_owner_requests.paginate(
-                page=args["page"], error_out=False, per_page=args["items_per_page"])
+            pagination = paginate(
+                artifact_owner_requests, args["page"], args["items_per_page"], total=args["total"])
             artifact_owner_requests = pagination.items
         else:
             artifact_owner_requests = artifact_owner_requests.all()
@@ -1141,9 +1163,7 @@ class ArtifactOwnerRequestsAPI(Resource):
             "artifact_owner_requests": ArtifactOwnerRequestSchema(many=True).dump(artifact_owner_requests)
         }
         if pagination:
-            response_dict["page"] = pagination.page
-            response_dict["total"] = pagination.total
-            response_dict["pages"] = int(math.ceil(pagination.total / args["items_per_page"]))
+            response_dict.update(pagination.as_dict())
 
         response = jsonify(response_dict)
 
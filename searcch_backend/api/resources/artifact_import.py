@@ -1,31 +1,70 @@
+import base64
+import collections
 import datetime
 import dateutil.parser
+import json
 import logging
 import sys
-import threading
 import traceback
-import math
 
-import sqlalchemy
 from sqlalchemy import asc, desc, sql, not_, or_
+from sqlalchemy.sql import text
 from flask import abort, jsonify, request, Response, Blueprint
 from flask_restful import reqparse, Resource, fields, marshal
 
 from searcch_backend.models.model import (
     ArtifactImport, ImporterSchedule, ImporterInstance,
-    ArtifactGroup, Artifact, User, Person,
+    User, Person, FileContent, ArtifactImportFileContent,
     ARTIFACT_IMPORT_TYPES,
     ARTIFACT_IMPORT_STATUSES, ARTIFACT_IMPORT_PHASES )
 from searcch_backend.models.schema import (
     ArtifactImportSchema, ArtifactImportWithCandidatesSchema,
     ArtifactRelationship, CandidateArtifact )
-from searcch_backend.api.app import db, config_name
+from searcch_backend.api.app import db, app, config_name
 from searcch_backend.api.common.auth import (verify_api_key, verify_token, has_token)
-from searcch_backend.api.common.importer import schedule_import
-from searcch_backend.api.common.sql import object_from_json
+from searcch_backend.api.common.importer import (
+    wake_import_scheduler, record_phase_transition, normalize_import_url,
+    import_reuse_key, find_reusable_imports, reusable_artifact_json)
+from searcch_backend.api.common.ingest import (
+    ImportMaterializeError, materialize_import_artifact,
+    ingest_import_artifact, wake_import_ingester)
+from searcch_backend.api.common.pagination import (TOTAL_MODES, paginate)
+from searcch_backend.api.common.upload import (
+    part_digest, part_content_id, spool_request_body)
+from searcch_backend.api.resources.file_content import published_contents
 
 LOG = logging.getLogger(__name__)
 
+def reuse_import(artifact_import, source):
+    """
+    Completes the (committed) @artifact_import with a copy of the artifact
+    of @source, a recently-completed import of the same source, instead of
+    dispatching it to an importer.  Returns the new artifact; or None if
+    the copy failed, in which case the import is scheduled as usual and
+    the caller must wake the scheduler.
+    """
+    dt = datetime.datetime.now()
+    artifact_json = reusable_artifact_json(source.artifact)
+    artifact_import.phase_time = dt
+    artifact_import.mtime = dt
+    artifact_import.message = "reused the results of import %d" % (source.id,)
+    artifact_import.reused_import_id = source.id
+    ArtifactImportFileContent.grant_artifact(
+        db.session, artifact_import.id, source.artifact_id)
+    try:
+        return materialize_import_artifact(artifact_import, artifact_json)
+    except ImportMaterializeError:
+        LOG.warning("failed to reuse %r for %r; scheduling", source, artifact_import)
+    artifact_import.status = "pending"
+    artifact_import.phase = "start"
+    artifact_import.phase_time = None
+    artifact_import.message = None
+    artifact_import.reused_import_id = None
+    db.session.add(ImporterSchedule(artifact_import=artifact_import))
+    db.session.commit()
+    return None
+
+
 class ArtifactImportResourceRoot(Resource):
 
     def __init__(self):
@@ -55,6 +94,9 @@ class ArtifactImportResourceRoot(Resource):
             name="type", type=str, required=False,
             help="A specific type of artifact; defaults to `unknown`; one of (%s)" % (
                 ",".join(ARTIFACT_IMPORT_TYPES)))
+        self.postparse.add_argument(
+            name="force", type=bool, required=False, default=False,
+            help="If True, always run an importer, rather than reusing a recent import of the same URL.")
 
         self.getparse = reqparse.RequestParser()
         self.getparse.add_argument(
@@ -75,6 +117,10 @@ class ArtifactImportResourceRoot(Resource):
         self.getparse.add_argument(
             name="items_per_page", type=int, required=False, default=10,
             help="results per page if paginated")
+        self.getparse.add_argument(
+            name="total", type=str, required=False, default="exact",
+            choices=TOTAL_MODES,
+            help="bad total mode: {error_msg}")
         self.getparse.add_argument(
             name="sort", type=str, required=False, default="id",
             choices=("id", "url", "ctime", "status", "artifact_id"),
@@ -127,8 +173,8 @@ class ArtifactImportResourceRoot(Resource):
         if "page" in args and args["page"]:
             if args["items_per_page"] <= 0:
                 args["items_per_page"] = sys.maxsize
-            pagination = artifact_imports.paginate(
-                page=args["page"], error_out=False, per_page=args["items_per_page"])
+            pagination = paginate(
+                artifact_imports, args["page"], args["items_per_page"], total=args["total"])
             artifact_imports = pagination.items
         else:
             artifact_imports = artifact_imports.all()
@@ -138,9 +184,7 @@ class ArtifactImportResourceRoot(Resource):
                 many=True).dump(artifact_imports)
         }
         if pagination:
-            response_dict["page"] = pagination.page
-            response_dict["total"] = pagination.total
-            response_dict["pages"] = int(math.ceil(pagination.total / args["items_per_page"]))
+            response_dict.update(pagination.as_dict())
 
         response = jsonify(response_dict)
         response.status_code = 200
@@ -149,7 +193,7 @@ class ArtifactImportResourceRoot(Resource):
 
     def post(self):
         """
-        This is the primary artifact creation method.  It takes as input a URL, the uid, and possibly a specific importer to use.  It creates a temporary import session once handed off to the importer, and the frontend then polls based off the import session for completion of the import.  This is asynchronous, and returns an import session ID, if sanity checks succeed (e.g., an importer of the given name (if any) exists, rate limits are within tolerances, etc).  Note that the initial checks do *not* include URL reachability, since URLs may not all be reachable nor veriable over a basic HTTP(S) connection; the importer module must handle this case.  Finally, we cannot wait for the importer to do this reachability check, because there might be a queue of imports already being processed.
+        This is the primary artifact creation method.  It takes as input a URL, the uid, and possibly a specific importer to use.  It creates a temporary import session once handed off to the importer, and the frontend then polls based off the import session for completion of the import.  This is asynchronous, and returns an import session ID, if sanity checks succeed (e.g., an importer of the given name (if any) exists, rate limits are within tolerances, etc).  Note that the initial checks do *not* include URL reachability, since URLs may not all be reachable nor veriable over a basic HTTP(S) connection; the importer module must handle this case.  Finally, we cannot wait for the importer to do this reachability check, because there might be a queue of imports already being processed.  Unless force is set, if an importer completed an import of the same (normalized) URL, with the same importer and options, within the last IMPORT_REUSE_TTL seconds, this import is instead completed immediately with a copy of that import's artifact.
         """
         verify_api_key(request)
         login_session = verify_token(request)
@@ -179,6 +223,7 @@ class ArtifactImportResourceRoot(Resource):
             args["url"] = ca.url
         if "candidate_artifact_id" in args:
             del args["candidate_artifact_id"]
+        force = args.pop("force", False)
 
         res = db.session.query(ArtifactImport).\
           filter(ArtifactImport.url == args["url"]).\
@@ -192,17 +237,31 @@ class ArtifactImportResourceRoot(Resource):
         dt = datetime.datetime.now()
         ai = ArtifactImport(
             **args,owner_id=login_session.user_id,ctime=dt,mtime=dt,status="pending",
-            phase="start",archived=False)
-        ims = ImporterSchedule(artifact_import=ai)
+            phase="start",archived=False,normalized_url=normalize_import_url(args["url"]))
+
+        # If another user imported this source recently, copy their
+        # artifact instead of dispatching to an importer.
+        source = None
+        if not force:
+            key = import_reuse_key(
+                ai.normalized_url, ai.importer_module_name, ai.nofetch, ai.noextract)
+            source = find_reusable_imports(
+                db.session, [key], app.config.get("IMPORT_REUSE_TTL")).get(key)
+
         if ca:
             ca.artifact_import = ai
         db.session.add(ai)
-        db.session.add(ims)
+        if not source:
+            db.session.add(ImporterSchedule(artifact_import=ai))
         db.session.commit()
         db.session.refresh(ai)
 
-        LOG.debug("scheduling %r" % (ai,))
-        threading.Thread(target=schedule_import,name="schedule_import").start()
+        if source and reuse_import(ai, source):
+            LOG.debug("reused %r for %r" % (source, ai))
+            db.session.refresh(ai)
+        else:
+            LOG.debug("scheduling %r" % (ai,))
+            wake_import_scheduler()
 
         response = jsonify(ArtifactImportSchema().dump(ai))
         response.status_code = 200
@@ -210,6 +269,408 @@ class ArtifactImportResourceRoot(Resource):
         return response
 
 
+class ArtifactImportBulkResource(Resource):
+
+    # Per-item options; each defaults to the request's top-level value, if
+    # any, else to the ArtifactImportResourceRoot.post default.
+    ITEM_OPTIONS = dict(
+        type="unknown", importer_module_name=None, nofetch=False,
+        noextract=False, noremove=False, autofollow=True, force=False)
+
+    def post(self):
+        """
+        Submits many imports at once.  Takes a JSON object whose "imports"
+        list holds objects with a url or a candidate_artifact_id, and
+        optionally any of the single-import options (type,
+        importer_module_name, nofetch, noextract, noremove, autofollow,
+        force); options given at the top level apply to all items.  Items
+        that duplicate an in-flight import of the caller's, or an earlier
+        item, are not resubmitted.  All new imports are created in one
+        transaction and the scheduler is woken once.  Returns a result per
+        item, in order: created (with its artifact_import_id), reused (with
+        its artifact_import_id and artifact_id, if a recent import of the
+        same source was copied), duplicate (with the existing id, if in
+        flight), or error (with a message).
+        """
+        verify_api_key(request)
+        login_session = verify_token(request)
+
+        j = request.get_json(silent=True)
+        if not isinstance(j, dict) or not isinstance(j.get("imports"), list):
+            abort(400, description="must provide an imports list")
+        items = j["imports"]
+        if not items:
+            abort(400, description="imports list is empty")
+        max_items = app.config.get("BULK_IMPORT_MAX_ITEMS", 500)
+        if len(items) > max_items:
+            abort(400, description="at most %d imports per request" % (max_items,))
+
+        defaults = dict(self.ITEM_OPTIONS)
+        for k in self.ITEM_OPTIONS:
+            if k in j:
+                defaults[k] = j[k]
+
+        # Validate items and resolve candidate artifacts in one query.
+        results = [ None ] * len(items)
+        wanted = [ None ] * len(items)
+        candidate_ids = set()
+        for (i, item) in enumerate(items):
+            if not isinstance(item, dict):
+                results[i] = dict(status="error", message="import must be an object")
+                continue
+            (url, caid) = (item.get("url"), item.get("candidate_artifact_id"))
+            if bool(url) == bool(caid):
+                results[i] = dict(
+                    status="error",
+                    message="must provide either url or candidate_artifact_id, but not both")
+                continue
+            if url and not isinstance(url, str):
+                results[i] = dict(status="error", message="invalid url")
+                continue
+            if caid is not None and (isinstance(caid, bool) or not isinstance(caid, int)):
+                results[i] = dict(status="error", message="invalid candidate_artifact_id")
+                continue
+            opts = dict(defaults)
+            for k in self.ITEM_OPTIONS:
+                if k in item:
+                    opts[k] = item[k]
+            if not opts["type"]:
+                opts["type"] = "unknown"
+            if opts["type"] not in ARTIFACT_IMPORT_TYPES:
+                results[i] = dict(status="error", message="invalid artifact type")
+                continue
+            if opts["importer_module_name"] is not None \
+              and not isinstance(opts["importer_module_name"], str):
+                results[i] = dict(status="error", message="invalid importer_module_name")
+                continue
+            bad = [ k for k in ("nofetch","noextract","noremove","autofollow","force")
+                    if not isinstance(opts[k], bool) ]
+            if bad:
+                results[i] = dict(status="error", message="%s must be boolean" % (bad[0],))
+                continue
+            if caid:
+                candidate_ids.add(caid)
+            wanted[i] = (url, caid, opts)
+
+        candidates = dict()
+        if candidate_ids:
+            candidates = dict([ (ca.id, ca) for ca in db.session.query(CandidateArtifact)\
+              .filter(CandidateArtifact.id.in_(list(candidate_ids)))\
+              .filter(CandidateArtifact.owner_id == login_session.user_id)\
+              .with_for_update().all() ])
+        for (i, w) in enumerate(wanted):
+            if w is None or not w[1]:
+                continue
+            ca = candidates.get(w[1])
+            if not ca:
+                (results[i], wanted[i]) = (dict(status="error", message="no such candidate_artifact_id"), None)
+            elif ca.artifact_import_id is not None:
+                (results[i], wanted[i]) = (dict(status="error", message="already importing this candidate_artifact_id"), None)
+            else:
+                wanted[i] = (ca.url, ca.id, w[2])
+
+        # Dedupe against the caller's in-flight imports, in one query, and
+        # within the request.
+        urls = set([ w[0] for w in wanted if w is not None ])
+        in_flight = dict()
+        if urls:
+            in_flight = dict(db.session.query(ArtifactImport.url, ArtifactImport.id).\
+              filter(ArtifactImport.url.in_(list(urls))).\
+              filter(ArtifactImport.owner_id == login_session.user_id).\
+              filter(ArtifactImport.artifact_id == None).\
+              filter(not_(ArtifactImport.status.in_(["completed","failed"]))).\
+              all())
+        new = collections.OrderedDict()
+        for (i, w) in enumerate(wanted):
+            if w is None:
+                continue
+            url = w[0]
+            if url in in_flight:
+                results[i] = dict(status="duplicate", artifact_import_id=in_flight[url])
+            elif url in new:
+                results[i] = dict(status="duplicate", duplicate_of=new[url][0])
+            else:
+                new[url] = (i, w)
+
+        reused = 0
+        if new:
+            # Find recent imports of the same sources to copy, in one query.
+            normalized = dict([ (url, normalize_import_url(url)) for url in new ])
+            keys = dict()
+            for (url, (i, (_, caid, opts))) in new.items():
+                if not opts["force"]:
+                    keys[url] = import_reuse_key(
+                        normalized[url], opts["importer_module_name"],
+                        opts["nofetch"], opts["noextract"])
+            reusable = find_reusable_imports(
+                db.session, keys.values(), app.config.get("IMPORT_REUSE_TTL"))
+            sources = dict([ (url, reusable[k]) for (url, k) in keys.items()
+                             if k in reusable ])
+
+            dt = datetime.datetime.now()
+            rows = [ dict(url=url, owner_id=login_session.user_id, ctime=dt,
+                          mtime=dt, status="pending", phase="start",
+                          archived=False, normalized_url=normalized[url],
+                          **dict([ (k, v) for (k, v) in opts.items() if k != "force" ]))
+                     for (url, (i, (_, caid, opts))) in new.items() ]
+            ids = dict(db.session.execute(
+                ArtifactImport.__table__.insert().values(rows).returning(
+                    ArtifactImport.__table__.c.url,
+                    ArtifactImport.__table__.c.id)).fetchall())
+            scheduled = [ dict(artifact_import_id=aid) for (url, aid) in ids.items()
+                          if url not in sources ]
+            if scheduled:
+                db.session.execute(
+                    ImporterSchedule.__table__.insert().values(scheduled))
+            for (url, (i, (_, caid, opts))) in new.items():
+                results[i] = dict(status="created", artifact_import_id=ids[url])
+                if caid:
+                    candidates[caid].artifact_import_id = ids[url]
+            db.session.commit()
+
+            # Copying an artifact is per-import work; an import whose copy
+            # fails falls back to being scheduled.
+            need_sched = len(scheduled) > 0
+            for (url, source) in sources.items():
+                i = new[url][0]
+                ai = db.session.query(ArtifactImport).get(ids[url])
+                artifact = reuse_import(ai, source)
+                if artifact:
+                    results[i] = dict(
+                        status="reused", artifact_import_id=ai.id,
+                        artifact_id=artifact.id)
+                    reused += 1
+                else:
+                    need_sched = True
+
+            if need_sched:
+                LOG.debug("scheduling %d bulk imports" % (len(new) - reused,))
+                wake_import_scheduler()
+        else:
+            db.session.rollback()
+
+        for (i, item) in enumerate(items):
+            results[i]["index"] = i
+            if isinstance(item, dict):
+                for k in ("url", "candidate_artifact_id"):
+                    if k in item:
+                        results[i][k] = item[k]
+
+        response = jsonify({
+            "results": results,
+            "created": len(new) - reused,
+            "reused": reused,
+        })
+        response.status_code = 200
+        return response
+
+
+#
+# Uploaded content is stored this many bytes at a time.
+#
+STORE_CHUNK_SIZE = 1024 * 1024
+
+def store_file_content(digest, size, stream):
+    """
+    Stores the content read from @stream (a file object, at its start),
+    whose SHA-256 is @digest and length @size, unless it is already stored
+    (in which case it is touched); returns True if it was new.  The content
+    is sent STORE_CHUNK_SIZE bytes at a time into a temporary table, and
+    assembled into one value by the server, so that at most one chunk is in
+    memory here.  Does not commit.
+    """
+    if db.session.query(FileContent.id).filter(FileContent.hash == digest).first():
+        FileContent.touch(db.session, [digest])
+        return False
+    db.session.execute(text(
+        "CREATE TEMPORARY TABLE IF NOT EXISTS file_content_chunks"
+        " (seq integer NOT NULL, chunk bytea NOT NULL) ON COMMIT DELETE ROWS"))
+    db.session.execute(text("TRUNCATE file_content_chunks"))
+    seq = 0
+    while True:
+        chunk = stream.read(STORE_CHUNK_SIZE)
+        if not chunk:
+            break
+        db.session.execute(
+            text("INSERT INTO file_content_chunks (seq, chunk) VALUES (:seq, :chunk)"),
+            dict(seq=seq, chunk=chunk))
+        seq += 1
+    # A concurrent upload of the same content makes this wait for (and
+    # then yield to) that one's commit.
+    res = db.session.execute(text(
+        "INSERT INTO file_content (content, hash, size)"
+        " SELECT coalesce(string_agg(chunk, ''::bytea ORDER BY seq), ''::bytea),"
+        "   :hash, :size"
+        " FROM file_content_chunks"
+        " ON CONFLICT (hash) DO NOTHING RETURNING id"),
+        dict(hash=digest, size=size))
+    created = res.first() is not None
+    db.session.execute(text("TRUNCATE file_content_chunks"))
+    if not created:
+        FileContent.touch(db.session, [digest])
+    return created
+
+
+#
+# Importers may only transfer file content while an import is in progress.
+#
+IMPORT_IN_PROGRESS_STATUSES = ("pending", "scheduled", "running")
+
+def get_import_in_progress(artifact_import_id):
+    """
+    Returns the artifact import, aborting unless it exists and is in
+    progress.
+    """
+    artifact_import = db.session.query(ArtifactImport).filter(
+        ArtifactImport.id == artifact_import_id).first()
+    if not artifact_import:
+        abort(404, description="invalid artifact import ID")
+    if artifact_import.status not in IMPORT_IN_PROGRESS_STATUSES:
+        abort(400, description="artifact import is not in progress")
+    return artifact_import
+
+
+def resolve_uploaded_contents(artifact_import, artifact_json, parts):
+    """
+    Replaces each file_content in @artifact_json's files and their members
+    that references an uploaded multipart part, as {"content_id": <id>},
+    with a reference to stored content by hash and size, which
+    @artifact_import may then use (see ArtifactImportFileContent); see
+    part_content_id.  The parts were hashed (and capped at
+    FILE_CONTENT_MAX_SIZE) as they were spooled, so stored content is found
+    with one query; new content is then streamed from its spool into
+    store_file_content, so that at most one chunk is in memory.  Raises
+    ValueError if a referenced part is missing.
+    """
+    by_id = dict()
+    for (name, part) in parts.items(multi=True):
+        by_id.setdefault(part_content_id(part, name), part)
+        by_id.setdefault(name, part)
+
+    holders = []
+    for f in artifact_json.get("files") or []:
+        if not isinstance(f, dict):
+            continue
+        holders.append(f)
+        holders.extend([ m for m in f.get("members") or [] if isinstance(m, dict) ])
+    refs = []
+    for holder in holders:
+        fc = holder.get("file_content")
+        if not isinstance(fc, dict) or "content_id" not in fc:
+            continue
+        part = by_id.get(fc["content_id"])
+        if part is None:
+            raise ValueError("no uploaded part with content id %r" % (fc["content_id"],))
+        refs.append((holder, part))
+    if not refs:
+        return
+
+    digests = dict([ (id(part), part_digest(part)) for (holder, part) in refs ])
+    max_size = app.config.get("FILE_CONTENT_MAX_SIZE")
+    for (digest, size) in digests.values():
+        if max_size and size > max_size:
+            raise ValueError("uploaded part exceeds %d bytes" % (max_size,))
+    stored = set([ bytes(h) for (h,) in db.session.query(FileContent.hash)\
+      .filter(FileContent.hash.in_(list(set([ d for (d, size) in digests.values() ])))).all() ])
+    FileContent.touch(db.session, stored)
+    for (holder, part) in refs:
+        (digest, size) = digests[id(part)]
+        if digest not in stored:
+            part.stream.seek(0)
+            store_file_content(digest, size, part.stream)
+            stored.add(digest)
+        holder["file_content"] = dict(
+            hash=base64.b64encode(digest).decode("utf-8"), size=size)
+    ArtifactImportFileContent.grant(
+        db.session, artifact_import.id, [ d for (d, size) in digests.values() ])
+    db.session.commit()
+
+
+class ArtifactImportFilesResource(Resource):
+
+    def post(self, artifact_import_id):
+        """
+        The first phase of an importer's file transfer.  Takes a JSON
+        object whose "files" list holds the hex SHA-256 hash and size of
+        each file content the import's artifact will contain, and returns
+        (in "missing") the hashes whose content the importer must upload:
+        those we do not yet store, or store but not in any published
+        artifact (so that only an importer that has the bytes may reference
+        unpublished content).  The importer PUTs each of those to
+        /artifact/import/<id>/file/<hash>, and then may give the listed
+        content in the import's artifact by hash and size alone, e.g.
+        "file_content": {"hash": <base64 digest>, "size": 1024}.  Stored
+        content is touched, so that it outlives the import; the import must
+        be in progress.
+        """
+        verify_api_key(request)
+
+        artifact_import = get_import_in_progress(artifact_import_id)
+
+        j = request.get_json(silent=True)
+        if not isinstance(j, dict) or not isinstance(j.get("files"), list):
+            abort(400, description="must provide a files list")
+        max_items = app.config.get("IMPORT_FILES_MAX_ITEMS", 10000)
+        if len(j["files"]) > max_items:
+            abort(400, description="at most %d files per request" % (max_items,))
+        hashes = collections.OrderedDict()
+        for f in j["files"]:
+            digest = FileContent.parse_hash(f.get("hash") if isinstance(f, dict) else None)
+            if digest is None:
+                abort(400, description="each file must have a hex SHA-256 hash")
+            hashes[digest] = f["hash"].lower()
+
+        published = set()
+        if hashes:
+            stored = set([ bytes(h) for (h,) in db.session.query(FileContent.hash)\
+              .filter(FileContent.hash.in_(list(hashes.keys()))).all() ])
+            FileContent.touch(db.session, stored)
+            published = published_contents(stored)
+            ArtifactImportFileContent.grant(
+                db.session, artifact_import.id, published)
+            db.session.commit()
+
+        response = jsonify({
+            "missing": [ hexhash for (digest, hexhash) in hashes.items()
+                         if digest not in published ]
+        })
+        response.status_code = 200
+        return response
+
+
+class ArtifactImportFileResource(Resource):
+
+    def put(self, artifact_import_id, file_hash):
+        """
+        The second phase of an importer's file transfer: stores the raw
+        request body as file content, if its SHA-256 hash is @file_hash.
+        The body is spooled (to a temporary file beyond
+        UPLOAD_SPOOL_MAX_MEMORY) and stored a chunk at a time, never whole
+        in memory.
+        Returns 201 if the content was new, 200 if it was already stored;
+        either way, the import may then reference it by hash alone.  The
+        import must be in progress.
+        """
+        verify_api_key(request)
+
+        artifact_import = get_import_in_progress(artifact_import_id)
+        digest = FileContent.parse_hash(file_hash)
+        if digest is None:
+            abort(400, description="invalid hash (must be hex SHA-256)")
+        spool = spool_request_body(
+            max_size=app.config.get("FILE_CONTENT_MAX_SIZE"))
+        try:
+            if spool.digest() != digest:
+                abort(400, description="content does not match hash")
+            created = store_file_content(digest, spool.size, spool)
+        finally:
+            spool.close()
+        ArtifactImportFileContent.grant(db.session, artifact_import.id, [digest])
+        db.session.commit()
+
+        return Response(status=201 if created else 200)
+
+
 class ArtifactImportResource(Resource):
 
     def __init__(self):
@@ -232,7 +693,7 @@ class ArtifactImportResource(Resource):
         self.putparse.add_argument(
             name="log", type=str, required=False)
         self.putparse.add_argument(
-            name="artifact", type=dict, required=False)
+            name="artifact", type=dict, required=False, location="json")
         self.putparse.add_argument(
             name="archived", type=bool, required=False)
         self.putparse.add_argument(
@@ -260,7 +721,12 @@ class ArtifactImportResource(Resource):
     def put(self, artifact_import_id):
         """
         Allows the importer to push an artifact_import's status and
-        data to us, or for a user to modify the import's state.
+        data to us, or for a user to modify the import's state.  Importers
+        may send a JSON body, or a multipart body whose file parts the
+        artifact references by content id (see resolve_uploaded_contents).  An
+        importer's completed artifact is queued for ingestion (202, with the
+        import's id) unless IMPORT_INGEST_ASYNC is disabled, in which case
+        it is ingested before responding (200, with the artifact's id).
         """
         verify_api_key(request)
         login_session = None
@@ -294,142 +760,79 @@ class ArtifactImportResource(Resource):
         artifact_json = args.get("artifact",None)
         del args["artifact"]
 
+        # An importer may instead send a multipart body: the artifact as a
+        # JSON "artifact" part, with file content in binary parts that it
+        # references by content id.
+        if request.mimetype == "multipart/form-data" and not login_session:
+            try:
+                if "artifact" in request.form:
+                    artifact_json = json.loads(request.form["artifact"])
+                elif "artifact" in request.files:
+                    artifact_json = json.load(request.files["artifact"].stream)
+            except ValueError:
+                abort(400, description="malformed artifact part")
+            if artifact_json is not None:
+                if not isinstance(artifact_json, dict):
+                    abort(400, description="artifact part must be an object")
+                try:
+                    resolve_uploaded_contents(
+                        artifact_import, artifact_json, request.files)
+                except ValueError as ex:
+                    abort(400, description=str(ex))
+
+        # Feed the importer's phase timings to the scheduler.
+        if not login_session:
+            record_phase_transition(
+                db.session, artifact_import, args["phase"], args["status"])
+
+        # Queue a completed import's artifact for the ingesters, rather than
+        # materializing it within the importer's request; the import stays
+        # running (in phase done) until it is ingested.
+        completed = args["status"] == "completed" and args["phase"] == "done"
+        queued = completed and artifact_json and not login_session \
+          and app.config.get("IMPORT_INGEST_ASYNC", True)
+        if completed and artifact_json:
+            artifact_import.payload_time = datetime.datetime.now()
+            artifact_import.ingest_start_time = None
+            artifact_import.ingest_end_time = None
+            artifact_import.ingest_timings = None
+            # The import is marked completed only as its artifact is
+            # committed (see materialize_import_artifact).
+            args["status"] = "running"
+            if queued:
+                artifact_import.payload = json.dumps(artifact_json)
+            else:
+                artifact_import.ingest_start_time = artifact_import.payload_time
+
         for (k,v) in args.items():
             if v is None:
                 continue
             setattr(artifact_import,k,v)
         db.session.commit()
 
-        if "status" in args and args["status"] in ("completed","failed"):
+        if args["status"] in ("completed","failed") or completed:
             importer_schedule = db.session.query(ImporterSchedule)\
               .filter(ImporterSchedule.artifact_import_id == artifact_import_id).first()
-            db.session.delete(importer_schedule)
-            db.session.commit()
+            if importer_schedule:
+                db.session.delete(importer_schedule)
+                db.session.commit()
 
             LOG.debug("artifact import status %r; scheduling" % (args["status"],))
-            threading.Thread(target=schedule_import,name="schedule_import").start()
+            wake_import_scheduler()
 
-        if args["status"] == "completed" and args["phase"] == "done":
+        if queued:
+            LOG.debug("queued %r for ingestion" % (artifact_import,))
+            wake_import_ingester()
+            response = jsonify(dict(id=artifact_import.id))
+            response.status_code = 202
+            return response
+
+        if completed:
             if artifact_json:
-                dt = datetime.datetime.now()
-                if "owner" in artifact_json:
-                    del artifact_json["owner"]
-                if "owner_id" in artifact_json:
-                    del artifact_json["owner_id"]
-                for x in artifact_json.get("candidate_relationships", []):
-                    if "owner" in x.get("related_candidate", {}):
-                        del x["related_candidate"]["owner"]
-                    if "owner_id" in x.get("related_candidate", {}):
-                        del x["related_candidate"]["owner_id"]
-                artifact = None
-                try:
-                    artifact = object_from_json(db.session,Artifact,artifact_json,skip_primary_keys=True)
-                except (TypeError, ValueError):
-                    ex = sys.exc_info()[1]
-                    LOG.exception(ex)
-                    db.session.rollback()
-                    msg = ""
-                    if ex.args:
-                        msg = "Internal error: %r" % (ex.args,)
-                    else:
-                        msg = "Internal error: %r" % (ex,)
-                    db.session.refresh(artifact_import)
-                    artifact_import.status = "failed"
-                    artifact_import.mtime = dt
-                    artifact_import.message = msg
-                    db.session.add(artifact_import)
-                    db.session.commit()
-                    abort(500, description=msg)
-                except:
-                    LOG.exception(sys.exc_info()[1])
-                    db.session.rollback()
-                    db.session.refresh(artifact_import)
-                    artifact_import.status = "failed"
-                    artifact_import.mtime = dt
-                    msg = "Unexpected internal error"
-                    artifact_import.message = msg
-                    db.session.add(artifact_import)
-                    db.session.commit()
-                    abort(500, description=msg)
-
-                if artifact_import.artifact_group_id is None:
-                    artifact_group = ArtifactGroup(owner_id=artifact_import.owner_id,
-                                                   next_version=0)
-                    artifact.artifact_group = artifact_group
-                    db.session.add(artifact_group)
-                else:
-                    artifact.artifact_group_id = artifact_import.artifact_group_id
-
-                artifact.owner_id = artifact_import.owner_id
-                for x in getattr(artifact, "candidate_relationships"):
-                    x.related_candidate.owner_id = artifact_import.owner_id
-                if artifact_import.parent_artifact_id:
-                    artifact.parent_id = artifact_import.parent_artifact_id
-                db.session.add(artifact)
                 try:
-                    db.session.commit()
-                    db.session.refresh(artifact)
-                    artifact_import.artifact = artifact
-                    artifact_import.artifact_group_id = artifact.artifact_group_id
-                    db.session.commit()
-                except sqlalchemy.exc.IntegrityError:
-                    #psycopg2.errors.UniqueViolation:
-                    ex = sys.exc_info()[1]
-                    LOG.exception(ex)
-                    db.session.rollback()
-                    msg = "failed to upload artifact from importer (possible duplicate or malformed data)"
-                    db.session.refresh(artifact_import)
-                    artifact_import.status = "failed"
-                    artifact_import.message = msg
-                    artifact_import.mtime = dt
-                    db.session.add(artifact_import)
-                    db.session.commit()
-                    abort(400,description=msg)
-                except:
-                    ex = sys.exc_info()[1]
-                    LOG.exception(ex)
-                    db.session.rollback()
-                    msg = "failed to upload artifact from importer (unknown cause)"
-                    db.session.refresh(artifact_import)
-                    artifact_import.status = "failed"
-                    artifact_import.message = msg
-                    db.session.commit()
-                    abort(500,description=msg)
-
-                # Artifact inserted ok; see if this import was for a
-                # CandidateArtifact, maybe with CandidateArtifactRelationships.
-                # If so, add create real relationships from the original Artifact
-                # to the one just imported.
-                if artifact_import.candidate_artifact \
-                  and artifact_import.candidate_artifact.candidate_artifact_relationships:
-                    for car in artifact_import.candidate_artifact.candidate_artifact_relationships:
-                        nr = ArtifactRelationship(
-                            artifact_group_id=car.artifact.artifact_group_id, relation=car.relation,
-                            related_artifact_group_id=artifact.artifact_group_id)
-                        LOG.debug("promoted %r to %r", car, nr)
-                        db.session.add(nr)
-                    db.session.commit()
-
-                # Artifact inserted ok; kick off imports for the
-                # CandidateArtifacts pointed to by the CandidateArtifactRelationships.
-                if artifact_import.autofollow and artifact.candidate_relationships:
-                    need_sched = False
-                    for cr in artifact.candidate_relationships:
-                        c = cr.related_candidate
-                        now = datetime.datetime.now()
-                        nai = ArtifactImport(
-                            url=c.url, type=c.type or "unknown", ctime=now,
-                            status="pending", phase="start", owner_id=artifact.owner_id)
-                        ni = ImporterSchedule(artifact_import=nai)
-                        c.artifact_import = nai
-                        db.session.add(nai)
-                        db.session.add(ni)
-                        need_sched = True
-                    if need_sched:
-                        db.session.commit()
-                        db.session.refresh(artifact)
-                        LOG.debug("scheduling candidate imports")
-                        threading.Thread(target=schedule_import,name="schedule_import").start()
+                    artifact = ingest_import_artifact(artifact_import, artifact_json)
+                except ImportMaterializeError as ex:
+                    abort(ex.code, description=ex.msg)
 
                 # Respond success.
                 response = jsonify(dict(id=artifact.id))
@@ -1,14 +1,18 @@
 # logic for /artifacts
 
-from searcch_backend.api.app import db
+from searcch_backend.api.app import db, config
 from searcch_backend.models.model import *
 from searcch_backend.models.schema import *
 from flask import abort, jsonify, url_for, request
 from flask_restful import reqparse, Resource
-from sqlalchemy import func, desc, sql, or_, and_, exc, nullslast
+from sqlalchemy import func, desc, sql, or_, and_, nullslast
 from sqlalchemy.sql.functions import coalesce
 from searcch_backend.api.common.auth import (verify_api_key, has_api_key, has_token, verify_token)
-import math
+from searcch_backend.api.common.cache import search_cache
+from searcch_backend.api.common.stats import analytics_buffer
+from searcch_backend.api.common.pagination import (
+    TOTAL_MODES, InvalidCursor, encode_cursor, decode_cursor, keyset_filter,
+    keyset_order, key_types, paginate)
 import logging
 import json
 
@@ -18,68 +22,129 @@ def generate_artifact_uri(artifact_group_id, artifact_id=None):
     return url_for('api.artifact', artifact_group_id=artifact_group_id,
                    artifact_id=artifact_id)
 
-def sort_artifacts(query, sqratings, sqreviews, sort_by, sort_order):
+def sort_keys(sort_by, sort_order):
+    """
+    Returns the user-selected sort keys as a list of (expression,
+    descending) tuples; see search_artifacts for the full ordering.
+    """
+    descending = (sort_order == 'desc')
     if sort_by == 'date':
-        query = query.order_by(Artifact.ctime.desc() if sort_order == 'desc' else Artifact.ctime.asc())
+        return [(Artifact.ctime, descending)]
     elif sort_by == 'rating':
-        query = query.order_by(sqratings.c.avg_rating.desc() if sort_order == 'desc' else sqratings.c.avg_rating.asc(),
-                               sqreviews.c.num_reviews.desc() if sort_order == 'desc' else sqreviews.c.num_reviews.asc())
+        return [(coalesce(ArtifactGroupStats.avg_rating, 0), descending),
+                (coalesce(ArtifactGroupStats.num_reviews, 0), descending)]
     elif sort_by == 'views':
-        query = query.order_by(desc('view_count') if sort_order == 'desc' else 'view_count')
-    return query
-
-def search_artifacts(keywords, artifact_types, author_keywords, organization, owner_keywords, badge_id_list, venue_id_list, venue_keywords, page_num, items_per_page, sort_by = 'default', sort_order = 'desc'):
-    """ search for artifacts based on keywords, with optional filters by owner and affiliation """
-    sqratings = db.session.query(
-        ArtifactGroup.id.label('artifact_group_id'),
-        func.count(ArtifactRatings.id).label('num_ratings'),
-        coalesce(func.avg(ArtifactRatings.rating),0).label('avg_rating')
-    ).join(ArtifactRatings, ArtifactGroup.id == ArtifactRatings.artifact_group_id, isouter=True
-    ).group_by(ArtifactGroup.id).subquery()
-
-    sqreviews = db.session.query(
-        ArtifactGroup.id.label('artifact_group_id'),
-        func.count(ArtifactReviews.id).label('num_reviews')
-    ).join(ArtifactReviews, ArtifactGroup.id == ArtifactReviews.artifact_group_id, isouter=True
-    ).group_by(ArtifactGroup.id).subquery()
-
+        return [(coalesce(ArtifactGroupStats.view_count, 0), descending)]
+    return []
+
+def artifact_group_stats_columns():
+    """
+    Returns the rating, review, and view columns of ArtifactGroupStats,
+    coalesced so that groups without a stats row read as zero.  Callers
+    must outer join ArtifactGroupStats on the artifact group id.
+    """
+    return (
+        coalesce(ArtifactGroupStats.num_ratings, 0).label('num_ratings'),
+        coalesce(ArtifactGroupStats.avg_rating, 0).label('avg_rating'),
+        coalesce(ArtifactGroupStats.num_reviews, 0).label('num_reviews'),
+        coalesce(ArtifactGroupStats.view_count, 0).label('view_count'))
+
+def artifact_abstract_columns():
+    """
+    Returns exactly the columns artifact_abstract() needs, so that result
+    pages can be rendered without loading Artifact objects and their lazy
+    relationships.  Callers must join ArtifactGroup.
+    """
+    return (
+        Artifact.id, Artifact.artifact_group_id,
+        ArtifactGroup.owner_id.label('artifact_group_owner_id'),
+        Artifact.owner_id, Artifact.url, Artifact.type, Artifact.title,
+        Artifact.description)
+
+def artifact_abstract(row):
+    """
+    Renders a search result row containing artifact_abstract_columns()
+    and artifact_group_stats_columns().
+    """
+    return {
+        "id": row.id,
+        "artifact_group_id": row.artifact_group_id,
+        "artifact_group": {
+            "id": row.artifact_group_id,
+            "owner_id": row.artifact_group_owner_id
+        },
+        "uri": generate_artifact_uri(row.artifact_group_id, artifact_id=row.id),
+        "doi": row.url,
+        "type": row.type,
+        "title": row.title,
+        "description": row.description,
+        "avg_rating": float(row.avg_rating),
+        "num_ratings": row.num_ratings,
+        "num_reviews": row.num_reviews,
+        "owner": { "id": row.owner_id },
+        "views": row.view_count
+    }
+
+def search_artifacts(keywords, artifact_types, author_keywords, organization, owner_keywords, badge_id_list, venue_id_list, venue_keywords, page_num, items_per_page, sort_by = 'default', sort_order = 'desc', cursor = None, total = 'exact'):
+    """
+    search for artifacts based on keywords, with optional filters by owner
+    and affiliation; results are served from the search cache when possible
+    """
+    args = (keywords, artifact_types, author_keywords, organization,
+            owner_keywords, badge_id_list, venue_id_list, venue_keywords,
+            page_num, items_per_page, sort_by, sort_order, cursor, total)
+    if search_cache is None:
+        return _search_artifacts(*args)
+    key = search_cache.make_key(*args)
+    if key is None:
+        return _search_artifacts(*args)
+    result = search_cache.get(key)
+    if result is None:
+        result = _search_artifacts(*args)
+        search_cache.set(key, result)
+    return result
+
+def _search_artifacts(keywords, artifact_types, author_keywords, organization, owner_keywords, badge_id_list, venue_id_list, venue_keywords, page_num, items_per_page, sort_by, sort_order, cursor, total):
+    """
+    search for artifacts based on keywords, with optional filters by owner and affiliation
+
+    If @cursor is not None, results are fetched with keyset pagination
+    starting after the position it encodes (the empty string means the
+    first page), and @page_num is ignored.  Either way, the result carries a
+    next_cursor if there are more results.  @total selects how the total
+    is reported in page mode (see TOTAL_MODES); cursor mode never counts.
+    """
+    keys = sort_keys(sort_by, sort_order)
     # create base query object            
     if not keywords:
-        query = db.session.query(Artifact,
+        query = db.session.query(*artifact_abstract_columns(),
                                     sql.expression.bindparam("zero", 0).label("rank"),
-                                    'num_ratings', 'avg_rating', 'num_reviews', "view_count"
+                                    *artifact_group_stats_columns()
                                     )
         query = query.join(ArtifactGroup, ArtifactGroup.id == Artifact.artifact_group_id
-                        ).join(sqratings, ArtifactGroup.id == sqratings.c.artifact_group_id, isouter=True
                         ).join(ArtifactPublication, ArtifactPublication.id == ArtifactGroup.publication_id
-                        ).join(sqreviews, ArtifactGroup.id == sqreviews.c.artifact_group_id, isouter=True
+                        ).join(ArtifactGroupStats, ArtifactGroup.id == ArtifactGroupStats.artifact_group_id, isouter=True
                         )
 
-        query = sort_artifacts(query, sqratings, sqreviews, sort_by, sort_order)
-        query = query.order_by(
-                                    db.case([
+        keys.append((db.case([
                                         (Artifact.type == 'software', 1),
                                         (Artifact.type == 'dataset', 2),
                                         (Artifact.type == 'publication', 3),
-                                    ], else_=4)
-                            )
+                                    ], else_=4), False))
     else:
-        search_query = db.session.query(ArtifactSearchMaterializedView.artifact_id, 
-                                        func.ts_rank_cd(ArtifactSearchMaterializedView.doc_vector, func.websearch_to_tsquery("english", keywords)).label("rank")
-                                    ).filter(ArtifactSearchMaterializedView.doc_vector.op('@@')(func.websearch_to_tsquery("english", keywords))
+        search_query = db.session.query(ArtifactSearchIndex.artifact_id, 
+                                        func.ts_rank_cd(ArtifactSearchIndex.doc_vector, func.websearch_to_tsquery("english", keywords), type_=db.Float).label("rank")
+                                    ).filter(ArtifactSearchIndex.doc_vector.op('@@')(func.websearch_to_tsquery("english", keywords))
                                     ).subquery()
-        query = db.session.query(Artifact, 
-                                    search_query.c.rank, 'num_ratings', 'avg_rating', 'num_reviews', "view_count"
+        query = db.session.query(*artifact_abstract_columns(),
+                                    search_query.c.rank, *artifact_group_stats_columns()
                                     ).join(ArtifactPublication, ArtifactPublication.artifact_id == Artifact.id
                                     ).join(ArtifactGroup, ArtifactGroup.publication_id == ArtifactPublication.id
                                     ).join(search_query, Artifact.id == search_query.c.artifact_id, isouter=False)
         
-        query = query.join(sqratings, Artifact.artifact_group_id == sqratings.c.artifact_group_id, isouter=True
-                        ).join(sqreviews, Artifact.artifact_group_id == sqreviews.c.artifact_group_id, isouter=True
-                        )
+        query = query.join(ArtifactGroupStats, Artifact.artifact_group_id == ArtifactGroupStats.artifact_group_id, isouter=True)
 
-        query = sort_artifacts(query, sqratings, sqreviews, sort_by, sort_order)
-        query = query.order_by(desc(search_query.c.rank))
+        keys.append((search_query.c.rank, True))
         
     if author_keywords or organization:
         rank_list = []
@@ -140,9 +205,6 @@ def search_artifacts(keywords, artifact_types, author_keywords, organization, ow
             ).filter(Venue.venue_tsv.op('@@')(func.websearch_to_tsquery("english", venue_keywords))).order_by(desc("vrank")).subquery()
         query = query.join(venue_query, Artifact.id == venue_query.c.artifact_id, isouter=False)
 
-    # Add View number to query
-    query = query.join(StatsArtifactViews, Artifact.artifact_group_id == StatsArtifactViews.artifact_group_id, isouter=True)
-    
     # add filters based on provided parameters
     query = query.filter(ArtifactPublication.id != None)
     if artifact_types:
@@ -151,37 +213,41 @@ def search_artifacts(keywords, artifact_types, author_keywords, organization, ow
         else:
             query = query.filter(Artifact.type == artifact_types[0])
 
-    
-    pagination = query.paginate(page=page_num, error_out=False, max_per_page=items_per_page)
-    result = pagination.items
-
-    artifacts = []
-    for row in result:
-        artifact, _, num_ratings, avg_rating, num_reviews, view_count = row
-        abstract = {
-            "id": artifact.id,
-            "artifact_group_id": artifact.artifact_group_id,
-            "artifact_group": {
-                "id": artifact.artifact_group_id,
-                "owner_id": artifact.artifact_group.owner_id
-            },
-            "uri": generate_artifact_uri(artifact.artifact_group_id, artifact_id=artifact.id),
-            "doi": artifact.url,
-            "type": artifact.type,
-            "title": artifact.title,
-            "description": artifact.description,
-            "avg_rating": float(avg_rating),
-            "num_ratings": num_ratings if num_ratings else 0,
-            "num_reviews": num_reviews if num_reviews else 0,
-            "owner": { "id": artifact.owner.id },
-            "views": view_count if view_count else 0
-        }
-        artifacts.append(abstract)
-
-    return dict(
-        page=pagination.page,total=pagination.total,
-        pages=int(math.ceil(pagination.total / items_per_page)),
-        artifacts=artifacts)
+
+    # The artifact id makes the ordering total, so that it can be resumed
+    # from the sort-key values of the last row of a page.
+    keys.append((Artifact.id, True))
+    shape = "%s:%s:%d" % (sort_by, sort_order, bool(keywords))
+    query = query.add_columns(*[k[0].label("sort_key_%d" % (i,)) for (i, k) in enumerate(keys)])
+    query = query.order_by(*keyset_order(keys))
+
+    if cursor is not None:
+        if cursor:
+            try:
+                values = decode_cursor(cursor, shape, key_types(keys))
+            except InvalidCursor as ex:
+                abort(400, description="invalid cursor: %s" % (str(ex),))
+            query = query.filter(keyset_filter(keys, values))
+        result = query.limit(items_per_page + 1).all()
+        has_next = len(result) > items_per_page
+        result = result[:items_per_page]
+        pagination = None
+    else:
+        pagination = paginate(query, page_num, items_per_page, total=total)
+        result = pagination.items
+        has_next = pagination.has_next
+
+    next_cursor = None
+    if has_next and result:
+        next_cursor = encode_cursor(shape, result[-1][-len(keys):])
+
+    artifacts = [artifact_abstract(row) for row in result]
+
+    if pagination is None:
+        return dict(artifacts=artifacts, next_cursor=next_cursor)
+    ret = pagination.as_dict()
+    ret.update(artifacts=artifacts, next_cursor=next_cursor)
+    return ret
 
 class ArtifactSearchIndexAPI(Resource):
     def __init__(self):
@@ -195,11 +261,21 @@ class ArtifactSearchIndexAPI(Resource):
                                    required=False,
                                    default=1,
                                    help='page number for paginated results')
+        self.reqparse.add_argument(name='cursor',
+                                   type=str,
+                                   required=False,
+                                   help='opaque cursor (next_cursor of a previous page) for keyset-paginated results; overrides page')
         self.reqparse.add_argument(name='items_per_page',
                                    type=int,
                                    required=False,
                                    default=10,
                                    help='items per page for paginated results')
+        self.reqparse.add_argument(name='total',
+                                   type=str,
+                                   required=False,
+                                   default='exact',
+                                   choices=TOTAL_MODES,
+                                   help='bad total mode: {error_msg}')
         
         # filters
         self.reqparse.add_argument(name='type',
@@ -263,7 +339,9 @@ class ArtifactSearchIndexAPI(Resource):
         args = self.reqparse.parse_args()
         keywords = args['keywords']
         page_num = args['page']
+        cursor = args['cursor']
         items_per_page = args['items_per_page']
+        total = args['total']
 
         # artifact search filters
         artifact_types = args['type']
@@ -279,22 +357,17 @@ class ArtifactSearchIndexAPI(Resource):
         order = args['order']
 
         # sanity checks
+        if items_per_page < 1:
+            abort(400, description='items_per_page must be positive')
+        items_per_page = min(items_per_page, config.get("SEARCH_MAX_ITEMS_PER_PAGE", 100))
         if artifact_types:
             for a_type in artifact_types:
                 if not ArtifactSearchIndexAPI.is_artifact_type_valid(a_type):
                     abort(400, description='invalid artifact type passed')
 
-        try:
-            stats_search = StatsSearches(
-                    search_term=keywords
-            )
-            db.session.add(stats_search)
-            db.session.commit()
-        except exc.SQLAlchemyError as error:
-            LOG.exception(f'Failed to log search term in the database. Error: {error}')
-            db.session.rollback()
-
-        result = search_artifacts(keywords, artifact_types, author_keywords, organization, owner_keywords, badge_id_list, venue_id_list, venue_keywords, page_num, items_per_page, sort, order)
+        analytics_buffer.record_search(keywords)
+
+        result = search_artifacts(keywords, artifact_types, author_keywords, organization, owner_keywords, badge_id_list, venue_id_list, venue_keywords, page_num, items_per_page, sort, order, cursor=cursor, total=total)
         response = jsonify(result)
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.status_code = 200
@@ -343,7 +416,7 @@ class ArtifactRecommendationAPI(Resource):
             artifacts = search_artifacts(
                 " or ".join(keywords), ARTIFACT_TYPES, None, None, None,
                 None, None, None, page_num, 10, None, None)
-            res =  db.session.query(ArtifactRatings.artifact_id, func.count(ArtifactRatings.id).label('num_ratings'), func.avg(ArtifactRatings.rating).label('avg_rating')).group_by("artifact_id").filter(ArtifactRatings.artifact_id == artifact_id).first()
+            res = db.session.query(ArtifactGroupStats).filter(ArtifactGroupStats.artifact_group_id == artifact_group_id).first()
             if res:
                 num_ratings = res.num_ratings if res.num_ratings else 0
                 avg_rating = round(res.avg_rating,2) if res.avg_rating else None
@@ -354,6 +427,61 @@ class ArtifactRecommendationAPI(Resource):
 
 
 
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.status_code = 200
+        return response
+
+class ArtifactTrendingAPI(Resource):
+    def __init__(self):
+        self.reqparse = reqparse.RequestParser()
+        self.reqparse.add_argument(name='limit',
+                                   type=int,
+                                   required=False,
+                                   default=10,
+                                   help='maximum number of trending artifacts to return')
+        self.reqparse.add_argument(name='type',
+                                   type=str,
+                                   required=False,
+                                   action='append',
+                                   help='missing type to filter results')
+
+        super(ArtifactTrendingAPI, self).__init__()
+
+    def get(self):
+        """
+        Returns published artifacts ranked by their precomputed trending
+        score (see SearcchBackgroundTasks.refreshTrending).
+        """
+        args = self.reqparse.parse_args()
+        limit = args['limit']
+        artifact_types = args['type']
+
+        if limit is None or limit < 1 or limit > 100:
+            abort(400, description='limit must be between 1 and 100')
+        if artifact_types:
+            for a_type in artifact_types:
+                if not ArtifactSearchIndexAPI.is_artifact_type_valid(a_type):
+                    abort(400, description='invalid artifact type passed')
+
+        query = db.session.query(*artifact_abstract_columns(),
+                                 *artifact_group_stats_columns(),
+                                 ArtifactTrending.score
+                                 ).select_from(ArtifactTrending
+                                 ).join(ArtifactGroup, ArtifactGroup.id == ArtifactTrending.artifact_group_id
+                                 ).join(ArtifactPublication, ArtifactPublication.id == ArtifactGroup.publication_id
+                                 ).join(Artifact, Artifact.id == ArtifactPublication.artifact_id
+                                 ).join(ArtifactGroupStats, ArtifactGroupStats.artifact_group_id == ArtifactGroup.id, isouter=True)
+        if artifact_types:
+            query = query.filter(Artifact.type.in_(artifact_types))
+        query = query.order_by(desc(ArtifactTrending.score), desc(ArtifactGroup.id))
+
+        artifacts = []
+        for row in query.limit(limit).all():
+            result = artifact_abstract(row)
+            result["trending_score"] = row.score
+            artifacts.append(result)
+
+        response = jsonify({"artifacts": artifacts})
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.status_code = 200
         return response
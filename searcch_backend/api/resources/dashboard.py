@@ -2,7 +2,6 @@
 
 from searcch_backend.api.app import db, config_name
 from searcch_backend.api.common.auth import (verify_api_key, verify_token)
-from searcch_backend.api.resources.favorite import subquery_constructs
 from searcch_backend.models.model import *
 from searcch_backend.models.schema import *
 from flask import abort, jsonify, request, url_for
@@ -99,14 +98,12 @@ class ArtifactStatsAPI(Resource):
         verify_api_key(request)
         login_session = verify_token(request)
 
-        # Rating and review stats
-        sqratings, sqreviews = subquery_constructs()
-
-        artifact_list = db.session.query(Artifact, 'num_ratings', 'avg_rating', 'num_reviews'
-                                                ).join(sqratings, Artifact.id == sqratings.c.artifact_id, isouter=True
-                                                ).join(sqreviews, Artifact.id == sqreviews.c.artifact_id, isouter=True
-                                                ).filter(or_(sqratings.c.num_ratings > 0, sqreviews.c.num_reviews > 10)
-                                                ).order_by(sqratings.c.avg_rating.desc().nullslast(),sqreviews.c.num_reviews.desc()
+        # Rating and review stats, for the published version of each group
+        artifact_list = db.session.query(Artifact, ArtifactGroupStats.num_ratings, ArtifactGroupStats.avg_rating, ArtifactGroupStats.num_reviews
+                                                ).join(ArtifactPublication, ArtifactPublication.artifact_id == Artifact.id
+                                                ).join(ArtifactGroupStats, Artifact.artifact_group_id == ArtifactGroupStats.artifact_group_id
+                                                ).filter(or_(ArtifactGroupStats.num_ratings > 0, ArtifactGroupStats.num_reviews > 10)
+                                                ).order_by(ArtifactGroupStats.avg_rating.desc(), ArtifactGroupStats.num_reviews.desc()
                                                 ).all()
 
         ranked_artifacts = []
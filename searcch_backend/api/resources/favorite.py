@@ -6,21 +6,7 @@ from searcch_backend.models.model import *
 from searcch_backend.models.schema import *
 from flask import abort, jsonify, request, url_for, Blueprint
 from flask_restful import reqparse, Resource, fields, marshal
-from sqlalchemy import func, desc, sql
-
-def subquery_constructs():
-    sqratings = db.session.query(
-        ArtifactRatings.artifact_group_id,
-        func.count(ArtifactRatings.id).label('num_ratings'),
-        func.avg(ArtifactRatings.rating).label('avg_rating')
-    ).group_by("artifact_group_id").subquery()
-
-    sqreviews = db.session.query(
-        ArtifactReviews.artifact_group_id,
-        func.count(ArtifactReviews.id).label('num_reviews')
-    ).group_by("artifact_group_id").subquery()
-    
-    return sqratings, sqreviews
+from sqlalchemy import desc, sql
 
 class FavoritesListAPI(Resource):
     @staticmethod
@@ -34,13 +20,10 @@ class FavoritesListAPI(Resource):
         if user_id != login_session.user_id:
             abort(401, description="insufficient permission to list favorites")
 
-        sqratings, sqreviews = subquery_constructs()
-
-        favorite_artifacts = db.session.query(ArtifactGroup, Artifact, 'num_ratings', 'avg_rating', 'num_reviews'
+        favorite_artifacts = db.session.query(ArtifactGroup, Artifact, ArtifactGroupStats.num_ratings, ArtifactGroupStats.avg_rating, ArtifactGroupStats.num_reviews
             ).join(ArtifactPublication, ArtifactGroup.publication_id == ArtifactPublication.id, isouter=True
             ).join(Artifact, ArtifactPublication.artifact_id == Artifact.id, isouter=True
-            ).join(sqratings, ArtifactGroup.id == sqratings.c.artifact_group_id, isouter=True
-            ).join(sqreviews, ArtifactGroup.id == sqreviews.c.artifact_group_id, isouter=True
+            ).join(ArtifactGroupStats, ArtifactGroup.id == ArtifactGroupStats.artifact_group_id, isouter=True
             ).join(ArtifactFavorites, ArtifactGroup.id == ArtifactFavorites.artifact_group_id
             ).filter(ArtifactFavorites.user_id == login_session.user_id
             ).all()
@@ -0,0 +1,146 @@
+from searcch_backend.api.app import db
+from searcch_backend.api.common.auth import (
+    verify_api_key, has_api_key, verify_token, has_token)
+from searcch_backend.models.model import (
+    FileContent, Artifact, ArtifactGroup, ArtifactPublication, ArtifactFile,
+    ArtifactFileMember)
+from flask import abort, request, Response
+from flask_restful import Resource
+from sqlalchemy import func, select, or_, union
+import logging
+
+LOG = logging.getLogger(__name__)
+
+#
+# Content is read from the database, and sent, this many bytes at a time.
+#
+CHUNK_SIZE = 1024 * 1024
+
+
+def content_visible(content_id, login_session):
+    """
+    Returns True if the caller may read the file content @content_id: if
+    it belongs to a file or file member of an artifact the caller may see,
+    by the rules of ArtifactAPI.get (published, the caller's own or its
+    group's, or any for an admin).
+    """
+    referencing = union(
+        select([ArtifactFile.artifact_id])\
+          .where(ArtifactFile.file_content_id == content_id),
+        select([ArtifactFile.artifact_id])\
+          .select_from(ArtifactFileMember.__table__.join(
+              ArtifactFile.__table__,
+              ArtifactFileMember.parent_file_id == ArtifactFile.id))\
+          .where(ArtifactFileMember.file_content_id == content_id))
+    q = db.session.query(Artifact.id)\
+      .join(ArtifactGroup, ArtifactGroup.id == Artifact.artifact_group_id)\
+      .outerjoin(ArtifactPublication, ArtifactPublication.artifact_id == Artifact.id)\
+      .filter(Artifact.id.in_(referencing))
+    if login_session is None:
+        q = q.filter(ArtifactPublication.id != None)
+    elif not login_session.is_admin:
+        q = q.filter(or_(
+            ArtifactPublication.id != None,
+            ArtifactGroup.owner_id == login_session.user_id,
+            Artifact.owner_id == login_session.user_id))
+    return db.session.query(q.exists()).scalar()
+
+
+def published_contents(hashes):
+    """
+    Returns the set of those of @hashes (digests) whose stored content
+    belongs to a file or file member of a published artifact, and so may
+    be read by anyone (see content_visible).
+    """
+    if not hashes:
+        return set()
+    files = db.session.query(FileContent.hash)\
+      .join(ArtifactFile, ArtifactFile.file_content_id == FileContent.id)\
+      .join(ArtifactPublication, ArtifactPublication.artifact_id == ArtifactFile.artifact_id)\
+      .filter(FileContent.hash.in_(list(hashes)))
+    members = db.session.query(FileContent.hash)\
+      .join(ArtifactFileMember, ArtifactFileMember.file_content_id == FileContent.id)\
+      .join(ArtifactFile, ArtifactFileMember.parent_file_id == ArtifactFile.id)\
+      .join(ArtifactPublication, ArtifactPublication.artifact_id == ArtifactFile.artifact_id)\
+      .filter(FileContent.hash.in_(list(hashes)))
+    return set([ bytes(h) for (h,) in files.union(members).all() ])
+
+
+class FileContentResource(Resource):
+
+    def get(self, file_hash):
+        """
+        Streams the file content whose SHA-256 is the hex @file_hash, if the
+        caller may see an artifact that contains it (see content_visible);
+        otherwise, as if it did not exist.  Content is read a chunk at a
+        time, each on a connection held only for that read, so that large
+        contents are never buffered whole and slow clients do not hold
+        connections.  The hash is the (strong) ETag.  Honors a single byte
+        Range (subject to If-Range); other ranges get the whole content.
+        """
+        if has_api_key(request):
+            verify_api_key(request)
+        login_session = None
+        if has_token(request):
+            login_session = verify_token(request)
+
+        digest = FileContent.parse_hash(file_hash)
+        if digest is None:
+            abort(400, description="invalid hash (must be hex SHA-256)")
+        row = db.session.query(FileContent.id, FileContent.size).filter(
+            FileContent.hash == digest).first()
+        if not row or not content_visible(row[0], login_session):
+            abort(404, description="nonexistent file content")
+        (content_id, size) = row
+        etag = digest.hex()
+        # Release the request's connection before streaming.
+        db.session.commit()
+        engine = db.engine
+        table = FileContent.__table__
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        (start, stop) = (0, size)
+        status = 200
+        if_range = request.if_range
+        if request.range is not None \
+          and ((if_range.etag is None and if_range.date is None)
+               or if_range.etag == etag):
+            byte_range = request.range.range_for_length(size)
+            if byte_range is not None:
+                (start, stop) = byte_range
+                status = 206
+            elif request.range.units == "bytes" and len(request.range.ranges) == 1:
+                response = Response(status=416)
+                response.headers["Content-Range"] = "bytes */%d" % (size,)
+                return response
+
+        def generate():
+            offset = start
+            while offset < stop:
+                n = min(CHUNK_SIZE, stop - offset)
+                with engine.connect() as connection:
+                    chunk = connection.execute(
+                        select([func.substr(table.c.content, offset + 1, n)])\
+                          .where(table.c.id == content_id)).scalar()
+                if not chunk:
+                    LOG.error("file content %s shorter than its size %d",
+                              etag, size)
+                    break
+                yield bytes(chunk)
+                offset += len(chunk)
+
+        response = Response(
+            generate(), status=status,
+            mimetype="application/octet-stream", direct_passthrough=True)
+        response.headers["Content-Length"] = str(stop - start)
+        response.headers["Accept-Ranges"] = "bytes"
+        if status == 206:
+            response.headers["Content-Range"] = "bytes %d-%d/%d" % (
+                start, stop - 1, size)
+        response.set_etag(etag)
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        return response
@@ -6,15 +6,16 @@ import sys
 
 from flask import abort, jsonify, request, Response, Blueprint
 from flask_restful import reqparse, Resource, fields, marshal
+from sqlalchemy import desc
 
 from searcch_backend.models.model import (
-    ImporterInstance )
+    ImporterInstance, ImporterHealthCheck )
 from searcch_backend.models.schema import (
-    ImporterInstanceSchema )
+    ImporterInstanceSchema, ImporterHealthCheckSchema )
 from searcch_backend.api.app import db, config_name
 from searcch_backend.api.common.auth import (
     verify_api_key, has_token, verify_token)
-from searcch_backend.api.common.importer import schedule_import
+from searcch_backend.api.common.importer import wake_import_scheduler
 
 
 LOG = logging.getLogger(__name__)
@@ -63,7 +64,7 @@ class ImporterCheckThread(threading.Thread):
         # Invoke the scheduler in case we changed state.
         if self.importer_instance.status != old_status \
           or self.importer_instance.admin_status != old_admin_status:
-            threading.Thread(target=schedule_import,name="schedule_import").start()
+            wake_import_scheduler()
 
 class ImporterResourceRoot(Resource):
 
@@ -212,7 +213,7 @@ class ImporterResource(Resource):
         # Invoke the scheduler in case we changed state.
         if importer_instance.admin_status == "enabled" \
           and importer_instance.status == "up":
-            threading.Thread(target=schedule_import,name="schedule_import").start()
+            wake_import_scheduler()
 
         return Response(status=200)
 
@@ -254,3 +255,43 @@ class ImporterResource(Resource):
         db.session.commit()
 
         return Response(status=200)
+
+
+class ImporterHealthResource(Resource):
+
+    def __init__(self):
+        super(ImporterHealthResource, self).__init__()
+        self.get_reqparse = reqparse.RequestParser()
+        self.get_reqparse.add_argument(
+            name="limit", type=int, required=False, default=100,
+            help="Maximum number of health checks to return.")
+
+    def get(self, importer_instance_id):
+        """
+        Get an importer instance's recent health checks, newest first.
+        """
+        verify_api_key(request)
+        login_session = None
+        if has_token(request):
+            login_session = verify_token(request)
+        if login_session and not login_session.is_admin:
+            abort(403, description="unauthorized")
+
+        args = self.get_reqparse.parse_args()
+        if args["limit"] < 1:
+            abort(400, description="limit must be positive")
+
+        importer_instance = db.session.query(ImporterInstance).filter(
+            ImporterInstance.id == importer_instance_id).first()
+        if not importer_instance:
+            abort(404, description="invalid importer instance ID")
+
+        checks = db.session.query(ImporterHealthCheck)\
+          .filter(ImporterHealthCheck.importer_instance_id == importer_instance_id)\
+          .order_by(desc(ImporterHealthCheck.check_time))\
+          .limit(args["limit"]).all()
+        response = jsonify({
+            "importer": ImporterInstanceSchema().dump(importer_instance),
+            "health": ImporterHealthCheckSchema(many=True).dump(checks)})
+        response.status_code = 200
+        return response
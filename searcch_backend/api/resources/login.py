@@ -9,7 +9,7 @@ import logging
 
 from searcch_backend.api.app import db, app, config_name
 from searcch_backend.api.common.auth import (
-    verify_api_key, lookup_token, verify_token)
+    verify_api_key, lookup_token, verify_token, invalidate_token)
 from searcch_backend.models.model import *
 from searcch_backend.models.schema import *
 
@@ -73,12 +73,18 @@ class LoginAPI(Resource):
         verify_api_key(request)
         login_session = verify_token(request)
 
-        if not login_session.user.can_admin:
+        if not login_session.can_admin:
             abort(403, description="unauthorized")
 
         args = self.putparse.parse_args(strict=True)
-        login_session.is_admin = args["is_admin"]
+        session = db.session.query(Sessions).\
+          filter(Sessions.id == login_session.id).\
+          first()
+        if not session:
+            abort(401, description="invalid session token")
+        session.is_admin = args["is_admin"]
         db.session.commit()
+        invalidate_token(login_session.sso_token)
 
         return Response(status=200)
 
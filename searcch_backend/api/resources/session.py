@@ -1,8 +1,10 @@
 # logic for /rating
 
 from searcch_backend.api.app import db, config_name
-from searcch_backend.api.common.auth import (verify_api_key, verify_token)
+from searcch_backend.api.common.auth import (
+    verify_api_key, verify_token, invalidate_token)
 from searcch_backend.api.common.sql import object_from_json
+from searcch_backend.api.common.pagination import (TOTAL_MODES, paginate)
 from searcch_backend.models.model import *
 from searcch_backend.models.schema import *
 from flask import abort, jsonify, request, url_for, Blueprint
@@ -12,7 +14,6 @@ import sqlalchemy
 import sys
 import logging
 import datetime
-import math
 
 
 LOG = logging.getLogger(__name__)
@@ -39,6 +40,10 @@ class SessionResourceRoot(Resource):
         self.getparse.add_argument(
             name="items_per_page", type=int, required=False, default=20,
             help="results per page if paginated")
+        self.getparse.add_argument(
+            name="total", type=str, required=False, default="exact",
+            choices=TOTAL_MODES,
+            help="bad total mode: {error_msg}")
         self.getparse.add_argument(
             name="sort", type=str, required=False, default="id",
             choices=("id", "expires_on", "is_admin"),
@@ -86,8 +91,8 @@ class SessionResourceRoot(Resource):
         if "page" in args and args["page"]:
             if args["items_per_page"] <= 0:
                 args["items_per_page"] = sys.maxsize
-            pagination = sessions.paginate(
-                page=args["page"], error_out=False, per_page=args["items_per_page"])
+            pagination = paginate(
+                sessions, args["page"], args["items_per_page"], total=args["total"])
             sessions = pagination.items
         else:
             sessions = sessions.all()
@@ -106,9 +111,7 @@ class SessionResourceRoot(Resource):
             "sessions": tmplist
         }
         if pagination:
-            response_dict["page"] = pagination.page
-            response_dict["total"] = pagination.total
-            response_dict["pages"] = int(math.ceil(pagination.total / args["items_per_page"]))
+            response_dict.update(pagination.as_dict())
             
         response = jsonify(response_dict)
 
@@ -137,6 +140,7 @@ class SessionResource(Resource):
 
         db.session.delete(session)
         db.session.commit()
+        invalidate_token(session.sso_token)
 
         response = jsonify({ "message": "session %r deleted" % (session_id,) })
         response.headers.add('Access-Control-Allow-Origin', '*')
@@ -4,6 +4,7 @@ from datetime import datetime
 from searcch_backend.api.app import db, config_name
 from searcch_backend.api.common.auth import (verify_api_key, verify_token)
 from searcch_backend.api.common.sql import object_from_json
+from searcch_backend.api.common.pagination import (TOTAL_MODES, paginate)
 from searcch_backend.models.model import *
 from searcch_backend.models.schema import *
 from flask import abort, jsonify, request, url_for, Blueprint
@@ -12,7 +13,6 @@ from sqlalchemy import func, desc, asc, sql, or_, and_
 import sqlalchemy
 import sys
 import logging
-import math
 
 import base64
 import werkzeug
@@ -39,6 +39,10 @@ class UsersIndexAPI(Resource):
         self.getparse.add_argument(
             name="items_per_page", type=int, required=False, default=20,
             help="results per page if paginated")
+        self.getparse.add_argument(
+            name="total", type=str, required=False, default="exact",
+            choices=TOTAL_MODES,
+            help="bad total mode: {error_msg}")
         self.getparse.add_argument(
             name="sort", type=str, required=False, default="id",
             choices=("id", "expires_on", "is_admin"),
@@ -81,8 +85,8 @@ class UsersIndexAPI(Resource):
         if "page" in args and args["page"]:
             if args["items_per_page"] <= 0:
                 args["items_per_page"] = sys.maxsize
-            pagination = users.paginate(
-                page=args["page"], error_out=False, per_page=args["items_per_page"])
+            pagination = paginate(
+                users, args["page"], args["items_per_page"], total=args["total"])
             users = pagination.items
         else:
             users = users.all()
@@ -101,9 +105,7 @@ class UsersIndexAPI(Resource):
             "users": tmpusers
         }
         if pagination:
-            response_dict["page"] = pagination.page
-            response_dict["total"] = pagination.total
-            response_dict["pages"] = int(math.ceil(pagination.total / args["items_per_page"]))
+            response_dict.update(pagination.as_dict())
 
         response = jsonify(response_dict)
 
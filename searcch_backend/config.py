@@ -8,6 +8,94 @@ class Config(object):
     STATS_GARBAGE_COLLECTOR_INTERVAL = 24*60*60
     # Run email invitations processor hourly.
     EMAIL_INVITATIONS_INTERVAL = 60 * 60
+    # Rebuild the trending artifacts ranking hourly, from daily views in the
+    # last TRENDING_WINDOW_DAYS days, decayed with the given half-life.
+    TRENDING_REFRESH_INTERVAL = 60 * 60
+    TRENDING_HALF_LIFE_DAYS = 7
+    TRENDING_WINDOW_DAYS = 60
+    # Search result cache: "local" (per worker process), "redis" (shared by
+    # all workers; needs SEARCH_CACHE_REDIS_URL and the redis package), or
+    # None to disable.  Publications, ratings, and reviews invalidate it;
+    # with the local backend, other workers may serve stale results until
+    # SEARCH_CACHE_TTL expires.
+    SEARCH_CACHE_BACKEND = "local"
+    SEARCH_CACHE_MAX_ENTRIES = 1024
+    SEARCH_CACHE_TTL = 120
+    SEARCH_CACHE_REDIS_URL = None
+    # Searches return at most this many results per page (or cursor step);
+    # larger items_per_page values are clamped to it.
+    SEARCH_MAX_ITEMS_PER_PAGE = 100
+    # Write-behind buffering of search terms and artifact views: flush once
+    # this many events are pending, or every ANALYTICS_FLUSH_INTERVAL
+    # seconds; drop events beyond ANALYTICS_BUFFER_MAX_EVENTS.
+    ANALYTICS_FLUSH_BATCH_SIZE = 500
+    ANALYTICS_FLUSH_INTERVAL = 5
+    ANALYTICS_BUFFER_MAX_EVENTS = 10000
+    # Per-worker cache of validated session tokens.  Logout and privilege
+    # changes invalidate entries in the worker that made them; other
+    # workers may honor the old state for up to SESSION_CACHE_TTL seconds.
+    SESSION_CACHE_TTL = 30
+    SESSION_CACHE_MAX_ENTRIES = 4096
+    # Each process's import scheduler is woken via Postgres NOTIFY on import
+    # state changes, and also polls this often.
+    IMPORT_SCHEDULER_POLL_INTERVAL = 30
+    # Importer notifications: (connect, read) timeouts, delivery threads per
+    # process, and attempts per import with exponential backoff.  After
+    # IMPORTER_CIRCUIT_FAILURES consecutive failures, an importer is marked
+    # down and not contacted for IMPORTER_CIRCUIT_RESET seconds.
+    IMPORTER_NOTIFY_TIMEOUT = (3.05, 10)
+    IMPORTER_NOTIFY_WORKERS = 8
+    IMPORTER_NOTIFY_RETRIES = 3
+    IMPORTER_NOTIFY_BACKOFF = 1.0
+    IMPORTER_CIRCUIT_FAILURES = 3
+    IMPORTER_CIRCUIT_RESET = 60
+    # Poll every importer's /status this often (in searcch-jobs), at most
+    # IMPORTER_HEALTH_WORKERS at a time, keeping this many days of history.
+    IMPORTER_HEALTH_INTERVAL = 60
+    IMPORTER_HEALTH_WORKERS = 8
+    IMPORTER_HEALTH_TIMEOUT = (3.05, 5)
+    IMPORTER_HEALTH_HISTORY_DAYS = 7
+    # Import placement: "expected_completion" uses each importer's rolling
+    # (EWMA) phase durations per import type, inflated by IMPORTER_CONTENTION
+    # times its load; "least_loaded" uses load alone.  IMPORTER_TYPE_AFFINITY
+    # maps importer URLs to the import types they prefer; others cost
+    # IMPORTER_AFFINITY_PENALTY times more there.
+    IMPORTER_SCHEDULING_POLICY = "expected_completion"
+    IMPORTER_PHASE_EWMA_ALPHA = 0.3
+    IMPORTER_DEFAULT_ESTIMATE = 60.0
+    IMPORTER_CONTENTION = 0.5
+    IMPORTER_TYPE_AFFINITY = {}
+    IMPORTER_AFFINITY_PENALTY = 2.0
+    # Maximum number of imports per /artifact/imports/bulk request.
+    BULK_IMPORT_MAX_ITEMS = 500
+    # Reuse the artifact of an import of the same source completed within
+    # this many seconds, rather than running an importer again (unless the
+    # request sets force).  0 disables reuse.
+    IMPORT_REUSE_TTL = 86400
+    # Importers' completed artifacts are queued and ingested by searcch-jobs:
+    # IMPORT_INGEST_WORKERS threads per process, each claiming up to
+    # IMPORT_INGEST_BATCH_SIZE imports at a time, polling this often, and
+    # taking over claims older than IMPORT_INGEST_CLAIM_TIMEOUT seconds.
+    # If IMPORT_INGEST_ASYNC is False, the importer's PUT ingests inline.
+    IMPORT_INGEST_ASYNC = True
+    IMPORT_INGEST_WORKERS = 2
+    IMPORT_INGEST_BATCH_SIZE = 8
+    IMPORT_INGEST_POLL_INTERVAL = 30
+    IMPORT_INGEST_CLAIM_TIMEOUT = 600
+    # Importers first ask which of up to IMPORT_FILES_MAX_ITEMS file content
+    # hashes we lack, then upload only those, each at most
+    # FILE_CONTENT_MAX_SIZE bytes (None for no limit).
+    IMPORT_FILES_MAX_ITEMS = 10000
+    FILE_CONTENT_MAX_SIZE = 256 * 1024 * 1024
+    # Uploaded multipart file parts are held in memory up to this size, and
+    # beyond it spooled to a temporary file.
+    UPLOAD_SPOOL_MAX_MEMORY = 1024 * 1024
+    # Every FILE_CONTENT_CLEANUP_INTERVAL seconds, searcch-jobs deletes file
+    # content that no artifact references and that was last stored or
+    # claimed by an import more than FILE_CONTENT_ORPHAN_TTL seconds ago.
+    # Queued imports must be ingested within the TTL.
+    FILE_CONTENT_CLEANUP_INTERVAL = 3600
+    FILE_CONTENT_ORPHAN_TTL = 2 * 86400
 
 
 class DevelopmentConfig(Config):
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+#
+# searcch-jobs: runs the periodic background jobs (see
+# searcch_backend.api.common.scheduled_tasks.SearcchBackgroundTasks) in a
+# dedicated process, rather than in the gunicorn arbiter.  Any number of
+# replicas may run; advisory locks in the database ensure each job runs once
+# per interval.  It also runs the import ingesters (see
+# searcch_backend.api.common.ingest), which share the queue across replicas.
+#
+
+import argparse
+import logging
+import sys
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the SEARCCH backend background jobs.")
+    parser.add_argument(
+        "-d", "--debug", action="store_true", help="Enable debug logging.")
+    parser.add_argument(
+        "--no-migrate", action="store_true",
+        help="Do not auto-migrate the database before starting.")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    from apscheduler.schedulers.blocking import BlockingScheduler
+    from searcch_backend.api.app import (app, config, db, mail, migrate)
+    from searcch_backend.api.common.alembic import maybe_auto_upgrade_db
+    from searcch_backend.api.common.scheduled_tasks import SearcchBackgroundTasks
+    from searcch_backend.api.common.ingest import import_ingester
+
+    if not args.no_migrate:
+        maybe_auto_upgrade_db(app, db, migrate)
+        db.engine.dispose()
+
+    # Ingest queued import payloads alongside the periodic jobs.
+    import_ingester.start(app)
+
+    sbt = SearcchBackgroundTasks(
+        config, app, db, mail, scheduler=BlockingScheduler())
+    try:
+        sbt.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""importer health checks
+
+Revision ID: 106bbc09bdd2
+Revises: 34028445f089
+Create Date: 2026-10-18 15:07:33.918264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '106bbc09bdd2'
+down_revision = '34028445f089'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('importer_health_checks',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('importer_instance_id', sa.Integer(), nullable=False),
+    sa.Column('check_time', sa.DateTime(), nullable=False),
+    sa.Column('ok', sa.Boolean(), nullable=False),
+    sa.Column('status_code', sa.Integer(), nullable=True),
+    sa.Column('latency', sa.Float(), nullable=True),
+    sa.Column('num_tasks', sa.Integer(), nullable=True),
+    sa.Column('message', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['importer_instance_id'], ['importer_instances.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('importer_health_checks_instance_time_idx', 'importer_health_checks', ['importer_instance_id', 'check_time'])
+
+
+def downgrade():
+    op.drop_index('importer_health_checks_instance_time_idx')
+    op.drop_table('importer_health_checks')
@@ -0,0 +1,65 @@
+"""artifact group stats lock
+
+Revision ID: 1fc78496e1a9
+Revises: 958ecc2e8d1d
+Create Date: 2026-10-19 16:40:52.207319
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1fc78496e1a9'
+down_revision = '958ecc2e8d1d'
+branch_labels = None
+depends_on = None
+
+
+REFRESH_BODY = (
+    "   INSERT INTO artifact_group_stats"
+    "     (artifact_group_id, num_ratings, avg_rating, num_reviews, view_count, last_updated)"
+    "   SELECT gid,"
+    "     (SELECT count(*) FROM artifact_ratings WHERE artifact_group_id = gid),"
+    "     (SELECT coalesce(avg(rating), 0) FROM artifact_ratings WHERE artifact_group_id = gid),"
+    "     (SELECT count(*) FROM artifact_reviews WHERE artifact_group_id = gid),"
+    "     (SELECT coalesce(sum(view_count), 0) FROM stats_views WHERE artifact_group_id = gid),"
+    "     now()"
+    "   WHERE EXISTS (SELECT 1 FROM artifact_groups WHERE id = gid)"
+    "   ON CONFLICT (artifact_group_id) DO UPDATE SET"
+    "     num_ratings = excluded.num_ratings,"
+    "     avg_rating = excluded.avg_rating,"
+    "     num_reviews = excluded.num_reviews,"
+    "     view_count = excluded.view_count,"
+    "     last_updated = excluded.last_updated;")
+
+
+def upgrade():
+    #
+    # Two transactions changing the same group's rows could each recompute
+    # from a snapshot without the other's change, and the later upsert
+    # would lose the earlier one's.  So serialize refreshes per group, until
+    # the refreshing transaction ends: once the lock is granted, the
+    # recompute (a new statement, under READ COMMITTED) sees every change
+    # committed by the transaction that held it.
+    #
+    op.execute(
+        "CREATE OR REPLACE FUNCTION public.artifact_group_stats_refresh(gid integer) RETURNS void"
+        " LANGUAGE plpgsql"
+        " AS $$"
+        " BEGIN"
+        "   PERFORM pg_advisory_xact_lock(hashtext('artifact_group_stats'), gid);"
+        + REFRESH_BODY +
+        " END"
+        " $$;")
+
+
+def downgrade():
+    op.execute(
+        "CREATE OR REPLACE FUNCTION public.artifact_group_stats_refresh(gid integer) RETURNS void"
+        " LANGUAGE plpgsql"
+        " AS $$"
+        " BEGIN"
+        + REFRESH_BODY +
+        " END"
+        " $$;")
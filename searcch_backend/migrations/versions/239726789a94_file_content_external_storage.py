@@ -0,0 +1,30 @@
+"""file content external storage
+
+Revision ID: 239726789a94
+Revises: 370ff5176aba
+Create Date: 2026-10-19 10:03:51.218846
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '239726789a94'
+down_revision = '370ff5176aba'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Store content uncompressed out of line, so that substr() (as used to
+    # stream ranges of it) reads only the chunks it needs, rather than
+    # decompressing the value from its start.  This only changes the
+    # column's metadata, and applies to values written from now on; since
+    # migrations run as the app starts, existing values are not rewritten
+    # here, but by the opt-in, batched
+    # searcch_backend.api.common.file_content_backfill.
+    op.execute("ALTER TABLE file_content ALTER COLUMN content SET STORAGE EXTERNAL")
+
+
+def downgrade():
+    op.execute("ALTER TABLE file_content ALTER COLUMN content SET STORAGE EXTENDED")
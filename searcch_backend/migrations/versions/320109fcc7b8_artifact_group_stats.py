@@ -0,0 +1,112 @@
+"""artifact group stats
+
+Revision ID: 320109fcc7b8
+Revises: 64e65580b057
+Create Date: 2026-10-18 10:12:41.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '320109fcc7b8'
+down_revision = '64e65580b057'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('artifact_group_stats',
+    sa.Column('artifact_group_id', sa.Integer(), nullable=False),
+    sa.Column('num_ratings', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('avg_rating', sa.Float(), nullable=False, server_default='0'),
+    sa.Column('num_reviews', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('view_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('last_updated', sa.DateTime(), nullable=False, server_default=sa.text('now()')),
+    sa.ForeignKeyConstraint(['artifact_group_id'], ['artifact_groups.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artifact_group_id')
+    )
+
+    # The refresh function recomputes a single group's counters; these
+    # make that an index lookup rather than a scan.
+    op.create_index('artifact_reviews_artifact_group_id_idx', 'artifact_reviews', ['artifact_group_id'])
+    op.create_index('stats_views_artifact_group_id_idx', 'stats_views', ['artifact_group_id'])
+
+    #
+    # Recompute one group's row.  The exists() guard skips groups that are
+    # being deleted (their child rows are removed by cascade after the
+    # group row is already gone).
+    #
+    op.execute(
+        "CREATE OR REPLACE FUNCTION public.artifact_group_stats_refresh(gid integer) RETURNS void"
+        " LANGUAGE plpgsql"
+        " AS $$"
+        " BEGIN"
+        "   INSERT INTO artifact_group_stats"
+        "     (artifact_group_id, num_ratings, avg_rating, num_reviews, view_count, last_updated)"
+        "   SELECT gid,"
+        "     (SELECT count(*) FROM artifact_ratings WHERE artifact_group_id = gid),"
+        "     (SELECT coalesce(avg(rating), 0) FROM artifact_ratings WHERE artifact_group_id = gid),"
+        "     (SELECT count(*) FROM artifact_reviews WHERE artifact_group_id = gid),"
+        "     (SELECT coalesce(sum(view_count), 0) FROM stats_views WHERE artifact_group_id = gid),"
+        "     now()"
+        "   WHERE EXISTS (SELECT 1 FROM artifact_groups WHERE id = gid)"
+        "   ON CONFLICT (artifact_group_id) DO UPDATE SET"
+        "     num_ratings = excluded.num_ratings,"
+        "     avg_rating = excluded.avg_rating,"
+        "     num_reviews = excluded.num_reviews,"
+        "     view_count = excluded.view_count,"
+        "     last_updated = excluded.last_updated;"
+        " END"
+        " $$;")
+    op.execute(
+        "CREATE OR REPLACE FUNCTION public.artifact_group_stats_trigger() RETURNS trigger"
+        " LANGUAGE plpgsql"
+        " AS $$"
+        " BEGIN"
+        "   IF TG_OP = 'DELETE' OR TG_OP = 'UPDATE' THEN"
+        "     PERFORM artifact_group_stats_refresh(old.artifact_group_id);"
+        "   END IF;"
+        "   IF TG_OP = 'INSERT'"
+        "      OR (TG_OP = 'UPDATE' AND new.artifact_group_id IS DISTINCT FROM old.artifact_group_id) THEN"
+        "     PERFORM artifact_group_stats_refresh(new.artifact_group_id);"
+        "   END IF;"
+        "   RETURN NULL;"
+        " END"
+        " $$;")
+    for table in ('artifact_ratings', 'artifact_reviews', 'stats_views'):
+        op.execute(
+            "CREATE TRIGGER artifact_group_stats_update AFTER INSERT OR UPDATE OR DELETE"
+            " ON public.%s FOR EACH ROW EXECUTE PROCEDURE"
+            " public.artifact_group_stats_trigger();" % (table,))
+
+    # instantiate the stats with existing data
+    op.execute(
+        "INSERT INTO artifact_group_stats"
+        "   (artifact_group_id, num_ratings, avg_rating, num_reviews, view_count, last_updated)"
+        " SELECT AG.id, coalesce(R.num_ratings, 0), coalesce(R.avg_rating, 0),"
+        "   coalesce(RV.num_reviews, 0), coalesce(V.view_count, 0), now()"
+        " FROM artifact_groups AG"
+        " LEFT JOIN ("
+        "     SELECT artifact_group_id, count(*) AS num_ratings, avg(rating) AS avg_rating"
+        "     FROM artifact_ratings GROUP BY artifact_group_id"
+        " ) R ON R.artifact_group_id = AG.id"
+        " LEFT JOIN ("
+        "     SELECT artifact_group_id, count(*) AS num_reviews"
+        "     FROM artifact_reviews GROUP BY artifact_group_id"
+        " ) RV ON RV.artifact_group_id = AG.id"
+        " LEFT JOIN ("
+        "     SELECT artifact_group_id, sum(view_count) AS view_count"
+        "     FROM stats_views GROUP BY artifact_group_id"
+        " ) V ON V.artifact_group_id = AG.id;")
+
+
+def downgrade():
+    for table in ('artifact_ratings', 'artifact_reviews', 'stats_views'):
+        op.execute("DROP TRIGGER IF EXISTS artifact_group_stats_update on %s;" % (table,))
+    op.execute("DROP FUNCTION IF EXISTS public.artifact_group_stats_trigger;")
+    op.execute("DROP FUNCTION IF EXISTS public.artifact_group_stats_refresh;")
+    op.drop_index('stats_views_artifact_group_id_idx')
+    op.drop_index('artifact_reviews_artifact_group_id_idx')
+    op.drop_table('artifact_group_stats')
@@ -0,0 +1,33 @@
+"""background job runs
+
+Revision ID: 34028445f089
+Revises: e0d6d45d0185
+Create Date: 2026-10-18 14:22:51.730194
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '34028445f089'
+down_revision = 'e0d6d45d0185'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('background_job_runs',
+    sa.Column('name', sa.String(length=128), nullable=False),
+    sa.Column('last_start', sa.DateTime(), nullable=True),
+    sa.Column('last_success', sa.DateTime(), nullable=True),
+    sa.Column('last_duration', sa.Float(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('runs', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('failures', sa.Integer(), nullable=False, server_default='0'),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('background_job_runs')
@@ -0,0 +1,30 @@
+"""file content mtime
+
+Revision ID: 370ff5176aba
+Revises: 614594f814b9
+Create Date: 2026-10-19 09:12:37.604113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '370ff5176aba'
+down_revision = '614594f814b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('file_content', sa.Column('mtime', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+    op.create_index('file_content_mtime_idx', 'file_content', ['mtime'], unique=False)
+    op.create_index('artifact_files_file_content_id_idx', 'artifact_files', ['file_content_id'], unique=False)
+    op.create_index('artifact_file_members_file_content_id_idx', 'artifact_file_members', ['file_content_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('artifact_file_members_file_content_id_idx', table_name='artifact_file_members')
+    op.drop_index('artifact_files_file_content_id_idx', table_name='artifact_files')
+    op.drop_index('file_content_mtime_idx', table_name='file_content')
+    op.drop_column('file_content', 'mtime')
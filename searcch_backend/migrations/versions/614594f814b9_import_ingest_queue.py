@@ -0,0 +1,34 @@
+"""import ingest queue
+
+Revision ID: 614594f814b9
+Revises: a4302eeaa8cc
+Create Date: 2026-10-18 17:05:42.913374
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '614594f814b9'
+down_revision = 'a4302eeaa8cc'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('artifact_imports', sa.Column('payload', sa.Text(), nullable=True))
+    op.add_column('artifact_imports', sa.Column('payload_time', sa.DateTime(), nullable=True))
+    op.add_column('artifact_imports', sa.Column('ingest_start_time', sa.DateTime(), nullable=True))
+    op.add_column('artifact_imports', sa.Column('ingest_end_time', sa.DateTime(), nullable=True))
+    op.add_column('artifact_imports', sa.Column('ingest_timings', sa.Text(), nullable=True))
+    op.create_index('artifact_imports_ingest_queue_idx', 'artifact_imports', ['payload_time'], unique=False, postgresql_where=sa.text("status = 'running' AND payload IS NOT NULL"))
+
+
+def downgrade():
+    op.drop_index('artifact_imports_ingest_queue_idx', table_name='artifact_imports')
+    op.drop_column('artifact_imports', 'ingest_timings')
+    op.drop_column('artifact_imports', 'ingest_end_time')
+    op.drop_column('artifact_imports', 'ingest_start_time')
+    op.drop_column('artifact_imports', 'payload_time')
+    op.drop_column('artifact_imports', 'payload')
@@ -0,0 +1,44 @@
+"""stats views unique group user
+
+Revision ID: 621e9301a827
+Revises: 8b53d363e7c8
+Create Date: 2026-10-18 12:26:55.730194
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '621e9301a827'
+down_revision = '8b53d363e7c8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # fold any duplicate (artifact_group_id, user_id) rows into the oldest one
+    op.execute(
+        "WITH dups AS ("
+        "   DELETE FROM stats_views"
+        "   WHERE id NOT IN ("
+        "       SELECT min(id) FROM stats_views"
+        "       GROUP BY artifact_group_id, coalesce(user_id, 0))"
+        "   RETURNING artifact_group_id, user_id, view_count"
+        " )"
+        " UPDATE stats_views SV SET view_count = SV.view_count + D.view_count"
+        " FROM ("
+        "     SELECT artifact_group_id, coalesce(user_id, 0) AS uid, sum(view_count) AS view_count"
+        "     FROM dups GROUP BY artifact_group_id, coalesce(user_id, 0)"
+        " ) D"
+        " WHERE SV.artifact_group_id = D.artifact_group_id"
+        "   AND coalesce(SV.user_id, 0) = D.uid;")
+
+    # Anonymous views have a NULL user_id; coalesce so that they roll up
+    # into a single row per group as well.
+    op.execute(
+        "CREATE UNIQUE INDEX stats_views_group_user_idx"
+        " ON stats_views (artifact_group_id, (coalesce(user_id, 0)));")
+
+
+def downgrade():
+    op.drop_index('stats_views_group_user_idx')
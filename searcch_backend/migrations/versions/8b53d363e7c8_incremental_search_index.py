@@ -0,0 +1,159 @@
+"""incremental search index
+
+Revision ID: 8b53d363e7c8
+Revises: 320109fcc7b8
+Create Date: 2026-10-18 11:03:17.402551
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '8b53d363e7c8'
+down_revision = '320109fcc7b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # remove the materialized view and its statement-level refresh trigger
+    op.execute("DROP TRIGGER IF EXISTS refresh_mat_view on artifact_groups;")
+    op.execute("DROP TRIGGER IF EXISTS refresh_mat_view on artifacts;")
+    op.execute("DROP FUNCTION IF EXISTS public.refresh_mat_view;")
+    op.drop_index('doc_idx')
+    op.execute('DROP MATERIALIZED VIEW IF EXISTS artifact_search_view;')
+
+    op.create_table('artifact_search_index',
+    sa.Column('artifact_id', sa.Integer(), nullable=False),
+    sa.Column('doc_vector', postgresql.TSVECTOR(), nullable=True),
+    sa.Column('mtime', sa.DateTime(), nullable=False, server_default=sa.text('now()')),
+    sa.ForeignKeyConstraint(['artifact_id'], ['artifacts.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artifact_id')
+    )
+    op.create_index('doc_idx', 'artifact_search_index', [sa.text("doc_vector")], postgresql_using='gin')
+
+    #
+    # Rebuild the document of a single artifact.  Publication status is not
+    # part of the index; search_artifacts() joins artifact_publications
+    # itself.  Selecting from artifacts makes this a no-op for an artifact
+    # that is being deleted (its index row goes away by cascade).
+    #
+    op.execute(
+        "CREATE OR REPLACE FUNCTION public.artifact_search_index_refresh(aid integer) RETURNS void"
+        " LANGUAGE plpgsql"
+        " AS $$"
+        " BEGIN"
+        "   INSERT INTO artifact_search_index (artifact_id, doc_vector, mtime)"
+        "   SELECT A.id, to_tsvector('english',"
+        "       coalesce(A.title, '') || ' ' || coalesce(A.description, '')"
+        "       || ' ' || coalesce(("
+        "           SELECT replace(string_agg(value, ' '), ',', ' ')"
+        "           FROM artifact_metadata"
+        "           WHERE artifact_id = A.id"
+        "             AND name IN ('full_name', 'topics', 'languages', 'owner_login', 'owner_name')), '')"
+        "       || ' ' || coalesce(("
+        "           SELECT string_agg(tag, ' ')"
+        "           FROM artifact_tags"
+        "           WHERE artifact_id = A.id), '')),"
+        "     now()"
+        "   FROM artifacts A"
+        "   WHERE A.id = aid"
+        "   ON CONFLICT (artifact_id) DO UPDATE SET"
+        "     doc_vector = excluded.doc_vector,"
+        "     mtime = excluded.mtime;"
+        " END"
+        " $$;")
+    op.execute(
+        "CREATE OR REPLACE FUNCTION public.artifact_search_index_artifact_trigger() RETURNS trigger"
+        " LANGUAGE plpgsql"
+        " AS $$"
+        " BEGIN"
+        "   PERFORM artifact_search_index_refresh(new.id);"
+        "   RETURN NULL;"
+        " END"
+        " $$;")
+    op.execute(
+        "CREATE TRIGGER search_index_update AFTER INSERT OR UPDATE OF title, description"
+        " ON public.artifacts FOR EACH ROW EXECUTE PROCEDURE"
+        " public.artifact_search_index_artifact_trigger();")
+    op.execute(
+        "CREATE OR REPLACE FUNCTION public.artifact_search_index_child_trigger() RETURNS trigger"
+        " LANGUAGE plpgsql"
+        " AS $$"
+        " BEGIN"
+        "   IF TG_OP = 'DELETE' OR TG_OP = 'UPDATE' THEN"
+        "     PERFORM artifact_search_index_refresh(old.artifact_id);"
+        "   END IF;"
+        "   IF TG_OP = 'INSERT'"
+        "      OR (TG_OP = 'UPDATE' AND new.artifact_id IS DISTINCT FROM old.artifact_id) THEN"
+        "     PERFORM artifact_search_index_refresh(new.artifact_id);"
+        "   END IF;"
+        "   RETURN NULL;"
+        " END"
+        " $$;")
+    for table in ('artifact_tags', 'artifact_metadata'):
+        op.execute(
+            "CREATE TRIGGER search_index_update AFTER INSERT OR UPDATE OR DELETE"
+            " ON public.%s FOR EACH ROW EXECUTE PROCEDURE"
+            " public.artifact_search_index_child_trigger();" % (table,))
+
+    # instantiate the index with existing data
+    op.execute("SELECT artifact_search_index_refresh(id) FROM artifacts;")
+
+
+def downgrade():
+    for table in ('artifacts', 'artifact_tags', 'artifact_metadata'):
+        op.execute("DROP TRIGGER IF EXISTS search_index_update on %s;" % (table,))
+    op.execute("DROP FUNCTION IF EXISTS public.artifact_search_index_child_trigger;")
+    op.execute("DROP FUNCTION IF EXISTS public.artifact_search_index_artifact_trigger;")
+    op.execute("DROP FUNCTION IF EXISTS public.artifact_search_index_refresh;")
+    op.drop_index('doc_idx')
+    op.drop_table('artifact_search_index')
+
+    op.execute(
+        "create materialized view artifact_search_view AS "
+        " select A.artifact_group_id as artifact_group_id, A.id as artifact_id, to_tsvector('english', coalesce(A.title, '') || ' ' || coalesce(A.description, '') || ' ' || coalesce(AM.metadata_str, '') || ' ' || coalesce(AT.tag_str, '')) as doc_vector"
+        " from "
+        " ("
+        "     select artifact_group_id, id, title, description"
+        "     from artifacts"
+        " ) A "
+        " inner join "
+        " ("
+        "     select id"
+        "     from artifact_groups"
+        "     where publication_id is not NULL"
+        " ) AG on AG.id = A.artifact_group_id"
+        " left join "
+        " ("
+        "     select artifact_id, replace(string_agg(value, ' '), ',', ' ') as metadata_str"
+        "     from artifact_metadata "
+        "     where name IN ('full_name', 'topics', 'languages', 'owner_login', 'owner_name')"
+        "     group by artifact_id"
+        " ) AM on A.id = AM.artifact_id"
+        " left join "
+        " ("
+        "     select artifact_id, string_agg(tag, ' ') as tag_str "
+        "     from artifact_tags "
+        "     group by artifact_id"
+        " ) AT on AM.artifact_id = AT.artifact_id;"
+    )
+    op.create_index('doc_idx', 'artifact_search_view', [sa.text("doc_vector")], postgresql_using='gin')
+    op.execute("refresh materialized view public.artifact_search_view;")
+    op.execute(
+        "create or replace function refresh_mat_view()"
+        " returns trigger language plpgsql"
+        " as $$"
+        " begin"
+        "     refresh materialized view public.artifact_search_view;"
+        "     return null;"
+        " end $$;"
+    )
+    op.execute(
+        "create trigger refresh_mat_view"
+        " after insert or update or delete or truncate"
+        " on artifact_groups for each statement "
+        " execute procedure refresh_mat_view();"
+    )
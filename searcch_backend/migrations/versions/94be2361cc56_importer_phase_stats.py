@@ -0,0 +1,35 @@
+"""importer phase stats
+
+Revision ID: 94be2361cc56
+Revises: 106bbc09bdd2
+Create Date: 2026-10-18 15:48:12.604417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '94be2361cc56'
+down_revision = '106bbc09bdd2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('artifact_imports', sa.Column('phase_time', sa.DateTime(), nullable=True))
+    op.create_table('importer_phase_stats',
+    sa.Column('importer_instance_id', sa.Integer(), nullable=False),
+    sa.Column('import_type', sa.String(length=64), nullable=False),
+    sa.Column('phase', sa.String(length=64), nullable=False),
+    sa.Column('ewma_duration', sa.Float(), nullable=False),
+    sa.Column('samples', sa.Integer(), nullable=False),
+    sa.Column('mtime', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['importer_instance_id'], ['importer_instances.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('importer_instance_id', 'import_type', 'phase')
+    )
+
+
+def downgrade():
+    op.drop_table('importer_phase_stats')
+    op.drop_column('artifact_imports', 'phase_time')
@@ -0,0 +1,32 @@
+"""artifact import file contents
+
+Revision ID: 958ecc2e8d1d
+Revises: 239726789a94
+Create Date: 2026-10-19 14:02:11.318906
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '958ecc2e8d1d'
+down_revision = '239726789a94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('artifact_import_file_contents',
+    sa.Column('artifact_import_id', sa.Integer(), nullable=False),
+    sa.Column('file_content_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artifact_import_id'], ['artifact_imports.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['file_content_id'], ['file_content.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artifact_import_id', 'file_content_id')
+    )
+    op.create_index('artifact_import_file_contents_file_content_id_idx', 'artifact_import_file_contents', ['file_content_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('artifact_import_file_contents_file_content_id_idx', table_name='artifact_import_file_contents')
+    op.drop_table('artifact_import_file_contents')
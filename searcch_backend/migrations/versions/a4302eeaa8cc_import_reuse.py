@@ -0,0 +1,30 @@
+"""import reuse
+
+Revision ID: a4302eeaa8cc
+Revises: 94be2361cc56
+Create Date: 2026-10-18 16:31:07.218853
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4302eeaa8cc'
+down_revision = '94be2361cc56'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('artifact_imports', sa.Column('normalized_url', sa.String(length=1024), nullable=True))
+    op.add_column('artifact_imports', sa.Column('reused_import_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('artifact_imports_reused_import_id_fkey', 'artifact_imports', 'artifact_imports', ['reused_import_id'], ['id'], ondelete='SET NULL')
+    op.create_index('artifact_imports_normalized_url_idx', 'artifact_imports', ['normalized_url', 'phase_time'], unique=False, postgresql_where=sa.text("status = 'completed' AND artifact_id IS NOT NULL"))
+
+
+def downgrade():
+    op.drop_index('artifact_imports_normalized_url_idx', table_name='artifact_imports')
+    op.drop_constraint('artifact_imports_reused_import_id_fkey', 'artifact_imports', type_='foreignkey')
+    op.drop_column('artifact_imports', 'reused_import_id')
+    op.drop_column('artifact_imports', 'normalized_url')
@@ -0,0 +1,46 @@
+"""daily views and trending
+
+Revision ID: e0d6d45d0185
+Revises: 621e9301a827
+Create Date: 2026-10-18 13:41:09.285517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e0d6d45d0185'
+down_revision = '621e9301a827'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('recent_views', sa.Column('ctime', sa.DateTime(), nullable=False, server_default=sa.text('now()')))
+
+    op.create_table('stats_views_daily',
+    sa.Column('artifact_group_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('view_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artifact_group_id'], ['artifact_groups.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artifact_group_id', 'day')
+    )
+    op.create_index('stats_views_daily_day_idx', 'stats_views_daily', ['day'])
+
+    op.create_table('artifact_trending',
+    sa.Column('artifact_group_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['artifact_group_id'], ['artifact_groups.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artifact_group_id')
+    )
+    op.create_index('artifact_trending_score_idx', 'artifact_trending', [sa.text('score DESC')])
+
+
+def downgrade():
+    op.drop_index('artifact_trending_score_idx')
+    op.drop_table('artifact_trending')
+    op.drop_index('stats_views_daily_day_idx')
+    op.drop_table('stats_views_daily')
+    op.drop_column('recent_views', 'ctime')
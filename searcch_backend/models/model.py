@@ -3,8 +3,11 @@ from sqlalchemy.dialects.postgresql import TSVECTOR, BYTEA
 from sqlalchemy import Table, MetaData
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
-from sqlalchemy import event
+from sqlalchemy import event, inspect
 from sqlalchemy.sql import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import load_only
+import collections
 import hashlib
 import logging
 
@@ -32,17 +35,26 @@ class FileContent(db.Model):
     __tablename__ = "file_content"
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    content = db.Column(db.LargeBinary(), nullable=False)
+    # Deferred: artifacts and their files are loaded far more often than
+    # file bytes are needed; see FileContentResource to download them.
+    content = db.deferred(db.Column(db.LargeBinary(), nullable=False))
     hash = db.Column(db.Binary(32), nullable=False)
     size = db.Column(db.BigInteger, nullable=False)
+    # When the content was last stored or claimed by an import; content no
+    # artifact references is deleted FILE_CONTENT_ORPHAN_TTL after this.
+    mtime = db.Column(db.DateTime, nullable=False, server_default=func.now())
 
     __table_args__ = (
         db.UniqueConstraint("hash"),
+        db.Index("file_content_mtime_idx","mtime"),
     )
 
     __user_ro_fields__ = (
         "hash",
     )
+    # object_from_json does not query for matching content (by value);
+    # callers dedupe new content by hash in bulk (see dedupe).
+    __json_never_query__ = True
 
     @classmethod
     def make_hash(kls,content):
@@ -51,6 +63,116 @@ class FileContent(db.Model):
         d = m.digest()
         return d
 
+    @classmethod
+    def touch(kls,session,hashes):
+        """
+        Marks the stored content with @hashes as just used, so that it
+        is not deleted as an orphan for another FILE_CONTENT_ORPHAN_TTL.
+        Does not commit.
+        """
+        if not hashes:
+            return
+        session.query(kls).filter(kls.hash.in_(list(hashes)))\
+          .update({kls.mtime: func.now()}, synchronize_session=False)
+
+    @classmethod
+    def parse_hash(kls,file_hash):
+        """
+        Returns the SHA-256 digest given as the hex string @file_hash, or
+        None if it is malformed.
+        """
+        if not isinstance(file_hash, str) or len(file_hash) != 64:
+            return None
+        try:
+            return bytes.fromhex(file_hash)
+        except ValueError:
+            return None
+
+    @classmethod
+    def check_new(kls,holders,allowed_hashes=None):
+        """
+        Checks the new FileContents of @holders (objects with a
+        file_content relationship, i.e. ArtifactFiles and
+        ArtifactFileMembers), returning (holder, FileContent) pairs.  The
+        hash and size of new content are always computed from it, never
+        trusted; raises ValueError if a supplied hash differs.  A new
+        FileContent may instead carry only the hash of stored content, but
+        only if the hash is in @allowed_hashes (a set of digests; see
+        ArtifactImportFileContent): otherwise anyone could link, and then
+        read, content they never had.  Raises ValueError if it is not.
+        """
+        pending = []
+        for holder in holders:
+            fc = holder.file_content
+            if fc is None or inspect(fc).has_identity:
+                continue
+            if fc.content is None:
+                if not fc.hash:
+                    raise ValueError("file content requires content or hash")
+                if allowed_hashes is None or bytes(fc.hash) not in allowed_hashes:
+                    raise ValueError(
+                        "file content with hash %s must include its content" % (
+                            bytes(fc.hash).hex(),))
+            else:
+                digest = kls.make_hash(fc.content)
+                if fc.hash and bytes(fc.hash) != digest:
+                    raise ValueError(
+                        "file content does not match its hash %s" % (
+                            bytes(fc.hash).hex(),))
+                fc.hash = digest
+                fc.size = len(fc.content)
+            pending.append((holder,fc))
+        return pending
+
+    @classmethod
+    def dedupe(kls,session,holders,allowed_hashes=None):
+        """
+        Points each of @holders whose content is new at the stored
+        FileContent with the same hash, storing any missing content first;
+        raises ValueError if any new content fails check_new (given
+        @allowed_hashes).  All hashes are computed up front; existing
+        content is found with one query, and the rest inserted with one
+        INSERT ... ON CONFLICT (hash) DO NOTHING RETURNING.  Stored content
+        is loaded without its bytes.  Returns the number of contents
+        inserted.
+        """
+        pending = kls.check_new(holders,allowed_hashes=allowed_hashes)
+        by_hash = collections.OrderedDict()
+        for (holder,fc) in pending:
+            if fc.content is not None or bytes(fc.hash) not in by_hash:
+                by_hash[bytes(fc.hash)] = fc
+        if not pending:
+            return 0
+
+        def load(hashes):
+            # Do not flush the (possibly incomplete) objects being built.
+            with session.no_autoflush:
+                return dict([ (bytes(x.hash),x) for x in session.query(kls)\
+                    .options(load_only("id","hash","size"))\
+                    .filter(kls.hash.in_(hashes)).all() ])
+
+        stored = load(list(by_hash.keys()))
+        missing = [ h for h in by_hash if h not in stored ]
+        for h in missing:
+            if by_hash[h].content is None:
+                raise ValueError("no stored file content with hash %s" % (h.hex(),))
+        inserted = 0
+        if missing:
+            res = session.execute(
+                pg_insert(kls.__table__).values(
+                    [ dict(content=by_hash[h].content,hash=h,size=by_hash[h].size)
+                      for h in missing ])\
+                .on_conflict_do_nothing(index_elements=["hash"])\
+                .returning(kls.__table__.c.id))
+            inserted = len(res.fetchall())
+            # Includes any inserted concurrently, which we did not.
+            stored.update(load(missing))
+        for (holder,fc) in pending:
+            holder.file_content = stored[bytes(fc.hash)]
+            if fc in session:
+                session.expunge(fc)
+        return inserted
+
     def __repr__(self):
         return "<FileContent(id=%r,hash=%r,size=%r)>" % (
             self.id, self.hash, self.size )
@@ -60,14 +182,15 @@ class FileContent(db.Model):
 # table IGNOREs conflicts on updates.  But that means that to make inserts of
 # "new" content seamless, we have to update any objects without their primary
 # keys set, if there is an existing hash match.  We also calculate the hash and
-# size fields if they are missing.
+# size fields from the content, never trusting given ones (see
+# FileContent.check_new).
 #
 @event.listens_for(FileContent, 'before_insert')
 def file_content_fixups(mapper, connection, target):
-    if not target.hash:
-        target.hash = FileContent.make_hash(target.content)
-    if target.size is None:
-        target.size = len(target.content)
+    if target.content is None:
+        raise ValueError("file content requires content")
+    target.hash = FileContent.make_hash(target.content)
+    target.size = len(target.content)
     if target.id is None:
         res = connection.execute(text("select id from file_content where hash=:hashval"),
                                  hashval=target.hash)
@@ -92,7 +215,8 @@ class ArtifactFile(db.Model):
     members = db.relationship("ArtifactFileMember", uselist=True)
 
     __table_args__ = (
-        db.UniqueConstraint("artifact_id", "url"),)
+        db.UniqueConstraint("artifact_id", "url"),
+        db.Index("artifact_files_file_content_id_idx","file_content_id"),)
 
     def __repr__(self):
         return "<ArtifactFile(id=%r,artifact_id=%r,file_content_id=%r,url=%r,name=%r,mtime=%r)>" % (
@@ -117,7 +241,8 @@ class ArtifactFileMember(db.Model):
     file_content = db.relationship("FileContent",uselist=False)
 
     __table_args__ = (
-        db.UniqueConstraint("parent_file_id", "pathname"),)
+        db.UniqueConstraint("parent_file_id", "pathname"),
+        db.Index("artifact_file_members_file_content_id_idx","file_content_id"),)
 
     def __repr__(self):
         return "<ArtifactFileMember(id=%r,parent_file_id=%r,pathname=%r,name=%r,html_url=%r,size=%r,mtime=%r)>" % (
@@ -900,16 +1025,20 @@ class CandidateRelationship(db.Model):
             self.id, self.candidate_id, self.relation,
             self.related_candidate_id)
 
-class ArtifactSearchMaterializedView(db.Model):
-    # The ArtifactSearchMaterializedView class provides an internal model of a SEARCCH artifact's searchable index.
-    __tablename__ = "artifact_search_view"
+class ArtifactSearchIndex(db.Model):
+    # The ArtifactSearchIndex class provides an internal model of a SEARCCH artifact's searchable index.
+    # Rows are maintained per-artifact by triggers on artifacts, artifact_tags, and artifact_metadata.
+    __tablename__ = "artifact_search_index"
 
-    dummy_id = db.Column(db.Integer, primary_key=True)  # this id does not actually exist in the database
-    artifact_id = db.Column(db.Integer)
+    artifact_id = db.Column(db.Integer, db.ForeignKey("artifacts.id"), primary_key=True)
     doc_vector = db.Column(TSVECTOR)
+    mtime = db.Column(db.DateTime, nullable=False)
     
     def __repr__(self):
-        return "<ArtifactSearchMaterializedView(artifact_id=%r,doc_vector='%s')>" % (self.id, self.doc_vector)
+        return "<ArtifactSearchIndex(artifact_id=%r,doc_vector='%s')>" % (self.artifact_id, self.doc_vector)
+
+# The index used to be a materialized view; keep the old name for callers.
+ArtifactSearchMaterializedView = ArtifactSearchIndex
 
 
 ARTIFACT_IMPORT_STATUSES = (
@@ -931,6 +1060,8 @@ class ArtifactImport(db.Model):
         *ARTIFACT_IMPORT_TYPES,name="artifact_imports_type_enum"),
         nullable=False)
     url = db.Column(db.String(1024), nullable=False)
+    # The url as normalized for reuse of completed imports across users.
+    normalized_url = db.Column(db.String(1024), nullable=True)
     importer_module_name = db.Column(db.String(256), nullable=True)
     nofetch = db.Column(db.Boolean(), default=False)
     noextract = db.Column(db.Boolean(), default=False)
@@ -947,6 +1078,8 @@ class ArtifactImport(db.Model):
     phase = db.Column(db.Enum(
         *ARTIFACT_IMPORT_PHASES,
         name="artifact_imports_phase_enum"), nullable=False)
+    # When the importer entered the current phase
+    phase_time = db.Column(db.DateTime, nullable=True)
     message = db.Column(db.Text, nullable=True)
     progress = db.Column(db.Float, default=0.0)
     bytes_retrieved = db.Column(db.Integer, default=0, nullable=False)
@@ -962,6 +1095,23 @@ class ArtifactImport(db.Model):
     parent_artifact_id = db.Column(db.Integer, db.ForeignKey("artifacts.id"), nullable=True)
     artifact_id = db.Column(db.Integer, db.ForeignKey("artifacts.id"), nullable=True)
     archived = db.Column(db.Boolean, nullable=False, default=False)
+    # Set if this import's artifact was cloned from that import's, rather
+    # than produced by an importer.
+    reused_import_id = db.Column(
+        db.Integer, db.ForeignKey("artifact_imports.id", ondelete="SET NULL"),
+        nullable=True)
+    #
+    # The artifact JSON an importer pushed on completion, queued for the
+    # ingester (see api/common/ingest.py) while status is running and phase
+    # is done; cleared once ingested.  The ingest_* columns record when the
+    # payload was received, when ingestion started and ended, and the
+    # per-stage durations (a JSON object of seconds by stage).
+    #
+    payload = db.deferred(db.Column(db.Text, nullable=True))
+    payload_time = db.Column(db.DateTime, nullable=True)
+    ingest_start_time = db.Column(db.DateTime, nullable=True)
+    ingest_end_time = db.Column(db.DateTime, nullable=True)
+    ingest_timings = db.Column(db.Text, nullable=True)
 
     owner = db.relationship("User", uselist=False)
     artifact_group = db.relationship("ArtifactGroup", uselist=False)
@@ -972,6 +1122,10 @@ class ArtifactImport(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint("owner_id","url","artifact_group_id","artifact_id"),
+        db.Index("artifact_imports_normalized_url_idx","normalized_url","phase_time",
+                 postgresql_where=db.text("status = 'completed' AND artifact_id IS NOT NULL")),
+        db.Index("artifact_imports_ingest_queue_idx","payload_time",
+                 postgresql_where=db.text("status = 'running' AND payload IS NOT NULL")),
     )
 
     def __repr__(self):
@@ -979,6 +1133,77 @@ class ArtifactImport(db.Model):
             self.id, self.type, self.url, self.importer_module_name,
             self.owner, self.status, self.artifact_group, self.artifact)
 
+class ArtifactImportFileContent(db.Model):
+    """
+    Records file content an import may reference by hash alone: content its
+    importer uploaded (proving it has the bytes), or that was already in a
+    published artifact.  See FileContent.check_new.
+    """
+    __tablename__ = "artifact_import_file_contents"
+
+    artifact_import_id = db.Column(
+        db.Integer, db.ForeignKey("artifact_imports.id", ondelete="CASCADE"),
+        primary_key=True)
+    file_content_id = db.Column(
+        db.Integer, db.ForeignKey("file_content.id", ondelete="CASCADE"),
+        primary_key=True)
+
+    __table_args__ = (
+        db.Index("artifact_import_file_contents_file_content_id_idx",
+                 "file_content_id"),
+    )
+
+    @classmethod
+    def grant(kls,session,artifact_import_id,hashes):
+        """
+        Allows the import to reference the stored content with @hashes by
+        hash alone.  Does not commit.
+        """
+        if not hashes:
+            return
+        session.execute(
+            pg_insert(kls.__table__).from_select(
+                ["artifact_import_id","file_content_id"],
+                db.select([db.literal(artifact_import_id),FileContent.id])\
+                  .where(FileContent.hash.in_(list(hashes))))\
+            .on_conflict_do_nothing())
+
+    @classmethod
+    def grant_artifact(kls,session,artifact_import_id,artifact_id):
+        """
+        Allows the import to reference the content of the files and file
+        members of the artifact @artifact_id by hash alone.  Does not
+        commit.
+        """
+        contents = db.union(
+            db.select([ArtifactFile.file_content_id])\
+              .where(ArtifactFile.artifact_id == artifact_id),
+            db.select([ArtifactFileMember.file_content_id])\
+              .select_from(ArtifactFileMember.__table__.join(
+                  ArtifactFile.__table__,
+                  ArtifactFileMember.parent_file_id == ArtifactFile.id))\
+              .where(ArtifactFile.artifact_id == artifact_id)).alias()
+        session.execute(
+            pg_insert(kls.__table__).from_select(
+                ["artifact_import_id","file_content_id"],
+                db.select([db.literal(artifact_import_id),contents.c.file_content_id])\
+                  .where(contents.c.file_content_id != None))\
+            .on_conflict_do_nothing())
+
+    @classmethod
+    def hashes(kls,session,artifact_import_id):
+        """
+        Returns the set of digests the import may reference by hash alone.
+        """
+        with session.no_autoflush:
+            return set([ bytes(h) for (h,) in session.query(FileContent.hash)\
+              .join(kls, kls.file_content_id == FileContent.id)\
+              .filter(kls.artifact_import_id == artifact_import_id).all() ])
+
+    def __repr__(self):
+        return "<ArtifactImportFileContent(artifact_import_id=%r,file_content_id=%r)>" % (
+            self.artifact_import_id, self.file_content_id)
+
 ARTIFACT_OWNER_REQUEST_STATUS = (
     "pending", "approved", "rejected", "pre_approved"
 )
@@ -1061,6 +1286,59 @@ class ImporterSchedule(db.Model):
             self.id, self.artifact_import, self.importer_instance, self.schedule_time)
 
 
+class ImporterHealthCheck(db.Model):
+    """
+    Result of one periodic /status poll of an importer instance.
+    """
+    __tablename__ = "importer_health_checks"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    importer_instance_id = db.Column(
+        db.Integer, db.ForeignKey("importer_instances.id", ondelete="CASCADE"),
+        nullable=False)
+    check_time = db.Column(db.DateTime, nullable=False)
+    ok = db.Column(db.Boolean, nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)
+    # Round-trip time of the /status request, in seconds.
+    latency = db.Column(db.Float, nullable=True)
+    # Tasks the importer reported running, if it did.
+    num_tasks = db.Column(db.Integer, nullable=True)
+    message = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        db.Index("importer_health_checks_instance_time_idx",
+                 "importer_instance_id", "check_time"),
+    )
+
+    def __repr__(self):
+        return "<ImporterHealthCheck(id=%r,importer_instance_id=%r,check_time=%r,ok=%r,status_code=%r,latency=%r,num_tasks=%r)>" % (
+            self.id, self.importer_instance_id, self.check_time, self.ok,
+            self.status_code, self.latency, self.num_tasks)
+
+
+class ImporterPhaseStats(db.Model):
+    """
+    Rolling (EWMA) duration, in seconds, of one import phase of one import
+    type on one importer instance; the import scheduler's service-time
+    model.
+    """
+    __tablename__ = "importer_phase_stats"
+
+    importer_instance_id = db.Column(
+        db.Integer, db.ForeignKey("importer_instances.id", ondelete="CASCADE"),
+        primary_key=True)
+    import_type = db.Column(db.String(64), primary_key=True)
+    phase = db.Column(db.String(64), primary_key=True)
+    ewma_duration = db.Column(db.Float, nullable=False)
+    samples = db.Column(db.Integer, nullable=False)
+    mtime = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return "<ImporterPhaseStats(importer_instance_id=%r,import_type=%r,phase=%r,ewma_duration=%r,samples=%r)>" % (
+            self.importer_instance_id, self.import_type, self.phase,
+            self.ewma_duration, self.samples)
+
+
 # Models to capture Statistical Data
 
 class StatsArtifactViews(db.Model):
@@ -1073,6 +1351,10 @@ class StatsArtifactViews(db.Model):
     def __repr__(self):
         return "<StatsArtifactViews(id=%r, artifact_group_id=%r, user_id=%r,view_count=%r)>" % (self.id, self.artifact_group_id, self.user_id, self.view_count)
 
+# One row per (artifact group, user); anonymous views share user_id NULL.
+db.Index("stats_views_group_user_idx", StatsArtifactViews.artifact_group_id,
+         func.coalesce(StatsArtifactViews.user_id, 0), unique=True)
+
 class StatsSearches(db.Model):
     __tablename__ = "stats_searches"
 
@@ -1089,9 +1371,57 @@ class StatsRecentViews(db.Model):
     artifact_group_id = db.Column(db.Integer, db.ForeignKey("artifact_groups.id"), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
     view_count = db.Column(db.Integer, nullable=False)
+    ctime = db.Column(db.DateTime, nullable=False, server_default=func.now())
     def __repr__(self):
         return "<StatsRecentViews(id=%r, session_id=%r, artifact_group_id=%r, user_id=%r,view_count=%r)>" % (self.id, self.session_id, self.artifact_group_id, self.user_id, self.view_count)
 
+class StatsArtifactViewsDaily(db.Model):
+    """
+    Per-day view counts of an artifact group, rolled up from recent_views.
+    """
+    __tablename__ = "stats_views_daily"
+
+    artifact_group_id = db.Column(db.Integer, db.ForeignKey("artifact_groups.id"), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    view_count = db.Column(db.Integer, nullable=False)
+    def __repr__(self):
+        return "<StatsArtifactViewsDaily(artifact_group_id=%r, day=%r, view_count=%r)>" % (self.artifact_group_id, self.day, self.view_count)
+
+class ArtifactTrending(db.Model):
+    """
+    Precomputed trending score (exponentially-decayed daily views) of an
+    artifact group; rebuilt periodically by the background tasks.
+    """
+    __tablename__ = "artifact_trending"
+
+    artifact_group_id = db.Column(db.Integer, db.ForeignKey("artifact_groups.id"), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False)
+    def __repr__(self):
+        return "<ArtifactTrending(artifact_group_id=%r, score=%r, computed_at=%r)>" % (self.artifact_group_id, self.score, self.computed_at)
+
+class ArtifactGroupStats(db.Model):
+    """
+    Per-artifact-group rollup of rating, review, and view counters.  Rows
+    are maintained by triggers on artifact_ratings, artifact_reviews, and
+    stats_views, so readers can do a single primary-key join instead of
+    aggregating those tables on every request.  A group without any
+    ratings, reviews, or views may not have a row yet; readers must outer
+    join and coalesce.
+    """
+    __tablename__ = "artifact_group_stats"
+
+    artifact_group_id = db.Column(
+        db.Integer, db.ForeignKey("artifact_groups.id", ondelete="CASCADE"),
+        primary_key=True)
+    num_ratings = db.Column(db.Integer, nullable=False, default=0)
+    avg_rating = db.Column(db.Float, nullable=False, default=0.0)
+    num_reviews = db.Column(db.Integer, nullable=False, default=0)
+    view_count = db.Column(db.Integer, nullable=False, default=0)
+    last_updated = db.Column(db.DateTime, nullable=False)
+    def __repr__(self):
+        return "<ArtifactGroupStats(artifact_group_id=%r, num_ratings=%r, avg_rating=%r, num_reviews=%r, view_count=%r)>" % (self.artifact_group_id, self.num_ratings, self.avg_rating, self.num_reviews, self.view_count)
+
 class OwnershipInvitation(db.Model):
     __tablename__ = "ownership_invitations"
 
@@ -1111,3 +1441,20 @@ class OwnershipEmail(db.Model):
     opt_out = db.Column(db.Boolean, nullable=False, default=False)
     def __repr__(self):
         return "<OwnershipEmail(email=%r, key=%r, opt_out=%r, valid_until=%r)" % (self.email, self.key, self.opt_out, self.valid_until)
+
+class BackgroundJobRun(db.Model):
+    """
+    Last run of each background job (see searcch_backend.jobs), as recorded
+    by whichever jobs process ran it.
+    """
+    __tablename__ = "background_job_runs"
+
+    name = db.Column(db.String(128), primary_key=True)
+    last_start = db.Column(db.DateTime, nullable=True)
+    last_success = db.Column(db.DateTime, nullable=True)
+    last_duration = db.Column(db.Float, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    runs = db.Column(db.Integer, nullable=False, default=0)
+    failures = db.Column(db.Integer, nullable=False, default=0)
+    def __repr__(self):
+        return "<BackgroundJobRun(name=%r, last_start=%r, last_success=%r, last_duration=%r, runs=%r, failures=%r)>" % (self.name, self.last_start, self.last_success, self.last_duration, self.runs, self.failures)
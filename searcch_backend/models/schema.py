@@ -69,7 +69,7 @@ class FileContentSchema(SQLAlchemyAutoSchema):
         model_converter = ModelConverter
         include_fk = False
         include_relationships = False
-        exclude = ()
+        exclude = ('content',)
 
 
 class ArtifactFileMemberSchema(SQLAlchemyAutoSchema):
@@ -470,8 +470,8 @@ class ArtifactSchema(SQLAlchemyAutoSchema):
     view_count = fields.Method("get_views")
 
     def get_views(self, obj):
-        result = db.session.query(Artifact, StatsArtifactViews.view_count.label("view_count")).join(StatsArtifactViews, Artifact.artifact_group_id==StatsArtifactViews.artifact_group_id).filter(Artifact.artifact_group_id==obj.artifact_group_id).first()
-        if hasattr(result, "view_count"):
+        result = db.session.query(ArtifactGroupStats.view_count).filter(ArtifactGroupStats.artifact_group_id==obj.artifact_group_id).first()
+        if result:
             return result.view_count
         return 0
 
@@ -553,9 +553,9 @@ class CandidateArtifactRelationshipShallowSchema(SQLAlchemyAutoSchema):
     related_candidate = Nested(CandidateArtifactShallowSchema)
 
 
-class ArtifactSearchMaterializedViewSchema(SQLAlchemyAutoSchema):
+class ArtifactSearchIndexSchema(SQLAlchemyAutoSchema):
     class Meta:
-        model = ArtifactSearchMaterializedView
+        model = ArtifactSearchIndex
         model_converter = ModelConverter
         exclude = ('doc_vector',)
         include_fk = True
@@ -565,7 +565,7 @@ class ArtifactImportSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = ArtifactImport
         model_converter = ModelConverter
-        exclude = ('candidate_artifact',)
+        exclude = ('candidate_artifact', 'payload')
         include_fk = True
         include_relationships = True
 
@@ -577,7 +577,7 @@ class ArtifactImportShallowSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = ArtifactImport
         model_converter = ModelConverter
-        exclude = ('log', 'owner', 'artifact_group', 'artifact')
+        exclude = ('log', 'owner', 'artifact_group', 'artifact', 'payload')
         include_fk = True
         include_relationships = True
 
@@ -585,7 +585,7 @@ class ArtifactImportWithCandidatesSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = ArtifactImport
         model_converter = ModelConverter
-        exclude = ()
+        exclude = ('payload',)
         include_fk = True
         include_relationships = True
 
@@ -622,6 +622,15 @@ class ImporterScheduleSchema(SQLAlchemyAutoSchema):
     artifact_import = Nested(ArtifactImportSchema, many=False)
 
 
+class ImporterHealthCheckSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = ImporterHealthCheck
+        model_converter = ModelConverter
+        exclude = ()
+        include_fk = True
+        include_relationships = True
+
+
 class ImporterInstanceSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = ImporterInstance
@@ -631,3 +640,12 @@ class ImporterInstanceSchema(SQLAlchemyAutoSchema):
         include_relationships = True
 
     scheduled = Nested(ImporterScheduleSchema, many=True)
+
+
+class BackgroundJobRunSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = BackgroundJobRun
+        model_converter = ModelConverter
+        exclude = ()
+        include_fk = True
+        include_relationships = True
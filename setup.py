@@ -31,5 +31,10 @@ if __name__ == "__main__":
             "Topic :: Utilities",
         ],
         keywords="searcch",
-        packages=setuptools.find_packages()
+        packages=setuptools.find_packages(),
+        entry_points={
+            "console_scripts": [
+                "searcch-jobs=searcch_backend.jobs:main",
+            ],
+        },
     )
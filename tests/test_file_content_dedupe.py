@@ -0,0 +1,86 @@
+#
+# Checks FileContent.dedupe's handling of hashes: the hash of new content is
+# computed from it, never trusted.  The storing tests need a configured
+# database (see FLASK_INSTANCE_CONFIG_FILE):
+#
+#   FLASK_INSTANCE_CONFIG_FILE=... python -m pytest tests
+#
+
+import hashlib
+
+import pytest
+
+pytest.importorskip("flask_sqlalchemy")
+
+
+class Holder(object):
+    def __init__(self, file_content):
+        self.file_content = file_content
+
+
+@pytest.fixture(scope="module")
+def models():
+    # Import the app before anything from models, to avoid the circular
+    # import through searcch_backend.models.model.
+    from searcch_backend.api.app import app, db
+    from searcch_backend.models import model
+    return (app, db, model)
+
+
+@pytest.fixture
+def session(models):
+    (app, db, model) = models
+    with app.app_context():
+        try:
+            db.session.execute("SELECT 1")
+        except Exception as ex:
+            pytest.skip("database unavailable: %s" % (ex,))
+        yield db.session
+        db.session.rollback()
+
+
+def test_mismatched_hash_rejected(models):
+    (app, db, model) = models
+    fc = model.FileContent(content=b"abc", hash=hashlib.sha256(b"xyz").digest())
+    with pytest.raises(ValueError):
+        model.FileContent.dedupe(None, [Holder(fc)])
+
+
+def test_content_or_hash_required(models):
+    (app, db, model) = models
+    with pytest.raises(ValueError):
+        model.FileContent.dedupe(None, [Holder(model.FileContent())])
+
+
+def test_hash_and_size_computed(models, session):
+    (app, db, model) = models
+    content = b"test_hash_and_size_computed %r" % (id(session),)
+    holders = [ Holder(model.FileContent(content=content, size=1)),
+                Holder(model.FileContent(
+                    content=content, hash=hashlib.sha256(content).digest())) ]
+    model.FileContent.dedupe(session, holders)
+    (a, b) = (holders[0].file_content, holders[1].file_content)
+    assert a is b
+    assert bytes(a.hash) == hashlib.sha256(content).digest()
+    assert a.size == len(content)
+
+
+def test_unknown_hash_only_rejected(models, session):
+    (app, db, model) = models
+    digest = hashlib.sha256(b"never stored %r" % (id(session),)).digest()
+    fc = model.FileContent(hash=digest, size=1)
+    with pytest.raises(ValueError):
+        model.FileContent.dedupe(session, [Holder(fc)],
+                                 allowed_hashes=set([digest]))
+
+
+def test_hash_only_needs_allowed_hash(models):
+    (app, db, model) = models
+    digest = hashlib.sha256(b"abc").digest()
+    holder = Holder(model.FileContent(hash=digest, size=3))
+    with pytest.raises(ValueError):
+        model.FileContent.check_new([holder])
+    with pytest.raises(ValueError):
+        model.FileContent.check_new([holder], allowed_hashes=set())
+    assert model.FileContent.check_new(
+        [holder], allowed_hashes=set([digest])) == [(holder, holder.file_content)]
@@ -0,0 +1,107 @@
+#
+# Checks the importer selection policies and the trace-replay simulator
+# (neither needs the app or a database).
+#
+
+import pytest
+
+from searcch_backend.api.common.import_policy import (
+    ImporterState, POLICIES, choose_importer, ewma,
+    least_loaded, expected_completion)
+from searcch_backend.api.common.import_sim import simulate
+
+
+def test_estimate_fallbacks():
+    assert ImporterState(1, 2, default_estimate=30.0).estimate("dataset") == 30.0
+    ii = ImporterState(1, 2, estimates=dict(dataset=10.0, software=20.0))
+    assert ii.estimate("dataset") == 10.0
+    assert ii.estimate("unknown") == 15.0
+
+
+def test_least_loaded():
+    importers = [ ImporterState(1, 4, running=2), ImporterState(2, 2, running=0),
+                  ImporterState(3, 2, running=0), ImporterState(4, 1, running=1) ]
+    assert least_loaded(importers, "dataset").id == 2
+    importers[1].running = importers[2].running = 2
+    assert least_loaded(importers, "dataset").id == 1
+    importers[0].running = 4
+    assert least_loaded(importers, "dataset") is None
+
+
+def test_expected_completion_prefers_faster():
+    slow = ImporterState(1, 4, estimates=dict(dataset=100.0))
+    fast = ImporterState(2, 4, running=3, estimates=dict(dataset=20.0))
+    assert expected_completion([slow, fast], "dataset").id == 2
+    # 20 * (1 + 10 * 3/4) = 170 > 100
+    assert expected_completion([slow, fast], "dataset", contention=10).id == 1
+    fast.running = 4
+    assert expected_completion([slow, fast], "dataset").id == 1
+    slow.running = 4
+    assert expected_completion([slow, fast], "dataset") is None
+
+
+def test_expected_completion_affinity():
+    general = ImporterState(1, 4, estimates=dict(software=30.0))
+    datasets = ImporterState(2, 4, estimates=dict(software=20.0),
+                             affinity=["dataset"])
+    assert expected_completion([general, datasets], "software").id == 1
+    assert expected_completion([general, datasets], "software",
+                               affinity_penalty=1.0).id == 2
+    assert expected_completion([general, datasets], "dataset").id == 2
+
+
+def test_choose_importer():
+    importers = [ ImporterState(1, 2, estimates=dict(dataset=50.0)),
+                  ImporterState(2, 4, running=1, estimates=dict(dataset=10.0)) ]
+    assert choose_importer(importers, "dataset").id == 2
+    assert choose_importer(importers, "dataset", policy="least_loaded").id == 1
+    assert set(POLICIES) == set(["least_loaded", "expected_completion"])
+    with pytest.raises(KeyError):
+        choose_importer(importers, "dataset", policy="random")
+
+
+def test_ewma():
+    assert ewma(None, 10.0, 0.3) == 10.0
+    assert ewma(10.0, 20.0, 0.5) == 15.0
+    assert ewma(10.0, 20.0, 0.0) == 10.0
+
+
+def test_simulate_serial():
+    res = simulate([dict(id=1, max_tasks=1)],
+                   [dict(arrival=0.0, type="dataset", duration=10.0),
+                    dict(arrival=0.0, type="dataset", duration=10.0)],
+                   "least_loaded")
+    assert res["imports"] == 2
+    assert res["makespan"] == 20.0
+    assert res["mean_wait"] == 5.0
+    assert res["mean_latency"] == 15.0
+    assert (res["p50_latency"], res["p95_latency"]) == (20.0, 20.0)
+
+
+def test_simulate_contention():
+    res = simulate([dict(id=1, max_tasks=2)],
+                   [dict(arrival=0.0, type="dataset", duration=10.0),
+                    dict(arrival=0.0, type="dataset", duration=10.0)],
+                   "least_loaded", contention=0.5)
+    # The second runs alongside the first: 10 * (1 + 0.5 * 1/2).
+    assert res["makespan"] == 12.5
+    assert res["mean_wait"] == 0.0
+
+
+def test_simulate_learns_faster_importer():
+    importers = [ dict(id=1, max_tasks=4, speed=0.25),
+                  dict(id=2, max_tasks=4, speed=1.0) ]
+    imports = [ dict(arrival=30.0 * i, type="software", duration=20.0)
+                for i in range(40) ]
+    by_policy = dict([ (policy, simulate(importers, imports, policy))
+                       for policy in POLICIES ])
+    assert by_policy["least_loaded"]["imports"] == 40
+    assert by_policy["expected_completion"]["imports"] == 40
+    assert by_policy["expected_completion"]["mean_latency"] \
+        < by_policy["least_loaded"]["mean_latency"]
+
+
+def test_simulate_empty():
+    res = simulate([dict(id=1, max_tasks=1)], [], "expected_completion")
+    assert res["imports"] == 0
+    assert res["mean_latency"] is None and res["p95_latency"] is None
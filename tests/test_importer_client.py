@@ -0,0 +1,146 @@
+#
+# Checks the importer client's circuit breaker, and how the notifier
+# handles an importer's rejection of an import.  Needs the app's
+# configuration, but not a database.
+#
+
+import pytest
+
+pytest.importorskip("flask_sqlalchemy")
+
+
+@pytest.fixture(scope="module")
+def importer():
+    # Import the app before anything from models, to avoid the circular
+    # import through searcch_backend.models.model.
+    import searcch_backend.api.app
+    from searcch_backend.api.common import importer
+    return importer
+
+
+@pytest.fixture
+def clock(importer, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(importer.time, "monotonic", lambda: now[0])
+    return now
+
+
+def make_client(importer):
+    return importer.ImporterClient(
+        "http://importer.example.org", "key",
+        failure_threshold=2, reset_timeout=60)
+
+
+def test_opens_after_threshold(importer, clock):
+    client = make_client(importer)
+    assert client.allow()
+    assert not client.failure()
+    assert client.allow() and not client.is_open()
+    assert client.failure()
+    assert client.is_open()
+    assert not client.allow()
+    clock[0] += 59
+    assert not client.allow()
+
+
+def test_half_open_allows_one_probe(importer, clock):
+    client = make_client(importer)
+    client.failure()
+    client.failure()
+    clock[0] += 60
+    assert client.allow()
+    assert not client.allow()
+    client.success()
+    assert not client.is_open()
+    assert client.allow() and client.allow()
+
+
+def test_failed_probe_reopens(importer, clock):
+    client = make_client(importer)
+    client.failure()
+    client.failure()
+    clock[0] += 60
+    assert client.allow()
+    assert client.failure()
+    assert not client.allow()
+    clock[0] += 60
+    assert client.allow()
+
+
+def test_silent_probe_is_replaced(importer, clock):
+    client = make_client(importer)
+    client.failure()
+    client.failure()
+    clock[0] += 60
+    assert client.allow()
+    clock[0] += 59
+    assert not client.allow()
+    clock[0] += 1
+    assert client.allow()
+
+
+class Response(object):
+    def __init__(self, status_code, j=None, text=""):
+        self.status_code = status_code
+        self._j = j
+        self.text = text
+
+    def json(self):
+        if self._j is None:
+            raise ValueError("no JSON")
+        return self._j
+
+
+class Client(object):
+    url = "http://importer.example.org"
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.failures = 0
+
+    def allow(self):
+        return True
+
+    def is_open(self):
+        return False
+
+    def success(self):
+        self.failures = 0
+
+    def failure(self):
+        self.failures += 1
+        return False
+
+    def post(self, path, data):
+        return self.responses.pop(0)
+
+
+def deliver(importer, monkeypatch, responses):
+    notifier = importer.ImporterNotifier(retries=3, backoff=0)
+    calls = []
+    monkeypatch.setattr(notifier, "_fail_import",
+                        lambda *args: calls.append(("fail",) + args))
+    monkeypatch.setattr(notifier, "_deschedule",
+                        lambda *args: calls.append(("deschedule",) + args))
+    client = Client(responses)
+    notifier._deliver(client, 1, 2, 3, "{}")
+    return (client, calls)
+
+
+def test_rejected_import_fails(importer, monkeypatch):
+    (client, calls) = deliver(importer, monkeypatch, [
+        Response(400, j=dict(message="unsupported URL")) ])
+    assert len(calls) == 1
+    (kind, iid, sid, aid, msg) = calls[0]
+    assert (kind, iid, sid, aid) == ("fail", 1, 2, 3)
+    assert "400" in msg and "unsupported URL" in msg
+    assert client.failures == 0
+
+
+def test_throttled_import_is_retried(importer, monkeypatch):
+    (client, calls) = deliver(importer, monkeypatch, [
+        Response(429, text="slow down"), Response(200) ])
+    assert calls == []
+    (client, calls) = deliver(importer, monkeypatch, [
+        Response(429), Response(503), Response(429) ])
+    assert [ c[0] for c in calls ] == ["deschedule"]
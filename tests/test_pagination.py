@@ -0,0 +1,118 @@
+#
+# Checks the pagination helpers: cursors (which must round-trip, and
+# refuse values of the wrong types or for another ordering), and the
+# count-free and estimated-total modes of paginate.
+#
+
+import datetime
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from searcch_backend.api.common import pagination
+from searcch_backend.api.common.pagination import (
+    InvalidCursor, Page, paginate, encode_cursor, decode_cursor)
+
+
+def test_cursor_round_trip():
+    values = [3.5, "Title", datetime.datetime(2026, 10, 19, 12, 30, 15, 250), 42]
+    types = [float, str, datetime.datetime, int]
+    cursor = encode_cursor("relevance", values)
+    assert isinstance(cursor, str)
+    assert decode_cursor(cursor, "relevance", types) == values
+
+
+def test_cursor_int_as_float():
+    cursor = encode_cursor("relevance", [3, 7])
+    assert decode_cursor(cursor, "relevance", [float, int]) == [3.0, 7]
+
+
+@pytest.mark.parametrize("shape,types", [
+    ("date", [float, int]),
+    ("relevance", [float]),
+    ("relevance", [float, int, int]),
+])
+def test_cursor_shape_mismatch(shape, types):
+    cursor = encode_cursor("relevance", [1.5, 7])
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, shape, types)
+
+
+@pytest.mark.parametrize("values,types", [
+    (["7"], [int]),
+    ([True], [int]),
+    ([True], [float]),
+    ([7], [str]),
+    ([7], [datetime.datetime]),
+])
+def test_cursor_wrong_type(values, types):
+    cursor = encode_cursor("id", values)
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, "id", types)
+
+
+@pytest.mark.parametrize("cursor", [
+    "!!!",
+    "bm90IGpzb24",
+    encode_cursor("id", [1])[:-4],
+    pagination.base64.urlsafe_b64encode(b'{"s":"id"}').decode("ascii"),
+    pagination.base64.urlsafe_b64encode(b'{"s":"id","k":[{"dt":"x"}]}').decode("ascii"),
+])
+def test_cursor_malformed(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, "id", [int])
+
+
+class ListQuery(object):
+    """The parts of a Query that paginate uses, over a list."""
+
+    def __init__(self, rows, start=0, stop=None):
+        self.rows = rows
+        self.start = start
+        self.stop = stop
+
+    def offset(self, n):
+        return ListQuery(self.rows, n, self.stop)
+
+    def limit(self, n):
+        return ListQuery(self.rows, self.start, self.start + n)
+
+    def all(self):
+        return self.rows[self.start:self.stop]
+
+
+@pytest.mark.parametrize("page,items,has_next", [
+    (1, [0, 1, 2], True),
+    (3, [6, 7, 8], True),
+    (4, [9], False),
+    (5, [], False),
+    (0, [0, 1, 2], True),
+    (None, [0, 1, 2], True),
+])
+def test_paginate_without_total(page, items, has_next):
+    p = paginate(ListQuery(list(range(10))), page, 3, total="none")
+    assert (p.items, p.has_next, p.total) == (items, has_next, None)
+    assert p.pages is None
+    assert p.as_dict() == dict(page=max(page or 1, 1), has_next=has_next)
+
+
+@pytest.mark.parametrize("estimate,total", [(100, 100), (2, 10), (0, 10)])
+def test_paginate_estimate_covers_rows_seen(monkeypatch, estimate, total):
+    monkeypatch.setattr(pagination, "estimate_count", lambda query: estimate)
+    p = paginate(ListQuery(list(range(10))), 3, 3, total="estimate")
+    assert p.items == [6, 7, 8] and p.has_next
+    assert p.total == total
+    d = p.as_dict()
+    assert d["total"] == total and d["total_is_estimate"]
+    assert d["pages"] == -(-total // 3)
+
+
+def test_paginate_unbounded_page():
+    p = paginate(ListQuery(list(range(5))), 1, pagination.sys.maxsize, total="none")
+    assert p.items == list(range(5)) and not p.has_next
+
+
+def test_exact_page_dict():
+    d = Page([1, 2], 2, 2, True, total=5).as_dict()
+    assert d == dict(page=2, has_next=True, total=5, pages=3)
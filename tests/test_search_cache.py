@@ -0,0 +1,153 @@
+#
+# Checks the search result cache: its keys (normalized, and scoped to the
+# invalidation generation), its values, and its invalidation on commits
+# that publish or rate artifacts.  Needs the app's configuration, but not
+# a database.
+#
+
+import pytest
+
+pytest.importorskip("flask_sqlalchemy")
+
+
+@pytest.fixture(scope="module")
+def cache():
+    # Import the app before anything from models, to avoid the circular
+    # import through searcch_backend.models.model.
+    import searcch_backend.api.app
+    from searcch_backend.api.common import cache
+    return cache
+
+
+class Backend(object):
+    """A dict-backed cache backend with a generation counter."""
+
+    def __init__(self):
+        self.values = dict()
+        self.gen = 0
+        self.broken = False
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ttl):
+        self.values[key] = value
+
+    def generation(self):
+        if self.broken:
+            raise IOError("backend unavailable")
+        return self.gen
+
+    def invalidate(self):
+        self.gen += 1
+
+
+def make_key(c, keywords=None, artifact_types=None, author_keywords=None,
+             page_num=1, sort_by="relevance"):
+    return c.make_key(keywords, artifact_types, author_keywords, None, None,
+                      None, None, None, page_num, 10, sort_by, "desc", None,
+                      "exact")
+
+
+def test_key_normalized(cache):
+    c = cache.SearchResultCache(Backend(), 60)
+    key = make_key(c, keywords="Network  Traces", artifact_types=["dataset", "code"])
+    assert key == make_key(c, keywords=" network traces ",
+                           artifact_types=["code", "dataset", "code"])
+    assert make_key(c, artifact_types="code") == make_key(c, artifact_types=["code"])
+    assert make_key(c, keywords="", artifact_types=[]) == make_key(c)
+
+
+def test_key_distinguishes_params(cache):
+    c = cache.SearchResultCache(Backend(), 60)
+    keys = set([
+        make_key(c),
+        make_key(c, keywords="traces"),
+        make_key(c, author_keywords=["traces"]),
+        make_key(c, page_num=2),
+        make_key(c, sort_by="date"),
+    ])
+    assert len(keys) == 5
+
+
+def test_key_scoped_to_generation(cache):
+    backend = Backend()
+    c = cache.SearchResultCache(backend, 60)
+    key = make_key(c, keywords="traces")
+    c.set(key, dict(artifacts=[1]))
+    c.invalidate()
+    assert make_key(c, keywords="traces") != key
+    assert c.get(make_key(c, keywords="traces")) is None
+
+
+def test_key_none_when_backend_down(cache):
+    backend = Backend()
+    backend.broken = True
+    assert make_key(cache.SearchResultCache(backend, 60)) is None
+
+
+def test_values_not_shared(cache):
+    c = cache.SearchResultCache(Backend(), 60)
+    result = dict(artifacts=[dict(id=1)])
+    c.set("k", result)
+    result["artifacts"].append(dict(id=2))
+    cached = c.get("k")
+    assert cached == dict(artifacts=[dict(id=1)])
+    cached["artifacts"].clear()
+    assert c.get("k") == dict(artifacts=[dict(id=1)])
+
+
+def test_ttl_cache_expiry_and_bound(cache, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    t = cache.TTLCache(max_entries=2, ttl=10)
+    t.set("a", 1)
+    t.set("b", 2)
+    assert t.get("a") == 1
+    t.set("c", 3)
+    assert (t.get("a"), t.get("b"), t.get("c")) == (1, None, 3)
+    now[0] += 10
+    assert t.get("a") is None
+
+
+class Session(object):
+    def __init__(self, new=(), dirty=(), deleted=()):
+        self.info = dict()
+        self.new = set(new)
+        self.dirty = set(dirty)
+        self.deleted = set(deleted)
+
+
+@pytest.fixture
+def installed(cache, monkeypatch):
+    backend = Backend()
+    monkeypatch.setattr(cache, "search_cache", cache.SearchResultCache(backend, 60))
+    return backend
+
+
+def test_publication_invalidates_on_commit(cache, installed):
+    from searcch_backend.models.model import ArtifactPublication
+    session = Session(new=[ArtifactPublication()])
+    cache.search_cache_after_flush(session, None)
+    assert installed.gen == 0
+    cache.search_cache_after_commit(session)
+    assert installed.gen == 1
+    cache.search_cache_after_commit(session)
+    assert installed.gen == 1
+
+
+def test_rollback_discards_invalidation(cache, installed):
+    from searcch_backend.models.model import ArtifactRatings
+    session = Session(dirty=[ArtifactRatings()])
+    cache.search_cache_after_flush(session, None)
+    cache.search_cache_after_rollback(session)
+    cache.search_cache_after_commit(session)
+    assert installed.gen == 0
+
+
+def test_unrelated_changes_keep_cache(cache, installed):
+    from searcch_backend.models.model import ArtifactPublication, Artifact
+    session = Session(new=[Artifact()], dirty=[ArtifactPublication()])
+    cache.search_cache_after_flush(session, None)
+    cache.search_cache_after_commit(session)
+    assert installed.gen == 0
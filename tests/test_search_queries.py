@@ -0,0 +1,62 @@
+#
+# Checks that a page of artifact search results is rendered without
+# per-row (lazy) loads: the number of SQL statements a search issues must
+# not depend on its page size.  Needs a configured database (see
+# FLASK_INSTANCE_CONFIG_FILE) with some published artifacts:
+#
+#   FLASK_INSTANCE_CONFIG_FILE=... python -m pytest tests
+#
+
+import pytest
+
+pytest.importorskip("flask_sqlalchemy")
+
+from sqlalchemy import event
+
+
+@pytest.fixture(scope="module")
+def app():
+    from searcch_backend.api.app import app, db
+    from searcch_backend.models.model import ArtifactGroup
+
+    app.config["SEARCH_CACHE_BACKEND"] = None
+    with app.app_context():
+        try:
+            published = db.session.query(ArtifactGroup).filter(
+                ArtifactGroup.publication_id != None).count()
+        except Exception as ex:
+            pytest.skip("database unavailable: %s" % (ex,))
+        if published < 3:
+            pytest.skip("need at least 3 published artifacts")
+    return app
+
+
+def count_statements(app, query_string):
+    from searcch_backend.api.app import db
+    from searcch_backend.api.resources import artifact_search
+
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    saved_cache = artifact_search.search_cache
+    artifact_search.search_cache = None
+    try:
+        response = app.test_client().get(
+            app.config["APPLICATION_ROOT"] + "/artifact/search?" + query_string)
+    finally:
+        artifact_search.search_cache = saved_cache
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    assert response.status_code == 200
+    return (len(statements), len(response.get_json()["artifacts"]))
+
+
+@pytest.mark.parametrize("mode", ["total=exact", "total=none", "cursor="])
+def test_search_statements_independent_of_page_size(app, mode):
+    (small, nsmall) = count_statements(app, "items_per_page=1&" + mode)
+    (large, nlarge) = count_statements(app, "items_per_page=50&" + mode)
+    assert nsmall == 1 and nlarge > 1
+    assert small == large